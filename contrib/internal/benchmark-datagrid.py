@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Benchmark loading and rendering datagrids.
+
+This builds a synthetic datagrid with the given number of rows and columns,
+and reports the time, queries, rows/sec, and peak memory for loading and
+rendering it in each pagination mode and sort order.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import os
+import sys
+
+scripts_dir = os.path.abspath(os.path.dirname(__file__))
+
+# Source root directory
+sys.path.insert(0, os.path.abspath(os.path.join(scripts_dir, '..', '..')))
+
+import django
+from django.core.management import call_command
+from django.db import connection
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000,
+                        help='The number of rows in the datagrid.')
+    parser.add_argument('--columns', type=int, default=10,
+                        help='The number of columns in the datagrid.')
+    parser.add_argument('--mode', action='append', dest='modes',
+                        help='A pagination mode to benchmark. This can be '
+                             'specified multiple times. Defaults to all '
+                             'modes.')
+    parser.add_argument('--sort', action='append', dest='sorts',
+                        help='A sort order to benchmark. This can be '
+                             'specified multiple times. Defaults to all '
+                             'sort orders.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='The number of times to run each benchmark.')
+    options = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+
+    if hasattr(django, 'setup'):
+        # Django >= 1.7
+        django.setup()
+
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    call_command('migrate', use_syncdb=True, verbosity=0, interactive=False)
+
+    from djblets.testing.benchmarks import (format_datagrid_benchmarks,
+                                            run_datagrid_benchmarks)
+
+    print('Benchmarking a datagrid with %d rows and %d columns...'
+          % (options.rows, options.columns))
+
+    results = run_datagrid_benchmarks(num_rows=options.rows,
+                                      num_columns=options.columns,
+                                      modes=options.modes,
+                                      sorts=options.sorts,
+                                      repeat=options.repeat)
+
+    print(format_datagrid_benchmarks(results))
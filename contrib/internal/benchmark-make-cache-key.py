@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""Benchmark djblets.cache.backend.make_cache_key.
+
+This compares the current implementation against the original one, which
+looked up the Site and filtered the key one character at a time on every
+call.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import hashlib
+import os
+import sys
+import timeit
+
+scripts_dir = os.path.abspath(os.path.dirname(__file__))
+
+# Source root directory
+sys.path.insert(0, os.path.abspath(os.path.join(scripts_dir, '..', '..')))
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+
+
+def legacy_make_cache_key(key):
+    """Create a cache key using the original implementation."""
+    from django.contrib.sites.models import Site
+
+    try:
+        site = Site.objects.get_current()
+        site_root = getattr(settings, 'SITE_ROOT', None)
+
+        if site_root:
+            key = '%s:%s:%s' % (site.domain, site_root, key)
+        else:
+            key = '%s:%s' % (site.domain, key)
+    except:
+        pass
+
+    key = ''.join(ch for ch in key if ch not in ' \t\n\r')
+
+    if len(key) > 240:
+        digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+        key = key[:240 - len(digest)] + digest
+
+    return key.encode('utf-8')
+
+
+def run_benchmark(name, func, key, number):
+    """Time a cache key function and print the results."""
+    elapsed = min(timeit.repeat(lambda: func(key), number=number, repeat=5))
+
+    print('  %-10s %8.3f usec/call' % (name, elapsed / number * 1e6))
+
+    return elapsed
+
+
+if __name__ == '__main__':
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+
+    if hasattr(django, 'setup'):
+        # Django >= 1.7
+        django.setup()
+
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    call_command('migrate', use_syncdb=True, verbosity=0, interactive=False)
+
+    from djblets.cache.backend import make_cache_key
+
+    number = 100000
+    keys = [
+        ('short', 'siteconfig-1'),
+        ('spaces', 'avatar url for user 1'),
+        ('long', 'diff-fragment-%s' % ('x' * 300)),
+    ]
+
+    for label, key in keys:
+        print('%s key (%d characters):' % (label, len(key)))
+        assert make_cache_key(key) == legacy_make_cache_key(key)
+
+        legacy = run_benchmark('legacy', legacy_make_cache_key, key, number)
+        current = run_benchmark('current', make_cache_key, key, number)
+
+        print('  %.1fx faster' % (legacy / current))
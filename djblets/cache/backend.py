@@ -7,18 +7,44 @@ iterators and large data normally too big for the cache).
 """
 
 from __future__ import unicode_literals
-from hashlib import md5
+from collections import OrderedDict, namedtuple
+from itertools import islice
+import hashlib
 import io
 import logging
-import zlib
+import math
+import random
+import re
+import threading
+import time
+import uuid
 
 from django.conf import settings
 from django.core.cache import cache
 from django.contrib.sites.models import Site
+from django.db import close_old_connections
+from django.db.models.signals import post_delete, post_save
 from django.utils import six
-from django.utils.six.moves import range, cPickle as pickle
+from django.utils.six.moves import range
 
+from djblets.cache.compression import get_cache_compression_codecs_registry
 from djblets.cache.errors import MissingChunkError
+from djblets.cache.serializers import get_cache_serializers_registry
+from djblets.cache.stats import (EVENT_HIT, EVENT_MISS, EVENT_RECOMPUTED,
+                                 record_cache_event)
+
+try:
+    # Django >= 1.8
+    from django.core.signals import setting_changed
+except ImportError:
+    # Django < 1.8
+    from django.test.signals import setting_changed
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # Python 2.7, without the futures backport.
+    ThreadPoolExecutor = None
 
 
 DEFAULT_EXPIRATION_TIME = 60 * 60 * 24 * 30  # 1 month
@@ -28,6 +54,69 @@ CACHE_CHUNK_SIZE = 2 ** 20 - 1024  # almost 1M (memcached's slab limit)
 # large data handling)
 MAX_KEY_SIZE = 240
 
+# The version of the format used for the main key of large data stored in the
+# cache. Older entries contain only the number of chunks.
+LARGE_DATA_FORMAT_VERSION = 2
+
+# The default serializer used for large data. Pickle protocol 0 is compatible
+# across both Python 2 and 3.
+DEFAULT_LARGE_DATA_SERIALIZER = 'pickle'
+
+# The default codec used to compress large data. This can be overridden with
+# the CACHE_COMPRESSION_CODEC setting.
+DEFAULT_COMPRESSION_CODEC = 'zlib'
+
+# The default maximum amount of cached chunk data to hold in memory at once
+# when streaming large data from the cache.
+DEFAULT_STREAM_MAX_MEMORY = 8 * CACHE_CHUNK_SIZE
+
+#: Stampede protection using a lock.
+#:
+#: Only one process at a time will recompute an expired value. Others will be
+#: served the stale value in the meantime, or will wait briefly for the new
+#: value if there's no stale value available.
+STAMPEDE_PROTECTION_LOCK = 'lock'
+
+#: Stampede protection using probabilistic early expiration.
+#:
+#: Each process reading a value may decide to recompute it before it
+#: expires, with the probability increasing as expiration nears and with the
+#: time it took to compute the value. This spreads recomputes out, so that
+#: few processes (usually just one) recompute at once.
+STAMPEDE_PROTECTION_EARLY_EXPIRATION = 'early-expiration'
+
+# The maximum amount of time a process may hold a recompute lock.
+STAMPEDE_LOCK_TIMEOUT = 30
+
+# The amount of time a process will wait for another process to compute a
+# value when using STAMPEDE_PROTECTION_LOCK.
+STAMPEDE_LOCK_WAIT_TIME = 5
+
+# The amount of time a value is kept in the cache past its expiration when
+# using STAMPEDE_PROTECTION_LOCK, so it can be served while recomputing.
+STAMPEDE_STALE_TIME = 5 * 60
+
+# The interval between checks for a value computed by another process.
+_STAMPEDE_POLL_INTERVAL = 0.05
+
+# The default digest used to shorten keys longer than MAX_KEY_SIZE. This can
+# be overridden with the CACHE_KEY_DIGEST setting.
+DEFAULT_CACHE_KEY_DIGEST = 'md5'
+
+# The maximum number of threads used by the default executor for refreshing
+# stale values in the background.
+DEFAULT_REFRESH_MAX_WORKERS = 4
+
+# The default maximum number of values kept in each process-local cache.
+DEFAULT_LOCAL_CACHE_MAX_ENTRIES = 1000
+
+# The default maximum amount of time a value is kept in a process-local cache.
+DEFAULT_LOCAL_CACHE_EXPIRATION = 60
+
+# The default minimum amount of time between checks for invalidation of a
+# process-local cache by other processes.
+DEFAULT_LOCAL_CACHE_SYNC_INTERVAL = 5
+
 
 logger = logging.getLogger(__name__)
 
@@ -36,98 +125,733 @@ _default_expiration = getattr(settings, 'CACHE_EXPIRATION_TIME',
                               DEFAULT_EXPIRATION_TIME)
 
 
-def _cache_fetch_large_data(cache, key, compress_large_data):
+# A value stored by cache_memoize along with information used for stampede
+# protection.
+_MemoizedEntry = namedtuple('_MemoizedEntry',
+                            ['value', 'expires_at', 'delta'])
+
+_default_refresh_executor = None
+
+# Characters that memcached doesn't allow in keys.
+_CACHE_KEY_STRIP_RE = re.compile(r'[ \t\n\r]')
+
+# The supported functions for digesting long cache keys.
+_CACHE_KEY_DIGEST_FUNCS = {
+    'md5': lambda data: hashlib.md5(data).hexdigest(),
+}
+
+if hasattr(hashlib, 'blake2b'):
+    _CACHE_KEY_DIGEST_FUNCS['blake2b'] = \
+        lambda data: hashlib.blake2b(data, digest_size=16).hexdigest()
+
+# The site-specific prefix for cache keys, and the function used to digest
+# long cache keys. These are computed when first needed.
+_cache_key_prefix = None
+_cache_key_digest_func = None
+
+# A marker for values missing from a process-local cache.
+_NO_VALUE = object()
+
+# The process-local caches enabled through enable_local_cache().
+_local_caches = ()
+_local_caches_lock = threading.Lock()
+
+
+class _ThreadExecutor(object):
+    """A minimal executor running each function in a new thread.
+
+    This is used to refresh stale values in the background when
+    :py:class:`concurrent.futures.ThreadPoolExecutor` isn't available.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        """Run a function in a new thread.
+
+        Args:
+            fn (callable):
+                The function to run.
+
+            *args (tuple):
+                Positional arguments for the function.
+
+            **kwargs (dict):
+                Keyword arguments for the function.
+        """
+        thread = threading.Thread(target=fn, args=args, kwargs=kwargs)
+        thread.daemon = True
+        thread.start()
+
+
+def get_default_refresh_executor():
+    """Return the default executor for refreshing stale cached values.
+
+    This is a thread pool with up to :py:data:`DEFAULT_REFRESH_MAX_WORKERS`
+    threads, created the first time it's needed.
+
+    Returns:
+        object:
+        An executor providing a ``submit(fn, *args, **kwargs)`` method.
+    """
+    global _default_refresh_executor
+
+    if _default_refresh_executor is None:
+        if ThreadPoolExecutor is not None:
+            _default_refresh_executor = ThreadPoolExecutor(
+                max_workers=DEFAULT_REFRESH_MAX_WORKERS)
+        else:
+            _default_refresh_executor = _ThreadExecutor()
+
+    return _default_refresh_executor
+
+
+class LocalCache(object):
+    """A bounded, process-local cache in front of the configured cache.
+
+    This keeps recently-used values from :py:func:`cache_memoize` in memory,
+    avoiding a round trip to the cache server for small values read many
+    times over. Local caches are enabled for keys starting with a given
+    prefix through :py:func:`enable_local_cache`.
+
+    Values are evicted once the cache exceeds its maximum number of entries
+    (least recently used first), or once they're older than the local
+    expiration time, which bounds how stale a value may be compared to the
+    configured cache.
+
+    Values can be invalidated across all processes by calling
+    :py:meth:`invalidate`, which bumps a generation number shared through a
+    :py:class:`~djblets.cache.synchronizer.GenerationSynchronizer`. Each
+    process checks the generation at most once every ``sync_interval``
+    seconds.
+
+    Values are shared by all callers in the process, and must not be
+    modified. Only immutable values should be stored in a local cache.
+
+    Attributes:
+        key_prefix (unicode):
+            The prefix of the keys stored in this cache.
+
+        max_entries (int):
+            The maximum number of values to keep in memory.
+
+        expiration (int):
+            The maximum amount of time, in seconds, to keep a value in memory.
+
+        sync_interval (int):
+            The minimum amount of time, in seconds, between checks for
+            invalidation by other processes.
+    """
+
+    def __init__(self, key_prefix,
+                 max_entries=DEFAULT_LOCAL_CACHE_MAX_ENTRIES,
+                 expiration=DEFAULT_LOCAL_CACHE_EXPIRATION,
+                 sync_interval=DEFAULT_LOCAL_CACHE_SYNC_INTERVAL):
+        """Initialize the cache.
+
+        Args:
+            key_prefix (unicode):
+                The prefix of the keys stored in this cache.
+
+            max_entries (int, optional):
+                The maximum number of values to keep in memory.
+
+            expiration (int, optional):
+                The maximum amount of time, in seconds, to keep a value in
+                memory.
+
+            sync_interval (int, optional):
+                The minimum amount of time, in seconds, between checks for
+                invalidation by other processes.
+        """
+        self.key_prefix = key_prefix
+        self.max_entries = max_entries
+        self.expiration = expiration
+        self.sync_interval = sync_interval
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._synchronizer = None
+        self._next_sync_check = 0
+
+    def get(self, cache_key, default=None):
+        """Return a value from the cache.
+
+        Args:
+            cache_key (unicode):
+                The cache key for the value, as returned by
+                :py:func:`make_cache_key`.
+
+            default (object, optional):
+                The value to return if the key isn't in the cache.
+
+        Returns:
+            object:
+            The cached value, or ``default``.
+        """
+        self._check_sync()
+
+        with self._lock:
+            try:
+                value, expires_at = self._entries.pop(cache_key)
+            except KeyError:
+                return default
+
+            if time.time() >= expires_at:
+                return default
+
+            # Re-insert the value to mark it as the most recently used.
+            self._entries[cache_key] = (value, expires_at)
+
+        return value
+
+    def set(self, cache_key, value):
+        """Store a value in the cache.
+
+        Args:
+            cache_key (unicode):
+                The cache key for the value, as returned by
+                :py:func:`make_cache_key`.
+
+            value (object):
+                The value to store.
+        """
+        expires_at = time.time() + self.expiration
+
+        with self._lock:
+            self._entries.pop(cache_key, None)
+            self._entries[cache_key] = (value, expires_at)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, cache_key):
+        """Remove a value from the cache in this process.
+
+        Args:
+            cache_key (unicode):
+                The cache key for the value, as returned by
+                :py:func:`make_cache_key`.
+        """
+        with self._lock:
+            self._entries.pop(cache_key, None)
+
+    def clear(self):
+        """Remove all values from the cache in this process."""
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate(self):
+        """Invalidate all values in the cache across all processes.
+
+        This should be called after updating the values stored in the
+        configured cache for any keys with this cache's prefix. Other
+        processes will notice within ``sync_interval`` seconds.
+        """
+        self._get_synchronizer().mark_updated()
+        self.clear()
+
+    def _check_sync(self):
+        """Clear the cache if it was invalidated by another process."""
+        now = time.time()
+
+        if now < self._next_sync_check:
+            return
+
+        self._next_sync_check = now + self.sync_interval
+        synchronizer = self._get_synchronizer()
+
+        if synchronizer.is_expired():
+            synchronizer.refresh()
+            self.clear()
+
+    def _get_synchronizer(self):
+        """Return the synchronizer used to invalidate the cache.
+
+        Returns:
+            djblets.cache.synchronizer.GenerationSynchronizer:
+            The synchronizer.
+        """
+        if self._synchronizer is None:
+            # This is imported here to avoid a circular import.
+            from djblets.cache.synchronizer import GenerationSynchronizer
+
+            self._synchronizer = GenerationSynchronizer(
+                'local-cache-sync:%s' % self.key_prefix)
+
+        return self._synchronizer
+
+
+def enable_local_cache(key_prefix, **kwargs):
+    """Enable a process-local cache for keys starting with a prefix.
+
+    Values memoized through :py:func:`cache_memoize` with keys starting with
+    ``key_prefix`` will be kept in memory in each process, in front of the
+    configured cache. This does not apply to values stored with
+    ``large_data=True``.
+
+    See :py:class:`LocalCache` for details.
+
+    Args:
+        key_prefix (unicode):
+            The prefix of the keys to cache locally.
+
+        **kwargs (dict):
+            Additional keyword arguments for :py:class:`LocalCache`.
+
+    Returns:
+        LocalCache:
+        The local cache for the prefix.
+
+    Raises:
+        KeyError:
+            A local cache was already enabled for this prefix.
+    """
+    global _local_caches
+
+    with _local_caches_lock:
+        for local_cache in _local_caches:
+            if local_cache.key_prefix == key_prefix:
+                raise KeyError('A local cache is already enabled for the '
+                               'key prefix "%s".' % key_prefix)
+
+        local_cache = LocalCache(key_prefix, **kwargs)
+
+        # This is replaced rather than modified, so that lookups don't need
+        # to acquire the lock.
+        _local_caches = _local_caches + (local_cache,)
+
+    return local_cache
+
+
+def disable_local_cache(key_prefix):
+    """Disable the process-local cache for keys starting with a prefix.
+
+    Args:
+        key_prefix (unicode):
+            The prefix passed to :py:func:`enable_local_cache`.
+    """
+    global _local_caches
+
+    with _local_caches_lock:
+        _local_caches = tuple(
+            local_cache
+            for local_cache in _local_caches
+            if local_cache.key_prefix != key_prefix
+        )
+
+
+def _get_local_cache(key):
+    """Return the process-local cache for a key, if enabled.
+
+    Args:
+        key (unicode):
+            The base key passed to :py:func:`cache_memoize`.
+
+    Returns:
+        LocalCache:
+        The local cache for the key, or ``None`` if there isn't one.
+    """
+    for local_cache in _local_caches:
+        if key.startswith(local_cache.key_prefix):
+            return local_cache
+
+    return None
+
+
+class _LargeDataStreamReader(io.RawIOBase):
+    """A read-only file-like object over a stream of blocks of data.
+
+    This allows serializers to load items directly from a generator of
+    decompressed chunk data, pulling in new data only as it's needed, without
+    first combining all the data into one buffer.
+    """
+
+    def __init__(self, blocks):
+        """Initialize the reader.
+
+        Args:
+            blocks (generator):
+                A generator yielding blocks of binary data.
+        """
+        super(_LargeDataStreamReader, self).__init__()
+
+        self._blocks = blocks
+        self._block = b''
+        self._block_offset = 0
+
+    def readable(self):
+        """Return whether the stream can be read from.
+
+        Returns:
+            bool:
+            This always returns ``True``.
+        """
+        return True
+
+    def readinto(self, b):
+        """Read data from the stream into a buffer.
+
+        Args:
+            b (bytearray):
+                The buffer to read into.
+
+        Returns:
+            int:
+            The number of bytes read. This will be 0 once the stream has been
+            exhausted.
+        """
+        while self._block_offset >= len(self._block):
+            try:
+                self._block = next(self._blocks)
+            except StopIteration:
+                return 0
+
+            self._block_offset = 0
+
+        data = self._block[self._block_offset:
+                           self._block_offset + len(b)]
+        data_len = len(data)
+        b[:data_len] = data
+        self._block_offset += data_len
+
+        return data_len
+
+
+def _get_large_data_serializer(serializer):
+    """Return a serializer for large data.
+
+    The serializer may be provided as an ID registered in the
+    :py:class:`~djblets.cache.serializers.CacheSerializersRegistry`, or as a
+    serializer instance. If ``None``, the default serializer is returned.
+    """
+    if serializer is None:
+        serializer = DEFAULT_LARGE_DATA_SERIALIZER
+
+    if isinstance(serializer, six.string_types):
+        serializer = \
+            get_cache_serializers_registry().get_serializer(serializer)
+
+    return serializer
+
+
+def _get_compression_codec(codec):
+    """Return a compression codec for large data.
+
+    The codec may be provided as an ID registered in the
+    :py:class:`~djblets.cache.compression.CacheCompressionCodecsRegistry`, or
+    as a codec instance. If ``None``, the codec specified in the
+    ``CACHE_COMPRESSION_CODEC`` setting is returned, defaulting to zlib.
+    """
+    if codec is None:
+        codec = getattr(settings, 'CACHE_COMPRESSION_CODEC',
+                        DEFAULT_COMPRESSION_CODEC)
+
+    if isinstance(codec, six.string_types):
+        codec = get_cache_compression_codecs_registry().get_codec(codec)
+
+    return codec
+
+
+def _cache_get_large_data_info(cache, key, compress_large_data, codec,
+                               serializer):
+    """Return information on large data stored in the cache.
+
+    The main cache key will be read and normalized into a dictionary
+    containing the format version, the number of chunks, the generation of
+    the chunks, the compression codec (or ``None``), and the serializer used
+    to store the items.
+
+    Entries stored by older versions only contain the number of chunks. These
+    have no generation, are always pickled, and are assumed to be
+    zlib-compressed based on ``compress_large_data``.
+
+    The returned codec and serializer will be ``codec`` and ``serializer`` if
+    their IDs match those stored in the cache. Otherwise, they're looked up in
+    their registries.
+
+    If the main cache key is not in the cache, ``None`` will be returned.
+    """
+    value = cache.get(make_cache_key(key))
+
+    if value is None:
+        return None
+
+    return _parse_large_data_info(value, compress_large_data, codec,
+                                  serializer)
+
+
+def _parse_large_data_info(value, compress_large_data, codec, serializer):
+    """Parse the value of the main cache key for large data.
+
+    See _cache_get_large_data_info for details.
+    """
+    if isinstance(value, dict):
+        if value.get('version') != LARGE_DATA_FORMAT_VERSION:
+            raise ValueError('Unsupported large data format version %r'
+                             % value.get('version'))
+
+        info = value.copy()
+    else:
+        info = {
+            'version': 1,
+            'chunk_count': int(value),
+            'codec': 'zlib' if compress_large_data else None,
+            'serializer': DEFAULT_LARGE_DATA_SERIALIZER,
+            'generation': None,
+        }
+
+    if info['codec'] is not None:
+        if codec is not None and info['codec'] == codec.codec_id:
+            info['codec'] = codec
+        else:
+            info['codec'] = _get_compression_codec(info['codec'])
+
+    if info['serializer'] == serializer.serializer_id:
+        info['serializer'] = serializer
+    else:
+        info['serializer'] = _get_large_data_serializer(info['serializer'])
+
+    return info
+
+
+def _make_chunk_cache_key(key, generation, i):
+    """Return the cache key for a chunk of large data.
+
+    Chunks are stored under keys specific to the generation of the data
+    they're part of, so that a new set of chunks never overwrites chunks
+    still being read by other processes. Entries stored by older versions
+    don't have a generation.
+    """
+    if generation is None:
+        return make_cache_key('%s-%d' % (key, i))
+    else:
+        return make_cache_key('%s-%s-%d' % (key, generation, i))
+
+
+def _cache_fetch_large_data(cache, key, info):
     """Fetch large data from the cache.
 
-    The main cache key indicating the number of chunks will be read, followed
-    by each of the chunks. If any chunks are missing, a MissingChunkError
-    will be immediately returned.
+    Each of the chunks listed in the main cache key's ``info`` will be read.
+    If any chunks are missing, a MissingChunkError will be immediately
+    returned.
 
     The data is then combined and optionally uncompressed, and returned to
     the caller. The caller should iterate through the results using
     _cache_iter_large_data.
     """
-    chunk_count = int(cache.get(make_cache_key(key)))
-
-    chunk_keys = [
-        make_cache_key('%s-%d' % (key, i))
-        for i in range(chunk_count)
-    ]
-    chunks = cache.get_many(chunk_keys)
+    chunk_keys = _get_large_data_chunk_keys(key, info)
 
     # Check that we have all the keys we expect, before we begin generating
     # values. We don't want to waste effort loading anything, and we want to
     # pass an error about missing keys to the caller up-front before we
     # generate anything.
-    if len(chunks) != chunk_count:
-        missing_keys = sorted(set(chunk_keys) - set(six.iterkeys(chunks)))
-        logger.debug('Cache miss for key(s): %s.' % ', '.join(missing_keys))
-
-        raise MissingChunkError
+    chunks = _cache_fetch_large_data_chunks(cache, chunk_keys)
 
     # Process all the chunks and decompress them at once, instead of streaming
     # the results. It's faster for any reasonably-sized data in cache. We'll
-    # stream depickles instead.
+    # stream deserialization instead. Callers working with very large data
+    # can use _cache_stream_large_data instead.
+    return _join_large_data_chunks(chunks, chunk_keys, info)
+
+
+def _get_large_data_chunk_keys(key, info):
+    """Return the cache keys for all chunks of large data."""
+    generation = info['generation']
+
+    return [
+        _make_chunk_cache_key(key, generation, i)
+        for i in range(info['chunk_count'])
+    ]
+
+
+def _join_large_data_chunks(chunks, chunk_keys, info):
+    """Combine fetched chunks of large data, and decompress the result.
+
+    The size of the stored data and the time spent decompressing it will be
+    set in ``info``, for recording statistics.
+    """
     data = b''.join(
         chunks[chunk_key][0]
         for chunk_key in chunk_keys
     )
+    info['data_size'] = len(data)
 
-    if compress_large_data:
-        data = zlib.decompress(data)
+    if info['codec'] is not None:
+        start_time = time.time()
+        data = info['codec'].decompress(data)
+        info['decompress_time'] = time.time() - start_time
 
     return data
 
 
-def _cache_iter_large_data(data, key):
-    """Iterate through large data that was fetched from the cache.
+def _cache_iter_large_data_chunks(cache, key, generation, chunk_count,
+                                  chunks, max_memory):
+    """Iterate through the chunks of large data in the cache.
+
+    Chunks are fetched from the cache in batches, with each batch containing
+    as many chunks as will fit in ``max_memory``. The data in each chunk will
+    be yielded to the caller before the next batch is fetched. If any chunks
+    in a batch are missing, a MissingChunkError will be raised.
+
+    The first batch of chunks may be provided up-front through ``chunks``,
+    which allows the caller to check for missing chunks before any data is
+    processed.
+    """
+    batch_size = max(1, max_memory // CACHE_CHUNK_SIZE)
+
+    for batch_start in range(0, chunk_count, batch_size):
+        chunk_keys = [
+            _make_chunk_cache_key(key, generation, i)
+            for i in range(batch_start,
+                           min(batch_start + batch_size, chunk_count))
+        ]
+
+        if chunks is None:
+            chunks = _cache_fetch_large_data_chunks(cache, chunk_keys)
+
+        for chunk_key in chunk_keys:
+            # Release each chunk as soon as it's processed, so that we only
+            # hold onto what we haven't yet handed off.
+            yield chunks.pop(chunk_key)[0]
+
+        chunks = None
+
+
+def _cache_fetch_large_data_chunks(cache, chunk_keys):
+    """Fetch a batch of chunks of large data from the cache.
+
+    If any chunks are missing, a MissingChunkError will be raised.
+    """
+    chunks = cache.get_many(chunk_keys)
 
-    This will unpickle the large data previously fetched through
-    _cache_fetch_large_data, and yield each object to the caller.
+    if len(chunks) != len(chunk_keys):
+        missing_keys = sorted(set(chunk_keys) - set(six.iterkeys(chunks)))
+        logger.debug('Cache miss for key(s): %s.' % ', '.join(missing_keys))
+
+        raise MissingChunkError
+
+    return chunks
+
+
+def _cache_stream_large_data(cache, key, info, max_memory):
+    """Stream large data from the cache.
+
+    The first batch of the chunks listed in the main cache key's ``info`` will
+    be read. If any of those chunks are missing, a MissingChunkError will be
+    immediately raised.
+
+    Unlike _cache_fetch_large_data, the data is never combined into a single
+    buffer. Instead, chunks are fetched in batches bounded by ``max_memory``,
+    decompressed incrementally, and deserialized as soon as enough data is
+    available. The caller should iterate through the results using
+    _cache_iter_large_data.
+
+    Any chunks missing from later batches will cause a MissingChunkError to
+    be raised during iteration.
     """
-    fp = io.BytesIO(data)
+    chunk_count = info['chunk_count']
+    generation = info['generation']
+    batch_size = max(1, max_memory // CACHE_CHUNK_SIZE)
+
+    first_chunks = _cache_fetch_large_data_chunks(cache, [
+        _make_chunk_cache_key(key, generation, i)
+        for i in range(min(batch_size, chunk_count))
+    ])
+
+    blocks = _cache_iter_large_data_chunks(cache=cache,
+                                           key=key,
+                                           generation=generation,
+                                           chunk_count=chunk_count,
+                                           chunks=first_chunks,
+                                           max_memory=max_memory)
+
+    if info['codec'] is not None:
+        # Decompress in bounded pieces, so that highly-compressed data
+        # doesn't balloon in memory.
+        blocks = info['codec'].iter_decompress(blocks, CACHE_CHUNK_SIZE)
 
+    return io.BufferedReader(_LargeDataStreamReader(blocks))
+
+
+def _cache_iter_large_data(fp, key, serializer):
+    """Iterate through large data that was fetched from the cache.
+
+    This will deserialize the large data previously fetched through
+    _cache_fetch_large_data or _cache_stream_large_data, and yield each object
+    to the caller.
+    """
     try:
-        # Unpickle all the items we're expecting from the cached data.
+        # Deserialize all the items we're expecting from the cached data.
         #
         # There will only be one item in the case of old-style cache data.
         while True:
             try:
-                yield pickle.load(fp)
+                yield serializer.load(fp)
             except EOFError:
                 return
     except Exception as e:
-        logger.warning('Unpickle error for cache key "%s": %s.' % (key, e))
+        logger.warning('Deserialization error for cache key "%s": %s.'
+                       % (key, e))
         raise
 
 
-def _cache_compress_pickled_data(items):
+def _cache_compress_serialized_data(items, codec, level, stats):
     """Compress lists of items for storage in the cache.
 
     This works with generators, and will take each item in the list or
-    generator of items, zlib-compress the data, and store it in a buffer.The
-    item and a blob of compressed data will be yielded to the caller.
+    generator of items, compress the data using the codec, and store it in a
+    buffer. The item and a blob of compressed data will be yielded to the
+    caller.
+
+    The time spent compressing will be added to ``stats['compress_time']``.
     """
-    compressor = zlib.compressobj()
+    compressor = codec.compressobj(level)
+    compress_time = 0
 
     for data, has_item, item in items:
-        yield compressor.compress(data), has_item, item
+        start_time = time.time()
+        data = compressor.compress(data)
+        compress_time += time.time() - start_time
+
+        yield data, has_item, item
 
+    start_time = time.time()
     remaining = compressor.flush()
+    stats['compress_time'] = compress_time + time.time() - start_time
 
     if remaining:
         yield remaining, False, None
 
 
-def _cache_store_chunks(items, key, expiration):
+def _cache_store_chunks(items, key, expiration, info, expires_in=None,
+                        stats=None):
     """Store a list of items as chunks in the cache.
 
     The list of items will be combined into chunks and stored in the
     cache as efficiently as possible. Each item in the list will be
     yielded to the caller as it's fetched from the list or generator.
+
+    Chunks are stored under keys for a new generation of the data. Once all
+    chunks are stored, the main cache key will be set to ``info``, along with
+    the number of chunks and the generation. Until then, readers will
+    continue to see the previous generation's complete set of chunks.
+
+    The previous generation's chunks are kept until the next time the data is
+    stored, so that readers still working through them aren't interrupted.
+    The generation before that is deleted once the main cache key is set, so
+    at most two sets of chunks are stored for a key at a time.
+
+    If ``expires_in`` is provided, the time at which the data should be
+    considered expired and the time taken to compute it will also be stored,
+    for use in stampede protection.
+
+    If ``stats`` is provided, the number of chunks and the size of the stored
+    data will be set in it.
     """
+    start_time = time.time()
+    generation = uuid.uuid4().hex[:12]
     chunks_data = io.BytesIO()
     chunks_data_len = 0
+    data_size = 0
     read_start = 0
     item_count = 0
     i = 0
@@ -139,6 +863,7 @@ def _cache_store_chunks(items, key, expiration):
 
         chunks_data.write(data)
         chunks_data_len += len(data)
+        data_size += len(data)
 
         if chunks_data_len > CACHE_CHUNK_SIZE:
             # We have enough data to fill a chunk now. Start processing
@@ -155,7 +880,8 @@ def _cache_store_chunks(items, key, expiration):
 
                 # Note that we wrap the chunk in a list so that the cache
                 # backend won't try to perform any conversion on the string.
-                cached_data[make_cache_key('%s-%d' % (key, i))] = [chunk]
+                cached_data[_make_chunk_cache_key(key, generation, i)] = \
+                    [chunk]
                 i += 1
 
             # Store the keys in the cache in a single request.
@@ -171,39 +897,222 @@ def _cache_store_chunks(items, key, expiration):
 
         chunks_data.seek(read_start)
         chunk = chunks_data.read()
-        cache.set(make_cache_key('%s-%d' % (key, i)), [chunk], expiration)
+        cache.set(_make_chunk_cache_key(key, generation, i), [chunk],
+                  expiration)
         i += 1
 
-    cache.set(make_cache_key(key), '%d' % i, expiration)
+    main_cache_key = make_cache_key(key)
+    old_info = cache.get(main_cache_key)
+
+    info = dict(info,
+                chunk_count=i,
+                generation=generation,
+                previous_chunks=_get_stored_chunks_info(old_info))
+
+    if expires_in is not None:
+        now = time.time()
+        info.update({
+            'expires_at': now + expires_in,
+            'delta': now - start_time,
+        })
+
+    cache.set(main_cache_key, info, expiration)
+
+    if isinstance(old_info, dict) and old_info.get('previous_chunks'):
+        # Readers have had a full generation to finish with these chunks.
+        _cache_delete_chunks(key, old_info['previous_chunks'])
+
+    if stats is not None:
+        stats.update(chunk_count=i,
+                     data_size=data_size)
+
+
+def _get_stored_chunks_info(value):
+    """Return the generation and chunk count from a main cache key's value.
+
+    This is stored along with the next generation of the data, so that its
+    chunks can later be deleted. Entries stored by older versions only
+    contain the number of chunks, and have no generation.
+
+    If the value doesn't describe any chunks, ``None`` will be returned.
+    """
+    if isinstance(value, dict):
+        generation = value.get('generation')
+        chunk_count = value.get('chunk_count')
+    else:
+        generation = None
+
+        try:
+            chunk_count = int(value)
+        except (TypeError, ValueError):
+            chunk_count = None
+
+    if not chunk_count:
+        return None
+
+    return {
+        'generation': generation,
+        'chunk_count': chunk_count,
+    }
+
 
+def _cache_delete_chunks(key, chunks_info):
+    """Delete a generation of chunks for large data from the cache.
 
-def _cache_store_items(cache, key, items, expiration, compress_large_data):
+    ``chunks_info`` is the generation and chunk count returned by
+    _get_stored_chunks_info. Failures are logged and otherwise ignored, since
+    the chunks will still expire on their own.
+    """
+    try:
+        cache.delete_many(_get_large_data_chunk_keys(key, chunks_info))
+    except Exception as e:
+        logger.warning('Failed to delete old chunks from cache for key '
+                       '%s: %s.' % (key, e))
+
+
+def _cache_store_items(cache, key, items, expiration, codec,
+                       compression_level, serializer, expires_in=None):
     """Store items in the cache.
 
-    The items will be individually pickled and combined into a binary blob,
-    which can then optionally be compressed. The resulting data is then
-    cached over one or more keys, each representing a chunk about 1MB in size.
+    The items will be individually serialized and combined into a binary
+    blob, which can then optionally be compressed using ``codec``. The
+    resulting data is then cached over one or more keys, each representing a
+    chunk about 1MB in size.
+
+    A main cache key will be set that contains information on the other keys
+    and on how the data was stored.
 
-    A main cache key will be set that contains information on the other keys.
+    Once all items have been stored, a recompute will be recorded for the
+    key's statistics.
     """
-    # Note that we want to use pickle protocol 0 in order to be compatible
-    # across both Python 2 and 3. On Python 2, 0 is the default.
+    start_time = time.time()
+    stats = {}
     results = (
-        (pickle.dumps(item, protocol=0), True, item)
+        (serializer.dumps(item), True, item)
         for item in items
     )
 
-    if compress_large_data:
-        results = _cache_compress_pickled_data(results)
+    if codec is not None:
+        results = _cache_compress_serialized_data(results, codec,
+                                                  compression_level, stats)
 
-    for item in _cache_store_chunks(results, key, expiration):
+    info = {
+        'version': LARGE_DATA_FORMAT_VERSION,
+        'codec': codec.codec_id if codec is not None else None,
+        'serializer': serializer.serializer_id,
+    }
+
+    for item in _cache_store_chunks(results, key, expiration, info,
+                                    expires_in, stats):
         yield item
 
+    record_cache_event(EVENT_RECOMPUTED, key,
+                       recompute_time=time.time() - start_time,
+                       **stats)
+
+
+def _is_cache_entry_expired(expires_at, delta, stampede_protection):
+    """Return whether a cached entry should be recomputed.
+
+    With :py:data:`STAMPEDE_PROTECTION_EARLY_EXPIRATION`, this may return
+    ``True`` ahead of the expiration time, based on a random roll weighted by
+    the time it took to compute the value (the "XFetch" algorithm).
+    """
+    if expires_at is None:
+        return False
+
+    now = time.time()
+
+    if stampede_protection == STAMPEDE_PROTECTION_EARLY_EXPIRATION:
+        # Note that 1.0 - random.random() is in the range (0.0, 1.0], which
+        # keeps the log finite.
+        now -= delta * math.log(1.0 - random.random())
+
+    return now >= expires_at
+
+
+def _get_stampede_cache_expiration(expiration, stampede_protection):
+    """Return the cache expiration for an entry with stampede protection.
+
+    Entries using :py:data:`STAMPEDE_PROTECTION_LOCK` are kept around past
+    their expiration time, so they can be served while being recomputed.
+    """
+    if (stampede_protection == STAMPEDE_PROTECTION_LOCK and
+        expiration is not None):
+        return expiration + STAMPEDE_STALE_TIME
+    else:
+        return expiration
+
+
+def _acquire_recompute_lock(key):
+    """Attempt to acquire the lock for recomputing a cached value.
+
+    This uses ``cache.add``, which will only succeed for one process at a
+    time. The lock will expire on its own if it's never released.
+    """
+    return cache.add(make_cache_key('%s-recompute-lock' % key), True,
+                     STAMPEDE_LOCK_TIMEOUT)
+
+
+def _release_recompute_lock(key):
+    """Release the lock for recomputing a cached value."""
+    cache.delete(make_cache_key('%s-recompute-lock' % key))
+
+
+def _wait_for_cache_value(cache_key):
+    """Wait for another process to store a value in the cache.
+
+    This will poll the cache for up to :py:data:`STAMPEDE_LOCK_WAIT_TIME`
+    seconds, returning the value once it's been stored, or ``None`` if it
+    never was.
+    """
+    deadline = time.time() + STAMPEDE_LOCK_WAIT_TIME
+
+    while time.time() < deadline:
+        time.sleep(_STAMPEDE_POLL_INTERVAL)
+        value = cache.get(cache_key)
+
+        if value is not None:
+            return value
+
+    return None
+
+
+def _release_recompute_lock_when_done(key, items):
+    """Yield items, releasing the recompute lock once finished.
+
+    The lock will be released once all items have been yielded, or if the
+    generator is closed early.
+    """
+    try:
+        for item in items:
+            yield item
+    finally:
+        _release_recompute_lock(key)
+
+
+def _cache_get_items(items_or_callable):
+    """Return the items to store from a list of items or a callable.
+
+    If a callable is provided, it will be called in order to generate the
+    items.
+    """
+    if callable(items_or_callable):
+        return items_or_callable()
+    else:
+        return items_or_callable
+
 
 def cache_memoize_iter(key, items_or_callable,
                        expiration=_default_expiration,
                        force_overwrite=False,
-                       compress_large_data=True):
+                       compress_large_data=True,
+                       stream_large_data=False,
+                       stream_max_memory=None,
+                       serializer=None,
+                       compression_codec=None,
+                       compression_level=None,
+                       stampede_protection=None):
     """Memoize an iterable list of items inside the configured cache.
 
     If the provided list of items is a function, the function must return a
@@ -213,8 +1122,16 @@ def cache_memoize_iter(key, items_or_callable,
     item will be immediately yielded to the caller as they're retrieved, and
     the cached entries will be built up as the items are processed.
 
-    The data is assumed to be big enough that it must be pickled,
-    optionally compressed, and stored as chunks in the cache.
+    The data is assumed to be big enough that it must be serialized,
+    optionally compressed, and stored as chunks in the cache. The main cache
+    key records the format of the stored data, so that it can be read back
+    regardless of the serializer used to store it.
+
+    Each time the data is stored, its chunks are written under keys for a new
+    generation, and the main cache key is updated to point to that generation
+    only once all chunks are written. Readers therefore always see a complete
+    and consistent set of chunks, even while the data is being rewritten
+    concurrently.
 
     The result from this function is always a generator. Note that it's
     important that the generator be allowed to continue until completion, or
@@ -229,34 +1146,192 @@ def cache_memoize_iter(key, items_or_callable,
             regardless of whether it exists in the cache already.
 
         compress_large_data (bool):
-            If ``True``, the data will be zlib-compressed.
+            If ``True``, the data will be compressed using
+            ``compression_codec``.
+
+        stream_large_data (bool, optional):
+            If ``True``, cached data will be streamed from the cache instead
+            of being loaded into memory all at once. Chunks will be fetched in
+            batches, decompressed incrementally, and each item will be yielded
+            as soon as it's been loaded. This reduces peak memory usage and
+            the time until the first item is available for large data.
+
+            If chunks go missing partway through streaming, the items will
+            be recomputed and stored, and iteration will resume where it left
+            off.
+
+        stream_max_memory (int, optional):
+            The maximum number of bytes of cached chunk data to hold in memory
+            at once when streaming. This defaults to the
+            ``CACHE_STREAM_MAX_MEMORY`` setting, or 8MB.
+
+        serializer (unicode or djblets.cache.serializers.BaseCacheSerializer,
+                    optional):
+            The serializer used to store the items, as either a registered
+            serializer ID or a serializer instance. Built-in serializers
+            include ``pickle`` (protocol 0, the default), ``pickle-2``,
+            ``pickle-4``, ``pickle-5`` (with out-of-band buffers),
+            ``marshal``, ``json``, and ``msgpack``, depending on the version
+            of Python and installed packages.
+
+            This only affects how new data is stored. Cached data is always
+            read using the serializer it was stored with.
+
+        compression_codec (unicode or
+                           djblets.cache.compression.
+                           BaseCacheCompressionCodec, optional):
+            The codec used to compress new data, as either a registered codec
+            ID or a codec instance. Built-in codecs include ``zlib``, and
+            ``lzma``, ``lz4``, and ``zstd`` depending on the version of Python
+            and installed packages. This defaults to the
+            ``CACHE_COMPRESSION_CODEC`` setting, or ``zlib``.
+
+            Cached data is always decompressed using the codec it was stored
+            with.
+
+        compression_level (int, optional):
+            The compression level to use for new data. The meaning of this
+            depends on the codec. This defaults to the
+            ``CACHE_COMPRESSION_LEVEL`` setting, or the codec's default level.
+
+        stampede_protection (unicode, optional):
+            The type of protection against many processes recomputing the
+            items at the same time once they expire. This can be
+            :py:data:`STAMPEDE_PROTECTION_LOCK` or
+            :py:data:`STAMPEDE_PROTECTION_EARLY_EXPIRATION`. By default, no
+            protection is used.
+
+            This relies only on ``cache.add``, and is safe to use with any
+            cache backend.
 
     Yields:
         The list of items from the cache or from ``items_or_callable`` if
         uncached.
     """
     results = None
+    serializer = _get_large_data_serializer(serializer)
+
+    if compress_large_data:
+        codec = _get_compression_codec(compression_codec)
+
+        if compression_level is None:
+            compression_level = getattr(settings, 'CACHE_COMPRESSION_LEVEL',
+                                        None)
+    else:
+        codec = None
+
+    if stream_large_data and stream_max_memory is None:
+        stream_max_memory = getattr(settings, 'CACHE_STREAM_MAX_MEMORY',
+                                    DEFAULT_STREAM_MAX_MEMORY)
 
-    if not force_overwrite and make_cache_key(key) in cache:
+    info = None
+    lock_acquired = False
+    expires_in = None
+    cache_expiration = expiration
+
+    if not force_overwrite:
         try:
-            results = _cache_iter_large_data(
-                _cache_fetch_large_data(cache, key, compress_large_data),
-                key)
+            info = _cache_get_large_data_info(cache, key, compress_large_data,
+                                              codec, serializer)
+        except Exception as e:
+            logger.warning('Failed to fetch large data from cache for '
+                           'key %s: %s.' % (key, e))
+
+    if stampede_protection is not None:
+        expires_in = expiration
+        cache_expiration = _get_stampede_cache_expiration(
+            expiration, stampede_protection)
+
+        if force_overwrite:
+            # We'll always be recomputing, so there's nothing to protect.
+            pass
+        elif info is None:
+            if stampede_protection == STAMPEDE_PROTECTION_LOCK:
+                lock_acquired = _acquire_recompute_lock(key)
+
+                if (not lock_acquired and
+                    _wait_for_cache_value(make_cache_key(key)) is not None):
+                    # Another process has computed the items for us.
+                    try:
+                        info = _cache_get_large_data_info(
+                            cache, key, compress_large_data, codec,
+                            serializer)
+                    except Exception as e:
+                        logger.warning('Failed to fetch large data from '
+                                       'cache for key %s: %s.' % (key, e))
+        elif _is_cache_entry_expired(info.get('expires_at'),
+                                     info.get('delta', 0),
+                                     stampede_protection):
+            if stampede_protection == STAMPEDE_PROTECTION_EARLY_EXPIRATION:
+                info = None
+            elif _acquire_recompute_lock(key):
+                lock_acquired = True
+                info = None
+            else:
+                # Another process is recomputing the items. We'll serve the
+                # stale items in the meantime.
+                pass
+
+    if info is not None:
+        try:
+            if stream_large_data:
+                fp = _cache_stream_large_data(cache, key, info,
+                                              stream_max_memory)
+            else:
+                fp = io.BytesIO(_cache_fetch_large_data(cache, key, info))
+
+            results = _cache_iter_large_data(fp, key, info['serializer'])
         except Exception as e:
             logger.warning('Failed to fetch large data from cache for '
                            'key %s: %s.' % (key, e))
             results = None
-    else:
+        else:
+            record_cache_event(EVENT_HIT, key,
+                               source='cache',
+                               chunk_count=info['chunk_count'],
+                               data_size=info.get('data_size', 0),
+                               decompress_time=info.get('decompress_time',
+                                                        0))
+    elif not force_overwrite:
         logger.debug('Cache miss for key %s.' % key)
 
-    if results is None:
-        if callable(items_or_callable):
-            items = items_or_callable()
-        else:
-            items = items_or_callable
+    if results is None and not force_overwrite:
+        record_cache_event(EVENT_MISS, key)
+
+    if results is not None and stream_large_data:
+        num_yielded = 0
+
+        while True:
+            try:
+                item = next(results)
+            except StopIteration:
+                return
+            except Exception as e:
+                logger.warning('Failed to stream large data from cache for '
+                               'key %s after %d item(s): %s.'
+                               % (key, num_yielded, e))
+                break
+
+            num_yielded += 1
+            yield item
 
-        results = _cache_store_items(cache, key, items, expiration,
-                                     compress_large_data)
+        # Recompute and store the items, skipping past those we've already
+        # yielded to the caller.
+        results = islice(
+            _cache_store_items(cache, key,
+                               _cache_get_items(items_or_callable),
+                               cache_expiration, codec, compression_level,
+                               serializer, expires_in),
+            num_yielded, None)
+    elif results is None:
+        results = _cache_store_items(cache, key,
+                                     _cache_get_items(items_or_callable),
+                                     cache_expiration, codec,
+                                     compression_level, serializer,
+                                     expires_in)
+
+        if lock_acquired:
+            results = _release_recompute_lock_when_done(key, results)
 
     for item in results:
         yield item
@@ -267,7 +1342,14 @@ def cache_memoize(key, lookup_callable,
                   force_overwrite=False,
                   large_data=False,
                   compress_large_data=True,
-                  use_generator=False):
+                  use_generator=False,
+                  stream_large_data=False,
+                  serializer=None,
+                  compression_codec=None,
+                  compression_level=None,
+                  stampede_protection=None,
+                  soft_expiration=None,
+                  refresh_executor=None):
     """Memoize the results of a callable inside the configured cache.
 
     Args:
@@ -279,65 +1361,619 @@ def cache_memoize(key, lookup_callable,
             regardless of whether it exists in the cache already.
 
         large_data (bool):
-            If ``True``, the resulting data will be pickled, gzipped, and
+            If ``True``, the resulting data will be serialized, gzipped, and
             (potentially) split up into megabyte-sized chunks. This is useful
             for very large, computationally intensive hunks of data which we
             don't want to store in a database due to the way things are
             accessed.
 
         compress_large_data (bool):
-            Compresses the data with zlib compression when ``large_data``
-            is ``True``.
+            Compresses the data when ``large_data`` is ``True``.
+
+        stream_large_data (bool, optional):
+            Streams the data from the cache when ``large_data`` is ``True``,
+            avoiding holding both the compressed and decompressed data in
+            memory at once. See :py:func:`cache_memoize_iter` for details.
+
+        serializer (unicode or djblets.cache.serializers.BaseCacheSerializer,
+                    optional):
+            The serializer used to store the data when ``large_data`` is
+            ``True``. See :py:func:`cache_memoize_iter` for details.
+
+        compression_codec (unicode or
+                           djblets.cache.compression.
+                           BaseCacheCompressionCodec, optional):
+            The codec used to compress the data when ``large_data`` and
+            ``compress_large_data`` are ``True``. See
+            :py:func:`cache_memoize_iter` for details.
+
+        compression_level (int, optional):
+            The compression level to use for the data when ``large_data`` and
+            ``compress_large_data`` are ``True``.
+
+        stampede_protection (unicode, optional):
+            The type of protection against many processes recomputing the
+            value at the same time once it expires. This can be
+            :py:data:`STAMPEDE_PROTECTION_LOCK` or
+            :py:data:`STAMPEDE_PROTECTION_EARLY_EXPIRATION`. By default, no
+            protection is used.
+
+            Values stored with stampede protection are stored along with
+            their expiration information, and must only be read back through
+            this function.
+
+        soft_expiration (int, optional):
+            The time, in seconds, after which the value will be considered
+            stale. Stale values will still be returned immediately, while a
+            single refresh of the value is run in the background through
+            ``refresh_executor``. The value will only be computed on the
+            caller's request path once it's expired from the cache entirely,
+            based on ``expiration``.
+
+            This is not supported when ``large_data`` is ``True``.
+
+        refresh_executor (object, optional):
+            The executor used to refresh stale values when using
+            ``soft_expiration``. This must provide a
+            ``submit(fn, *args, **kwargs)`` method, such as a
+            :py:class:`concurrent.futures.Executor`. This defaults to the
+            thread pool returned by :py:func:`get_default_refresh_executor`.
+
+    If a process-local cache was enabled for a prefix of ``key`` (through
+    :py:func:`enable_local_cache`), the value will be returned from memory
+    when possible, and stored in memory after being fetched or computed.
 
     Returns:
         The cached data, or the result of ``lookup_callable`` if uncached.
+
+    Raises:
+        ValueError:
+            ``soft_expiration`` was provided along with ``large_data``.
     """
+    if large_data and soft_expiration is not None:
+        raise ValueError('soft_expiration is not supported with '
+                         'large_data=True')
+
     if large_data:
-        results = list(cache_memoize_iter(key,
-                                          lambda: [lookup_callable()],
-                                          expiration,
-                                          force_overwrite,
-                                          compress_large_data))
+        results = list(cache_memoize_iter(
+            key,
+            lambda: [lookup_callable()],
+            expiration,
+            force_overwrite,
+            compress_large_data,
+            stream_large_data=stream_large_data,
+            serializer=serializer,
+            compression_codec=compression_codec,
+            compression_level=compression_level,
+            stampede_protection=stampede_protection))
 
         assert len(results) == 1
 
         return results[0]
+
+    local_cache = _get_local_cache(key)
+
+    if local_cache is not None:
+        local_cache_key = make_cache_key(key)
+
+        if not force_overwrite:
+            data = local_cache.get(local_cache_key, _NO_VALUE)
+
+            if data is not _NO_VALUE:
+                record_cache_event(EVENT_HIT, key, source='local')
+
+                return data
+
+    if soft_expiration is not None:
+        data = _cache_memoize_stale_while_revalidate(
+            key, lookup_callable, expiration, force_overwrite,
+            soft_expiration, refresh_executor)
+    elif stampede_protection is not None:
+        data = _cache_memoize_with_stampede_protection(
+            key, lookup_callable, expiration, force_overwrite,
+            stampede_protection)
     else:
-        key = make_cache_key(key)
+        cache_key = make_cache_key(key)
 
-        if not force_overwrite and key in cache:
-            return cache.get(key)
+        if not force_overwrite and cache_key in cache:
+            data = cache.get(cache_key)
 
-        data = lookup_callable()
+            if isinstance(data, _MemoizedEntry):
+                # The value was stored by a caller using stampede protection
+                # or soft expiration.
+                data = data.value
 
-        # Most people will be using memcached, and memcached has a limit of
-        # 1MB. Data this big should be broken up somehow, so let's warn
-        # about this. Users should hopefully be using large_data=True in this
-        # case.
-        #
-        # XXX - since 'data' may be a sequence that's not a string/unicode,
-        #       this can fail. len(data) might be something like '6' but the
-        #       data could exceed a megabyte. The best way to catch this would
-        #       be an exception, but while python-memcached defines an
-        #       exception type for this, it never uses it, choosing instead to
-        #       fail silently. WTF.
-        if len(data) >= CACHE_CHUNK_SIZE:
-            logger.warning('Cache data for key "%s" (length %s) may be too '
-                           'big for the cache.' % (key, len(data)))
+            record_cache_event(EVENT_HIT, key, source='cache')
+        else:
+            if not force_overwrite:
+                record_cache_event(EVENT_MISS, key)
+
+            data = _cache_store_value(key, cache_key, lookup_callable,
+                                      expiration)
+
+    if local_cache is not None:
+        local_cache.set(local_cache_key, data)
+
+    return data
+
+
+def _cache_memoize_with_stampede_protection(key, lookup_callable, expiration,
+                                            force_overwrite,
+                                            stampede_protection):
+    """Memoize the results of a callable, with stampede protection.
+
+    See :py:func:`cache_memoize` for details.
+    """
+    cache_key = make_cache_key(key)
+    entry = None
+
+    if not force_overwrite:
+        entry = cache.get(cache_key)
+
+        if entry is not None:
+            if not isinstance(entry, _MemoizedEntry):
+                # This was stored without stampede protection.
+                record_cache_event(EVENT_HIT, key, source='cache')
+
+                return entry
+            elif not _is_cache_entry_expired(entry.expires_at, entry.delta,
+                                             stampede_protection):
+                record_cache_event(EVENT_HIT, key, source='cache')
+
+                return entry.value
+
+        if stampede_protection == STAMPEDE_PROTECTION_LOCK:
+            if _acquire_recompute_lock(key):
+                record_cache_event(EVENT_MISS, key)
+
+                try:
+                    return _cache_store_value(key, cache_key,
+                                              lookup_callable, expiration,
+                                              stampede_protection)
+                finally:
+                    _release_recompute_lock(key)
+            elif entry is not None:
+                # Another process is recomputing the value. We'll serve the
+                # stale value in the meantime.
+                record_cache_event(EVENT_HIT, key, source='cache')
+
+                return entry.value
+            else:
+                entry = _wait_for_cache_value(cache_key)
+
+                if entry is not None:
+                    record_cache_event(EVENT_HIT, key, source='cache')
+
+                    if isinstance(entry, _MemoizedEntry):
+                        return entry.value
+                    else:
+                        return entry
+
+        record_cache_event(EVENT_MISS, key)
+
+    return _cache_store_value(key, cache_key, lookup_callable, expiration,
+                              stampede_protection)
+
+
+def _cache_memoize_stale_while_revalidate(key, lookup_callable, expiration,
+                                          force_overwrite, soft_expiration,
+                                          refresh_executor):
+    """Memoize the results of a callable, refreshing stale values.
+
+    See :py:func:`cache_memoize` for details.
+    """
+    cache_key = make_cache_key(key)
+
+    if not force_overwrite:
+        entry = cache.get(cache_key)
+
+        if isinstance(entry, _MemoizedEntry):
+            if (entry.expires_at is not None and
+                time.time() >= entry.expires_at and
+                _acquire_recompute_lock(key)):
+                # This is the only process refreshing the value. Other
+                # processes will continue to serve the stale value until
+                # it's refreshed.
+                if refresh_executor is None:
+                    refresh_executor = get_default_refresh_executor()
+
+                try:
+                    refresh_executor.submit(_refresh_cache_value, key,
+                                            cache_key, lookup_callable,
+                                            expiration, soft_expiration)
+                except Exception as e:
+                    logger.exception('Failed to schedule a refresh of '
+                                     'cache key %s: %s', key, e)
+                    _release_recompute_lock(key)
+
+            record_cache_event(EVENT_HIT, key, source='cache')
+
+            return entry.value
+        elif entry is not None:
+            # This was stored without a soft expiration.
+            record_cache_event(EVENT_HIT, key, source='cache')
+
+            return entry
+
+        record_cache_event(EVENT_MISS, key)
+
+    return _cache_store_value(key, cache_key, lookup_callable, expiration,
+                              soft_expiration=soft_expiration)
+
+
+def _refresh_cache_value(key, cache_key, lookup_callable, expiration,
+                         soft_expiration):
+    """Refresh a stale value in the cache.
+
+    This is run through an executor, outside of the request path. The
+    recompute lock for the key, acquired when scheduling the refresh, will be
+    released once finished.
+    """
+    try:
+        _cache_store_value(key, cache_key, lookup_callable, expiration,
+                           soft_expiration=soft_expiration)
+    except Exception as e:
+        logger.exception('Failed to refresh stale value for cache key '
+                         '%s: %s', key, e)
+    finally:
+        _release_recompute_lock(key)
+
+        # Any database connections opened for this thread won't be closed
+        # at the end of a request, so close them now.
+        close_old_connections()
+
+
+def _cache_store_value(key, cache_key, lookup_callable, expiration,
+                       stampede_protection=None, soft_expiration=None):
+    """Compute a value and store it in the cache.
+
+    If using stampede protection or a soft expiration, the value will be
+    stored along with the time at which it should be considered expired and
+    the time it took to compute.
+
+    A recompute will be recorded for the key's statistics.
+    """
+    start_time = time.time()
+    data = lookup_callable()
+
+    # Most people will be using memcached, and memcached has a limit of
+    # 1MB. Data this big should be broken up somehow, so let's warn
+    # about this. Users should hopefully be using large_data=True in this
+    # case.
+    #
+    # XXX - since 'data' may be a sequence that's not a string/unicode,
+    #       this can fail. len(data) might be something like '6' but the
+    #       data could exceed a megabyte. The best way to catch this would
+    #       be an exception, but while python-memcached defines an
+    #       exception type for this, it never uses it, choosing instead to
+    #       fail silently. WTF.
+    #
+    # Values without a length (such as numbers) are always small enough.
+    if hasattr(data, '__len__') and len(data) >= CACHE_CHUNK_SIZE:
+        logger.warning('Cache data for key "%s" (length %s) may be too '
+                       'big for the cache.' % (cache_key, len(data)))
+
+    if stampede_protection is None and soft_expiration is None:
+        value = data
+    else:
+        now = time.time()
+
+        if soft_expiration is not None:
+            expires_in = soft_expiration
+        else:
+            expires_in = expiration
+            expiration = _get_stampede_cache_expiration(expiration,
+                                                        stampede_protection)
+
+        if expires_in is None:
+            expires_at = None
+        else:
+            expires_at = now + expires_in
+
+        value = _MemoizedEntry(value=data,
+                               expires_at=expires_at,
+                               delta=now - start_time)
+
+    try:
+        cache.set(cache_key, value, expiration)
+    except:
+        pass
+
+    record_cache_event(EVENT_RECOMPUTED, key,
+                       recompute_time=time.time() - start_time)
+
+    return data
+
+
+def cache_memoize_many(keys, lookup_many_callable,
+                       expiration=_default_expiration,
+                       force_overwrite=False,
+                       large_data=False,
+                       compress_large_data=True,
+                       serializer=None,
+                       compression_codec=None,
+                       compression_level=None):
+    """Memoize the results of a callable for many keys at once.
+
+    This works like :py:func:`cache_memoize`, but fetches all the keys from
+    the cache in a single request, and calls ``lookup_many_callable`` once
+    with only the keys that were missing. The results are then stored in the
+    cache in a single request. This replaces a round trip per key with two
+    round trips in total.
+
+    Values are stored the same way as with :py:func:`cache_memoize`, and can
+    be read by either function.
+
+    When ``large_data`` is ``True``, the main cache keys and then the chunks
+    for all keys are each fetched in a single request. New values are stored
+    one key at a time.
+
+    Values for keys with a process-local cache (see
+    :py:func:`enable_local_cache`) will be returned from memory when
+    possible.
+
+    Args:
+        keys (list of unicode):
+            The base keys to look up.
+
+        lookup_many_callable (callable):
+            The function to call to compute missing values. This takes the
+            list of missing keys, and must return a dictionary mapping those
+            keys to their values. Any keys left out of the dictionary won't
+            be cached, and will be left out of the results. Any keys that
+            weren't requested will be logged and ignored.
+
+        expiration (int, optional):
+            The expiration time for the keys, in seconds.
+
+        force_overwrite (bool, optional):
+            If ``True``, the values will always be computed and stored,
+            regardless of whether they exist in the cache already.
+
+        large_data (bool, optional):
+            If ``True``, the values will be serialized, compressed, and
+            (potentially) split up into chunks. See :py:func:`cache_memoize`
+            for details.
+
+        compress_large_data (bool, optional):
+            Compresses the data when ``large_data`` is ``True``.
+
+        serializer (unicode or djblets.cache.serializers.BaseCacheSerializer,
+                    optional):
+            The serializer used to store the data when ``large_data`` is
+            ``True``. See :py:func:`cache_memoize_iter` for details.
+
+        compression_codec (unicode or
+                           djblets.cache.compression.
+                           BaseCacheCompressionCodec, optional):
+            The codec used to compress the data when ``large_data`` and
+            ``compress_large_data`` are ``True``. See
+            :py:func:`cache_memoize_iter` for details.
+
+        compression_level (int, optional):
+            The compression level to use for the data when ``large_data`` and
+            ``compress_large_data`` are ``True``.
+
+    Returns:
+        dict:
+        A dictionary mapping each key to its cached or computed value.
+    """
+    results = {}
+    local_caches = {}
+    cache_keys = {}
+
+    for key in keys:
+        cache_key = make_cache_key(key)
+        local_cache = _get_local_cache(key)
+
+        if local_cache is not None:
+            local_caches[key] = (local_cache, cache_key)
+
+            if not force_overwrite:
+                data = local_cache.get(cache_key, _NO_VALUE)
+
+                if data is not _NO_VALUE:
+                    record_cache_event(EVENT_HIT, key, source='local')
+                    results[key] = data
+                    continue
+
+        cache_keys[key] = cache_key
+
+    if large_data:
+        serializer = _get_large_data_serializer(serializer)
+
+        if compress_large_data:
+            codec = _get_compression_codec(compression_codec)
+
+            if compression_level is None:
+                compression_level = getattr(settings,
+                                            'CACHE_COMPRESSION_LEVEL', None)
+        else:
+            codec = None
+
+    if cache_keys and not force_overwrite:
+        if large_data:
+            cached = _cache_get_many_large_data(cache_keys,
+                                                compress_large_data, codec,
+                                                serializer)
+        else:
+            cached = _cache_get_many_values(cache_keys)
+
+        results.update(cached)
+
+        for key in cached:
+            del cache_keys[key]
+
+            if not large_data:
+                record_cache_event(EVENT_HIT, key, source='cache')
+
+    if cache_keys:
+        missing_keys = [
+            key
+            for key in keys
+            if key in cache_keys
+        ]
+
+        logger.debug('Cache miss for key(s): %s.', ', '.join(missing_keys))
+
+        if not force_overwrite:
+            for key in missing_keys:
+                record_cache_event(EVENT_MISS, key)
+
+        start_time = time.time()
+        computed = lookup_many_callable(missing_keys)
+        unexpected_keys = [
+            key
+            for key in computed
+            if key not in cache_keys
+        ]
+
+        if unexpected_keys:
+            logger.warning('Ignoring unexpected key(s) returned by %r for '
+                           'cache_memoize_many: %r.'
+                           % (lookup_many_callable, unexpected_keys))
+
+            computed = {
+                key: data
+                for key, data in six.iteritems(computed)
+                if key in cache_keys
+            }
+
+        if large_data:
+            for key, data in six.iteritems(computed):
+                list(_cache_store_items(cache, key, [data], expiration, codec,
+                                        compression_level, serializer))
+        else:
+            try:
+                cache.set_many(
+                    {
+                        cache_keys[key]: data
+                        for key, data in six.iteritems(computed)
+                    },
+                    expiration)
+            except:
+                pass
+
+            if computed:
+                # The values were computed together, so split the time
+                # between them.
+                recompute_time = (time.time() - start_time) / len(computed)
+
+                for key in computed:
+                    record_cache_event(EVENT_RECOMPUTED, key,
+                                       recompute_time=recompute_time)
+
+        results.update(computed)
+
+    for key, (local_cache, cache_key) in six.iteritems(local_caches):
+        if key in results:
+            local_cache.set(cache_key, results[key])
+
+    return results
+
+
+def _cache_get_many_values(cache_keys):
+    """Fetch values for many keys from the cache in a single request.
+
+    Values stored with stampede protection or a soft expiration will be
+    unwrapped. Keys missing from the cache will be left out of the results.
+    """
+    keys = {
+        cache_key: key
+        for key, cache_key in six.iteritems(cache_keys)
+    }
+    results = {}
+
+    for cache_key, value in six.iteritems(cache.get_many(list(keys))):
+        if isinstance(value, _MemoizedEntry):
+            value = value.value
+
+        results[keys[cache_key]] = value
+
+    return results
+
+
+def _cache_get_many_large_data(cache_keys, compress_large_data, codec,
+                               serializer):
+    """Fetch large data for many keys from the cache.
+
+    The main cache keys are fetched in one request, followed by all of their
+    chunks in another. Keys that are missing from the cache, are missing
+    chunks, or fail to load will be left out of the results.
+    """
+    keys = {
+        cache_key: key
+        for key, cache_key in six.iteritems(cache_keys)
+    }
+    infos = {}
+    chunk_keys = {}
+
+    for cache_key, value in six.iteritems(cache.get_many(list(keys))):
+        key = keys[cache_key]
 
         try:
-            cache.set(key, data, expiration)
-        except:
-            pass
+            info = _parse_large_data_info(value, compress_large_data, codec,
+                                          serializer)
+        except Exception as e:
+            logger.warning('Failed to fetch large data from cache for '
+                           'key %s: %s.' % (key, e))
+            continue
+
+        infos[key] = info
+        chunk_keys[key] = _get_large_data_chunk_keys(key, info)
+
+    if not chunk_keys:
+        return {}
+
+    chunks = cache.get_many([
+        chunk_key
+        for key_chunk_keys in six.itervalues(chunk_keys)
+        for chunk_key in key_chunk_keys
+    ])
+    results = {}
+
+    for key, key_chunk_keys in six.iteritems(chunk_keys):
+        if not all(chunk_key in chunks for chunk_key in key_chunk_keys):
+            logger.debug('Missing chunks for cache key %s.', key)
+            continue
+
+        info = infos[key]
+
+        try:
+            data = _join_large_data_chunks(chunks, key_chunk_keys, info)
+            items = list(_cache_iter_large_data(io.BytesIO(data), key,
+                                                info['serializer']))
+        except Exception as e:
+            logger.warning('Failed to fetch large data from cache for '
+                           'key %s: %s.' % (key, e))
+            continue
 
-        return data
+        if len(items) == 1:
+            results[key] = items[0]
+            record_cache_event(EVENT_HIT, key,
+                               source='cache',
+                               chunk_count=info['chunk_count'],
+                               data_size=info.get('data_size', 0),
+                               decompress_time=info.get('decompress_time',
+                                                        0))
+
+    return results
 
 
 def make_cache_key(key):
     """Create a cache key guaranteed to avoid conflicts and size limits.
 
     The cache key will be prefixed by the site's domain, and will be
-    changed to an MD5SUM if it's larger than the maximum key size.
+    changed to a digest if it's larger than the maximum key size.
+
+    The site prefix is computed once per process, and recomputed when the
+    site or the relevant settings change.
+
+    Keys are digested using MD5 by default. Installs on Python 3.6+ can set
+    ``settings.CACHE_KEY_DIGEST`` to ``'blake2b'`` to use BLAKE2b instead,
+    which is faster for long keys. Changing this will change the cache keys
+    for any long keys, so it should only be changed when the cache can be
+    cleared.
 
     Args:
         key (str): The base key to generate a cache key from.
@@ -345,28 +1981,38 @@ def make_cache_key(key):
     Returns:
         str: A cache key suitable for use with the cache backend.
     """
-    try:
-        site = Site.objects.get_current()
+    global _cache_key_prefix
 
-        # The install has a Site app, so prefix the domain to the key.
-        # If a SITE_ROOT is defined, also include that, to allow for multiple
-        # instances on the same host.
-        site_root = getattr(settings, 'SITE_ROOT', None)
+    prefix = _cache_key_prefix
 
-        if site_root:
-            key = '%s:%s:%s' % (site.domain, site_root, key)
-        else:
-            key = '%s:%s' % (site.domain, key)
-    except:
-        # The install doesn't have a Site app, so use the key as-is.
-        pass
+    if prefix is None:
+        try:
+            site = Site.objects.get_current()
+
+            # The install has a Site app, so prefix the domain to the key.
+            # If a SITE_ROOT is defined, also include that, to allow for
+            # multiple instances on the same host.
+            site_root = getattr(settings, 'SITE_ROOT', None)
+
+            if site_root:
+                prefix = '%s:%s:' % (site.domain, site_root)
+            else:
+                prefix = '%s:' % site.domain
+
+            prefix = _CACHE_KEY_STRIP_RE.sub('', prefix)
+            _cache_key_prefix = prefix
+        except:
+            # The install doesn't have a Site app (or it's not yet set up),
+            # so use the key as-is. We won't remember this, so that the
+            # prefix will be used once the Site is available.
+            prefix = ''
 
     # Strip out any characters that memcached doesn't like in keys
-    key = ''.join(ch for ch in key if ch not in ' \t\n\r')
+    key = prefix + _CACHE_KEY_STRIP_RE.sub('', key)
 
     # Adhere to memcached key size limit
     if len(key) > MAX_KEY_SIZE:
-        digest = md5(key.encode('utf-8')).hexdigest()
+        digest = _get_cache_key_digest_func()(key.encode('utf-8'))
 
         # Replace the excess part of the key with a digest of the key
         key = key[:MAX_KEY_SIZE - len(digest)] + digest
@@ -376,3 +2022,54 @@ def make_cache_key(key):
     key = key.encode('utf-8')
 
     return key
+
+
+def _get_cache_key_digest_func():
+    """Return the function used to digest long cache keys.
+
+    The function is looked up based on ``settings.CACHE_KEY_DIGEST`` the
+    first time it's needed. Unsupported digests will fall back to MD5.
+    """
+    global _cache_key_digest_func
+
+    if _cache_key_digest_func is None:
+        digest = getattr(settings, 'CACHE_KEY_DIGEST',
+                         DEFAULT_CACHE_KEY_DIGEST)
+
+        try:
+            _cache_key_digest_func = _CACHE_KEY_DIGEST_FUNCS[digest]
+        except KeyError:
+            logger.warning('Unsupported CACHE_KEY_DIGEST "%s". Falling back '
+                           'to "%s".', digest, DEFAULT_CACHE_KEY_DIGEST)
+            _cache_key_digest_func = \
+                _CACHE_KEY_DIGEST_FUNCS[DEFAULT_CACHE_KEY_DIGEST]
+
+    return _cache_key_digest_func
+
+
+def _on_site_changed(**kwargs):
+    """Reset the cache key prefix when a Site is changed."""
+    global _cache_key_prefix
+
+    _cache_key_prefix = None
+
+
+def _on_setting_changed(setting, **kwargs):
+    """Reset state computed from settings when they're changed.
+
+    Settings are normally only changed by unit tests.
+    """
+    global _cache_key_digest_func, _cache_key_prefix
+
+    if setting in ('SITE_ID', 'SITE_ROOT'):
+        _cache_key_prefix = None
+    elif setting == 'CACHE_KEY_DIGEST':
+        _cache_key_digest_func = None
+
+
+post_save.connect(_on_site_changed, sender=Site,
+                  dispatch_uid='djblets-cache-site-saved')
+post_delete.connect(_on_site_changed, sender=Site,
+                    dispatch_uid='djblets-cache-site-deleted')
+setting_changed.connect(_on_setting_changed,
+                        dispatch_uid='djblets-cache-setting-changed')
@@ -0,0 +1,467 @@
+"""Compression codecs for storing large data in the cache.
+
+Large data stored through :py:func:`~djblets.cache.backend.cache_memoize_iter`
+(and :py:func:`~djblets.cache.backend.cache_memoize` with ``large_data=True``)
+can be compressed before being split into chunks. The codec used for an entry
+is recorded in the entry's main cache key, so that readers always decompress
+the data correctly, regardless of the codec they'd use to store new data.
+
+Built-in codecs include ``zlib`` and, depending on the version of Python and
+the installed packages, ``lzma``, ``lz4``, and ``zstd``.
+"""
+
+from __future__ import unicode_literals
+
+import zlib
+
+from django.utils.translation import ugettext_lazy as _
+
+from djblets.registries.registry import (ALREADY_REGISTERED,
+                                         ATTRIBUTE_REGISTERED,
+                                         DEFAULT_ERRORS,
+                                         Registry,
+                                         UNREGISTER)
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+_registry = None
+
+
+class BaseCacheCompressionCodec(object):
+    """Base class for a compression codec for large cached data.
+
+    Subclasses must set :py:attr:`codec_id` and implement
+    :py:meth:`compressobj` and :py:meth:`iter_decompress`.
+    """
+
+    #: The unique ID of the codec.
+    #:
+    #: This is stored in the cache along with the data, and must not change.
+    codec_id = None
+
+    def compressobj(self, level=None):
+        """Return a new compressor.
+
+        Args:
+            level (int, optional):
+                The compression level. The meaning of this is specific to the
+                codec. If ``None``, the codec's default level is used.
+
+        Returns:
+            object:
+            A compressor, providing ``compress(data)`` and ``flush()``
+            methods, both returning compressed data.
+        """
+        raise NotImplementedError
+
+    def iter_decompress(self, blocks, max_length=None):
+        """Decompress a stream of compressed data.
+
+        Args:
+            blocks (iterable of bytes):
+                The blocks of compressed data.
+
+            max_length (int, optional):
+                The maximum size of each block of decompressed data to
+                yield, if supported by the codec. This is used to bound
+                memory usage for highly-compressed data.
+
+        Yields:
+            bytes:
+            Each block of decompressed data.
+        """
+        raise NotImplementedError
+
+    def decompress(self, data):
+        """Decompress data all at once.
+
+        Args:
+            data (bytes):
+                The compressed data.
+
+        Returns:
+            bytes:
+            The decompressed data.
+        """
+        return b''.join(self.iter_decompress([data]))
+
+
+class ZlibCodec(BaseCacheCompressionCodec):
+    """Compresses data using zlib.
+
+    This is the default codec, and is compatible with data compressed by
+    older versions of Djblets.
+    """
+
+    codec_id = 'zlib'
+
+    def compressobj(self, level=None):
+        """Return a new compressor.
+
+        Args:
+            level (int, optional):
+                The compression level, from 0 to 9.
+
+        Returns:
+            object:
+            A zlib compressor.
+        """
+        if level is None:
+            level = zlib.Z_DEFAULT_COMPRESSION
+
+        return zlib.compressobj(level)
+
+    def iter_decompress(self, blocks, max_length=None):
+        """Decompress a stream of compressed data.
+
+        Args:
+            blocks (iterable of bytes):
+                The blocks of compressed data.
+
+            max_length (int, optional):
+                The maximum size of each block of decompressed data to
+                yield.
+
+        Yields:
+            bytes:
+            Each block of decompressed data.
+        """
+        decompressor = zlib.decompressobj()
+
+        for data in blocks:
+            if max_length is None:
+                decompressed = decompressor.decompress(data)
+
+                if decompressed:
+                    yield decompressed
+            else:
+                while data:
+                    decompressed = decompressor.decompress(data, max_length)
+                    data = decompressor.unconsumed_tail
+
+                    if decompressed:
+                        yield decompressed
+
+        remaining = decompressor.flush()
+
+        if remaining:
+            yield remaining
+
+    def decompress(self, data):
+        """Decompress data all at once.
+
+        Args:
+            data (bytes):
+                The compressed data.
+
+        Returns:
+            bytes:
+            The decompressed data.
+        """
+        return zlib.decompress(data)
+
+
+class _NeedsInputDecompressorMixin(object):
+    """Mixin for codecs with decompressors supporting a maximum length.
+
+    This works with decompressors providing a ``needs_input`` attribute and
+    a ``max_length`` argument to ``decompress()``, such as those for LZMA and
+    LZ4 frames.
+    """
+
+    def iter_decompress(self, blocks, max_length=None):
+        """Decompress a stream of compressed data.
+
+        Args:
+            blocks (iterable of bytes):
+                The blocks of compressed data.
+
+            max_length (int, optional):
+                The maximum size of each block of decompressed data to
+                yield.
+
+        Yields:
+            bytes:
+            Each block of decompressed data.
+        """
+        if max_length is None:
+            max_length = -1
+
+        decompressor = self.decompressobj()
+
+        for data in blocks:
+            while not decompressor.eof:
+                decompressed = decompressor.decompress(data, max_length)
+                data = b''
+
+                if decompressed:
+                    yield decompressed
+
+                if decompressor.needs_input:
+                    break
+
+    def decompressobj(self):
+        """Return a new decompressor.
+
+        Returns:
+            object:
+            The decompressor.
+        """
+        raise NotImplementedError
+
+
+class LZMACodec(_NeedsInputDecompressorMixin, BaseCacheCompressionCodec):
+    """Compresses data using LZMA.
+
+    This compresses better than zlib, at a higher CPU cost. This requires
+    Python 3.
+    """
+
+    codec_id = 'lzma'
+
+    def compressobj(self, level=None):
+        """Return a new compressor.
+
+        Args:
+            level (int, optional):
+                The compression preset, from 0 to 9.
+
+        Returns:
+            lzma.LZMACompressor:
+            The LZMA compressor.
+        """
+        return lzma.LZMACompressor(preset=level)
+
+    def decompressobj(self):
+        """Return a new decompressor.
+
+        Returns:
+            lzma.LZMADecompressor:
+            The LZMA decompressor.
+        """
+        return lzma.LZMADecompressor()
+
+
+class _LZ4Compressor(object):
+    """Adapts an LZ4 frame compressor to the standard compressor interface."""
+
+    def __init__(self, level):
+        """Initialize the compressor.
+
+        Args:
+            level (int):
+                The LZ4 compression level.
+        """
+        self._compressor = lz4.frame.LZ4FrameCompressor(
+            compression_level=level)
+        self._started = False
+
+    def compress(self, data):
+        """Compress data.
+
+        Args:
+            data (bytes):
+                The data to compress.
+
+        Returns:
+            bytes:
+            The compressed data.
+        """
+        return self._begin() + self._compressor.compress(data)
+
+    def flush(self):
+        """Finish compressing data.
+
+        Returns:
+            bytes:
+            The remaining compressed data.
+        """
+        return self._begin() + self._compressor.flush()
+
+    def _begin(self):
+        """Begin the compressed frame, if not already begun.
+
+        Returns:
+            bytes:
+            The frame header, if the frame was begun, or empty data.
+        """
+        if self._started:
+            return b''
+
+        self._started = True
+
+        return self._compressor.begin()
+
+
+class LZ4Codec(_NeedsInputDecompressorMixin, BaseCacheCompressionCodec):
+    """Compresses data using LZ4 frames.
+
+    This is very fast, at the cost of lower compression ratios. This requires
+    the :pypi:`lz4` package to be installed.
+    """
+
+    codec_id = 'lz4'
+
+    def compressobj(self, level=None):
+        """Return a new compressor.
+
+        Args:
+            level (int, optional):
+                The LZ4 compression level.
+
+        Returns:
+            object:
+            The LZ4 compressor.
+        """
+        if level is None:
+            level = lz4.frame.COMPRESSIONLEVEL_MIN
+
+        return _LZ4Compressor(level)
+
+    def decompressobj(self):
+        """Return a new decompressor.
+
+        Returns:
+            lz4.frame.LZ4FrameDecompressor:
+            The LZ4 decompressor.
+        """
+        return lz4.frame.LZ4FrameDecompressor()
+
+
+class ZstdCodec(BaseCacheCompressionCodec):
+    """Compresses data using Zstandard.
+
+    This offers a good balance of speed and compression. This requires the
+    :pypi:`zstandard` package to be installed.
+    """
+
+    codec_id = 'zstd'
+
+    def compressobj(self, level=None):
+        """Return a new compressor.
+
+        Args:
+            level (int, optional):
+                The Zstandard compression level.
+
+        Returns:
+            object:
+            The Zstandard compressor.
+        """
+        if level is None:
+            level = 3
+
+        return zstandard.ZstdCompressor(level=level).compressobj()
+
+    def iter_decompress(self, blocks, max_length=None):
+        """Decompress a stream of compressed data.
+
+        Args:
+            blocks (iterable of bytes):
+                The blocks of compressed data.
+
+            max_length (int, optional):
+                This is not supported by Zstandard, and will be ignored.
+
+        Yields:
+            bytes:
+            Each block of decompressed data.
+        """
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+
+        for data in blocks:
+            decompressed = decompressor.decompress(data)
+
+            if decompressed:
+                yield decompressed
+
+
+class CacheCompressionCodecsRegistry(Registry):
+    """A registry of compression codecs for large cached data."""
+
+    lookup_attrs = ('codec_id',)
+
+    default_errors = dict(DEFAULT_ERRORS, **{
+        ALREADY_REGISTERED: _(
+            'Could not register cache compression codec %(item)s: This '
+            'codec is already registered or its ID conflicts with another '
+            'codec.'
+        ),
+        ATTRIBUTE_REGISTERED: _(
+            'Could not register cache compression codec %(item)s: Another '
+            'codec (%(duplicate)s) is already registered with the same ID.'
+        ),
+        UNREGISTER: _(
+            'Could not unregister cache compression codec %(item)s: This '
+            'codec was not yet registered.'
+        ),
+    })
+
+    def get_defaults(self):
+        """Return the default codecs for the registry.
+
+        Codecs depending on newer versions of Python or optional packages
+        will only be included if they're supported.
+
+        Returns:
+            list of BaseCacheCompressionCodec:
+            The default codecs.
+        """
+        codecs = [ZlibCodec()]
+
+        if lzma is not None:
+            codecs.append(LZMACodec())
+
+        if lz4 is not None:
+            codecs.append(LZ4Codec())
+
+        if zstandard is not None:
+            codecs.append(ZstdCodec())
+
+        return codecs
+
+    def get_codec(self, codec_id):
+        """Return the codec with the given ID.
+
+        Args:
+            codec_id (unicode):
+                The ID of the codec.
+
+        Returns:
+            BaseCacheCompressionCodec:
+            The codec.
+
+        Raises:
+            djblets.registries.errors.ItemLookupError:
+                The codec could not be found.
+        """
+        return self.get('codec_id', codec_id)
+
+
+def get_cache_compression_codecs_registry():
+    """Return the registry of compression codecs for large cached data.
+
+    Returns:
+        CacheCompressionCodecsRegistry:
+        The registry of compression codecs.
+    """
+    global _registry
+
+    if _registry is None:
+        _registry = CacheCompressionCodecsRegistry()
+
+    return _registry
@@ -6,10 +6,23 @@ import threading
 
 from django.core.signals import request_finished
 
+try:
+    # Django >= 1.7
+    from django.core.cache import _create_cache
+except ImportError:
+    # Django < 1.7
+    from django.core.cache import get_cache as _create_cache
+
 
 DEFAULT_FORWARD_CACHE_ALIAS = 'forwarded_backend'
 
 
+# The load generation for each forwarded cache alias, shared by all
+# ForwardingCacheBackend instances (and therefore all threads).
+_load_gens = {}
+_load_gens_lock = threading.Lock()
+
+
 class ForwardingCacheBackend(object):
     """Forwards requests to another cache backend.
 
@@ -26,21 +39,32 @@ class ForwardingCacheBackend(object):
     If a consumer switches the real cache backend, it can call
     :py:meth:`reset_backend`, and all future cache requests will go to the
     newly computed backend.
+
+    Each thread uses its own instance of the forwarded backend (and
+    therefore its own connections), which it reuses across requests. Looking
+    up the backend never requires a lock. Instead, :py:meth:`reset_backend`
+    bumps a load generation shared by all threads, and each thread switches
+    to a new backend the next time it makes a request. The thread then
+    closes its old backend, which no other thread could be using, so
+    switching cache servers never interrupts a request in progress.
     """
+
     def __init__(self, cache_name=DEFAULT_FORWARD_CACHE_ALIAS,
                  *args, **kwargs):
         self._cache_name = cache_name
-        self._backend = None
-        self._load_lock = threading.Lock()
-        self._load_gen = 0
+        self._local = threading.local()
 
     @property
     def backend(self):
-        """Return the forwarded cache backend."""
-        if not self._backend:
-            self._load_backend()
+        """Return the forwarded cache backend for this thread."""
+        local = self._local
+        backend = getattr(local, 'backend', None)
+
+        if (backend is None or
+            local.load_gen != _load_gens.get(self._cache_name, 0)):
+            backend = self._load_backend()
 
-        return self._backend
+        return backend
 
     def reset_backend(self):
         """Reset the forwarded cache backend.
@@ -48,52 +72,70 @@ class ForwardingCacheBackend(object):
         This must be called after modifying
         ``settings.CACHES['forwarded_backend']`` in order for the new
         backend to be picked up.
+
+        The new backend will be loaded for this thread right away. Other
+        threads will load it the next time they make a cache request.
         """
-        if self._backend:
-            try:
-                self._backend.close()
-            except:
-                # We don't really care if this fails. We just want the new
-                # configuration.
-                pass
+        with _load_gens_lock:
+            _load_gens[self._cache_name] = \
+                _load_gens.get(self._cache_name, 0) + 1
 
+        if getattr(self._local, 'backend', None) is not None:
             self._load_backend()
 
     def close(self, *args, **kwargs):
-        """Close the cache backend."""
-        if self._backend:
-            self._backend.close(*args, **kwargs)
+        """Close the cache backend for this thread."""
+        backend = getattr(self._local, 'backend', None)
+
+        if backend is not None:
+            backend.close(*args, **kwargs)
 
     def _load_backend(self):
-        """Load the caching backend.
+        """Load the caching backend for this thread.
 
-        This will replace the current caching backend with a newly loaded
-        one, based on the stored cache name.
+        This will replace this thread's caching backend with a newly loaded
+        one, based on the stored cache name and the latest load generation.
+        The old backend, if any, will be closed.
 
-        Only one thread at a time can load the cache backend. A counter
-        is kept that keeps the load generation number. If several threads
-        try to reload the backend at once, only one will succeed in doing
-        so for that generation.
+        Returns:
+            object:
+            The new cache backend.
         """
-        cur_load_gen = self._load_gen
+        local = self._local
+        load_gen = _load_gens.get(self._cache_name, 0)
+        old_backend = getattr(local, 'backend', None)
+
+        backend = _create_cache(self._cache_name)
 
-        with self._load_lock:
-            if self._load_gen == cur_load_gen:
-                from django.core.cache import get_cache
+        # Older versions of Django will attempt to connect the backend's
+        # close() to request_finished, which we don't want. Instead, go and
+        # disconnect this.
+        request_finished.disconnect(backend.close)
 
-                self._backend = get_cache(self._cache_name)
+        local.backend = backend
+        local.load_gen = load_gen
 
-                # get_cache will attempt to connect to 'close', which we don't
-                # want. Instead, go and disconnect this.
-                request_finished.disconnect(self._backend.close)
+        if old_backend is not None:
+            try:
+                old_backend.close()
+            except Exception:
+                # We don't really care if this fails. We just want the new
+                # configuration.
+                pass
 
-                self._load_gen = cur_load_gen + 1
+        return backend
 
     def __contains__(self, key):
         return key in self.backend
 
-    def __getattribute__(self, name):
-        try:
-            return object.__getattribute__(self, name)
-        except AttributeError:
-            return self.backend.__getattribute__(name)
+    def __getattr__(self, name):
+        # This may be called before __init__ has set up the instance's state
+        # (for instance, while unpickling or copying). The state is checked
+        # through __dict__, since looking it up normally would end up back
+        # here.
+        if (name in ('_cache_name', '_local', 'backend') or
+            '_local' not in self.__dict__ or
+            '_cache_name' not in self.__dict__):
+            raise AttributeError(name)
+
+        return getattr(self.backend, name)
@@ -0,0 +1,53 @@
+"""Middleware for working with the cache."""
+
+from __future__ import unicode_literals
+
+from djblets.cache.synchronizer import get_generation_synchronizer_registry
+
+
+class GenerationSyncMiddleware(object):
+    """Middleware for batching generation checks for each HTTP request.
+
+    This fetches the generations for all
+    :py:class:`~djblets.cache.synchronizer.GenerationSynchronizer` instances
+    in a single cache request at the start of each HTTP request. Expiration
+    checks made during the request (such as those made by
+    :py:class:`~djblets.siteconfig.middleware.SettingsMiddleware`,
+    :py:class:`~djblets.extensions.middleware.ExtensionsMiddleware`, and
+    :py:class:`~djblets.integrations.middleware.IntegrationsMiddleware`)
+    will then use those generations, rather than each making their own cache
+    request.
+
+    This must be listed before any middleware performing expiration checks.
+    """
+
+    def process_request(self, request):
+        """Process the HTTP request.
+
+        This will fetch the generations for all synchronizers.
+
+        Args:
+            request (django.http.HttpRequest):
+                The HTTP request being processed.
+        """
+        get_generation_synchronizer_registry().begin_batch()
+
+    def process_response(self, request, response):
+        """Process the HTTP response.
+
+        This will end the batch of generation checks for the request.
+
+        Args:
+            request (django.http.HttpRequest):
+                The HTTP request that was processed.
+
+            response (django.http.HttpResponse):
+                The HTTP response to send.
+
+        Returns:
+            django.http.HttpResponse:
+            The HTTP response.
+        """
+        get_generation_synchronizer_registry().end_batch()
+
+        return response
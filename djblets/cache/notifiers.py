@@ -0,0 +1,594 @@
+"""Notifiers for pushing generation changes to other processes.
+
+By default, :py:class:`~djblets.cache.synchronizer.GenerationSynchronizer`
+polls the cache to check whether its state has expired. A notifier lets
+synchronizers publish each new generation as it's set, and receive those
+generations from other processes as they're published. While a notifier is
+connected, synchronizers rely on it instead of polling the cache, so changes
+are seen immediately and idle checks don't cost anything.
+
+Notifiers use a publish/subscribe interface modeled after Redis, sending
+messages to handlers subscribed to named channels.
+
+A notifier can be configured by setting ``settings.CACHE_SYNC_NOTIFIER`` to
+the class path of a notifier, and ``settings.CACHE_SYNC_NOTIFIER_OPTIONS`` to
+a dictionary of keyword arguments for it. For example:
+
+.. code-block:: python
+
+   CACHE_SYNC_NOTIFIER = 'djblets.cache.notifiers.FileSyncNotifier'
+   CACHE_SYNC_NOTIFIER_OPTIONS = {
+       'path': '/var/run/myapp/sync',
+   }
+
+No notifier is used by default.
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+import weakref
+from importlib import import_module
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import six
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+logger = logging.getLogger(__name__)
+
+
+_notifier = None
+_notifier_loaded = False
+
+
+class BaseSyncNotifier(object):
+    """Base class for a notifier of generation changes.
+
+    Subclasses must implement :py:meth:`publish` and
+    :py:attr:`is_connected`, and call :py:meth:`dispatch` for each message
+    received. They can also implement :py:meth:`start_listening` to begin
+    receiving messages for a channel.
+
+    Handlers are held by weak reference, so callers must hold onto a
+    reference to any handler they subscribe for as long as it's needed.
+
+    Attributes:
+        connection_id (int):
+            An ID that changes each time the notifier connects. Messages may
+            have been missed while disconnected, so subscribers must check
+            their state again when this changes.
+    """
+
+    def __init__(self):
+        """Initialize the notifier."""
+        self.connection_id = 0
+
+        self._handlers = {}
+        self._handlers_lock = threading.Lock()
+
+    @property
+    def is_connected(self):
+        """Whether the notifier is connected and receiving messages.
+
+        Type:
+            bool
+        """
+        raise NotImplementedError
+
+    def publish(self, channel, message):
+        """Publish a message to all subscribers of a channel.
+
+        Args:
+            channel (unicode):
+                The channel to publish to.
+
+            message (unicode):
+                The message to publish.
+        """
+        raise NotImplementedError
+
+    def subscribe(self, channel, handler):
+        """Subscribe a handler to messages on a channel.
+
+        Args:
+            channel (unicode):
+                The channel to subscribe to.
+
+            handler (callable):
+                The handler to call for each message. This takes the channel
+                and the message as arguments.
+        """
+        with self._handlers_lock:
+            try:
+                handlers = self._handlers[channel]
+                is_new = False
+            except KeyError:
+                handlers = weakref.WeakSet()
+                self._handlers[channel] = handlers
+                is_new = True
+
+            handlers.add(handler)
+
+        if is_new:
+            self.start_listening(channel)
+
+    def unsubscribe(self, channel, handler):
+        """Unsubscribe a handler from messages on a channel.
+
+        Args:
+            channel (unicode):
+                The channel to unsubscribe from.
+
+            handler (callable):
+                The handler to unsubscribe.
+        """
+        with self._handlers_lock:
+            handlers = self._handlers.get(channel)
+
+            if handlers is not None:
+                handlers.discard(handler)
+
+    def start_listening(self, channel):
+        """Begin receiving messages for a channel.
+
+        This is called the first time a handler subscribes to a channel.
+
+        Args:
+            channel (unicode):
+                The channel to listen to.
+        """
+        pass
+
+    def get_channels(self):
+        """Return the channels that have been subscribed to.
+
+        Returns:
+            list of unicode:
+            The channels.
+        """
+        with self._handlers_lock:
+            return list(self._handlers)
+
+    def dispatch(self, channel, message):
+        """Dispatch a received message to the channel's handlers.
+
+        Errors from handlers will be logged, and won't prevent other
+        handlers from being called.
+
+        Args:
+            channel (unicode):
+                The channel the message was received on.
+
+            message (unicode):
+                The message.
+        """
+        with self._handlers_lock:
+            handlers = list(self._handlers.get(channel, ()))
+
+        for handler in handlers:
+            try:
+                handler(channel, message)
+            except Exception as e:
+                logger.exception('Error handling sync notification on '
+                                 'channel %s: %s',
+                                 channel, e)
+
+
+class LocalSyncNotifier(BaseSyncNotifier):
+    """A notifier for messages within the current process.
+
+    Messages are dispatched to handlers immediately, in the publishing
+    thread. This is only suitable for single-process deployments and for
+    unit tests, where it can stand in for a notifier connecting processes.
+    """
+
+    @property
+    def is_connected(self):
+        """Whether the notifier is connected and receiving messages.
+
+        This is always ``True``.
+
+        Type:
+            bool
+        """
+        return True
+
+    def publish(self, channel, message):
+        """Publish a message to all subscribers of a channel.
+
+        Args:
+            channel (unicode):
+                The channel to publish to.
+
+            message (unicode):
+                The message to publish.
+        """
+        self.dispatch(channel, message)
+
+
+class FileSyncNotifier(BaseSyncNotifier):
+    """A notifier for processes on the same host, using files.
+
+    Each channel's latest message is written to a file in a shared
+    directory. A background thread in each process watches the files for
+    the channels it's subscribed to, dispatching any new messages.
+
+    This only connects processes on the same host, and must not be used when
+    serving from multiple hosts.
+    """
+
+    #: The default interval, in seconds, between checks for new messages.
+    DEFAULT_POLL_INTERVAL = 0.1
+
+    def __init__(self, path=None, poll_interval=DEFAULT_POLL_INTERVAL):
+        """Initialize the notifier.
+
+        Args:
+            path (unicode, optional):
+                The directory used to store messages. This must be shared by
+                all processes. This defaults to a directory in the system's
+                temporary directory.
+
+            poll_interval (float, optional):
+                The interval, in seconds, between checks for new messages.
+        """
+        super(FileSyncNotifier, self).__init__()
+
+        if path is None:
+            path = os.path.join(tempfile.gettempdir(), 'djblets-sync')
+
+        self.path = path
+        self.poll_interval = poll_interval
+
+        self._file_states = {}
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+        if not os.path.exists(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                # Another process may have created it first.
+                if not os.path.isdir(path):
+                    raise
+
+    @property
+    def is_connected(self):
+        """Whether the notifier is connected and receiving messages.
+
+        This is ``True`` while the watcher thread is running.
+
+        Type:
+            bool
+        """
+        thread = self._thread
+
+        return thread is not None and thread.is_alive()
+
+    def publish(self, channel, message):
+        """Publish a message to all subscribers of a channel.
+
+        The message is written to a temporary file, and then moved into
+        place, so that watchers never read a partial message.
+
+        Args:
+            channel (unicode):
+                The channel to publish to.
+
+            message (unicode):
+                The message to publish.
+        """
+        filename = self._get_filename(channel)
+        tmp_filename = '%s.%s-%s.tmp' % (filename, os.getpid(),
+                                         threading.current_thread().ident)
+
+        with io.open(tmp_filename, 'w', encoding='utf-8') as fp:
+            fp.write(message)
+
+        try:
+            os.rename(tmp_filename, filename)
+        except OSError:
+            # On Windows, the destination must not exist.
+            os.unlink(filename)
+            os.rename(tmp_filename, filename)
+
+    def start_listening(self, channel):
+        """Begin receiving messages for a channel.
+
+        This records the channel's current file state and starts the watcher
+        thread, if not already running.
+
+        Args:
+            channel (unicode):
+                The channel to listen to.
+        """
+        state = self._get_file_state(self._get_filename(channel))
+
+        with self._thread_lock:
+            self._file_states[channel] = state
+
+            if not self.is_connected:
+                self.connection_id += 1
+                self._thread = threading.Thread(target=self._watch)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _watch(self):
+        """Watch for new messages on all subscribed channels.
+
+        This runs in the watcher thread.
+        """
+        try:
+            while True:
+                time.sleep(self.poll_interval)
+
+                for channel in self.get_channels():
+                    self._check_channel(channel)
+        except Exception as e:
+            logger.exception('Sync notification watcher stopped due to an '
+                             'unexpected error: %s',
+                             e)
+
+    def _check_channel(self, channel):
+        """Dispatch a new message on a channel, if there is one.
+
+        Args:
+            channel (unicode):
+                The channel to check.
+        """
+        filename = self._get_filename(channel)
+        state = self._get_file_state(filename)
+
+        if state is None:
+            return
+
+        with self._thread_lock:
+            if state == self._file_states.get(channel):
+                return
+
+            self._file_states[channel] = state
+
+        try:
+            with io.open(filename, 'r', encoding='utf-8') as fp:
+                message = fp.read()
+        except IOError:
+            # The file was replaced or removed. We'll pick up any new state
+            # on the next check.
+            return
+
+        self.dispatch(channel, message)
+
+    def _get_filename(self, channel):
+        """Return the filename used for a channel.
+
+        Args:
+            channel (unicode):
+                The channel.
+
+        Returns:
+            unicode:
+            The filename.
+        """
+        return os.path.join(
+            self.path,
+            hashlib.sha1(channel.encode('utf-8')).hexdigest())
+
+    def _get_file_state(self, filename):
+        """Return the state of a file, used to detect changes.
+
+        Args:
+            filename (unicode):
+                The filename.
+
+        Returns:
+            tuple:
+            The state of the file, or ``None`` if it doesn't exist.
+        """
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+
+        return (st.st_ino, st.st_mtime, st.st_size)
+
+
+class RedisSyncNotifier(BaseSyncNotifier):
+    """A notifier for processes on any host, using Redis pub/sub.
+
+    The notifier subscribes to a pattern matching all sync channels when the
+    first channel is listened to, and dispatches messages to the handlers
+    for each channel. Redis pub/sub connections aren't thread-safe, so the
+    connection is only used by the listener thread once it's started.
+
+    This requires the :pypi:`redis` package to be installed.
+    """
+
+    #: The prefix for all channels in Redis.
+    CHANNEL_PREFIX = 'djblets-sync:'
+
+    def __init__(self, url='redis://localhost:6379/0', client=None):
+        """Initialize the notifier.
+
+        Args:
+            url (unicode, optional):
+                The URL of the Redis server. This is ignored if ``client``
+                is provided.
+
+            client (redis.StrictRedis, optional):
+                An existing Redis client to use.
+
+        Raises:
+            django.core.exceptions.ImproperlyConfigured:
+                The :pypi:`redis` package is not installed.
+        """
+        super(RedisSyncNotifier, self).__init__()
+
+        if client is None:
+            if redis is None:
+                raise ImproperlyConfigured(
+                    'RedisSyncNotifier requires the redis package to be '
+                    'installed.')
+
+            client = redis.StrictRedis.from_url(url)
+
+        self.client = client
+
+        self._pubsub = None
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    @property
+    def is_connected(self):
+        """Whether the notifier is connected and receiving messages.
+
+        This is ``True`` while the listener thread is running.
+
+        Type:
+            bool
+        """
+        thread = self._thread
+
+        return thread is not None and thread.is_alive()
+
+    def publish(self, channel, message):
+        """Publish a message to all subscribers of a channel.
+
+        Args:
+            channel (unicode):
+                The channel to publish to.
+
+            message (unicode):
+                The message to publish.
+        """
+        self.client.publish(self.CHANNEL_PREFIX + channel, message)
+
+    def start_listening(self, channel):
+        """Begin receiving messages for a channel.
+
+        This starts the listener thread, if not already running. Messages
+        for all channels are received once it's running, so nothing else
+        needs to be done for new channels.
+
+        Args:
+            channel (unicode):
+                The channel to listen to.
+        """
+        with self._thread_lock:
+            if not self.is_connected:
+                # Any previous connection has failed, so start over with a
+                # new one. This is subscribed before the listener thread
+                # starts, and is never used outside of that thread again.
+                self._pubsub = self.client.pubsub(
+                    ignore_subscribe_messages=True)
+                self._pubsub.psubscribe(**{
+                    str(self.CHANNEL_PREFIX + '*'): self._on_message,
+                })
+
+                self.connection_id += 1
+                self._thread = threading.Thread(target=self._listen,
+                                                args=(self._pubsub,))
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _listen(self, pubsub):
+        """Listen for messages on all channels.
+
+        This runs in the listener thread. If the connection fails, the
+        thread will stop, and synchronizers will go back to polling the
+        cache until the next channel is subscribed.
+
+        Args:
+            pubsub (redis.client.PubSub):
+                The pub/sub connection to listen on.
+        """
+        try:
+            for item in pubsub.listen():
+                pass
+        except Exception as e:
+            logger.exception('Sync notification listener stopped due to an '
+                             'unexpected error: %s',
+                             e)
+
+    def _on_message(self, item):
+        """Handle a message from Redis.
+
+        Args:
+            item (dict):
+                The message information from Redis.
+        """
+        channel = item['channel']
+        message = item['data']
+
+        if isinstance(channel, bytes):
+            channel = channel.decode('utf-8')
+
+        if isinstance(message, bytes):
+            message = message.decode('utf-8')
+
+        self.dispatch(channel[len(self.CHANNEL_PREFIX):], message)
+
+
+def get_sync_notifier():
+    """Return the configured notifier for generation changes.
+
+    This is loaded from ``settings.CACHE_SYNC_NOTIFIER`` and
+    ``settings.CACHE_SYNC_NOTIFIER_OPTIONS`` the first time it's needed.
+
+    Returns:
+        BaseSyncNotifier:
+        The notifier, or ``None`` if one isn't configured.
+
+    Raises:
+        django.core.exceptions.ImproperlyConfigured:
+            The configured notifier could not be loaded.
+    """
+    global _notifier, _notifier_loaded
+
+    if not _notifier_loaded:
+        class_path = getattr(settings, 'CACHE_SYNC_NOTIFIER', None)
+
+        if class_path:
+            if isinstance(class_path, six.string_types):
+                mod_name, attr = str(class_path).rsplit(str('.'), 1)
+
+                try:
+                    notifier_cls = getattr(import_module(mod_name), attr)
+                except (AttributeError, ImportError) as e:
+                    raise ImproperlyConfigured(
+                        'settings.CACHE_SYNC_NOTIFIER %r could not be '
+                        'imported: %s'
+                        % (class_path, e))
+            else:
+                notifier_cls = class_path
+
+            _notifier = notifier_cls(
+                **getattr(settings, 'CACHE_SYNC_NOTIFIER_OPTIONS', {}))
+
+        _notifier_loaded = True
+
+    return _notifier
+
+
+def reset_sync_notifier():
+    """Reset the configured notifier.
+
+    The notifier will be loaded again from settings the next time it's
+    needed. Synchronizers that were already created will continue to use
+    the previous notifier.
+    """
+    global _notifier, _notifier_loaded
+
+    _notifier = None
+    _notifier_loaded = False
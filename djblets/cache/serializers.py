@@ -0,0 +1,475 @@
+"""Serializers for storing large data in the cache.
+
+Large data stored through :py:func:`~djblets.cache.backend.cache_memoize_iter`
+(and :py:func:`~djblets.cache.backend.cache_memoize` with ``large_data=True``)
+is serialized one item at a time into a single stream of bytes, which is then
+optionally compressed and split into chunks.
+
+The serializer used for an entry is recorded in the entry's main cache key,
+allowing call sites to choose a serializer suited to their data while still
+being able to read entries written with any other registered serializer.
+"""
+
+from __future__ import unicode_literals
+
+import json
+import marshal
+import struct
+
+from django.utils.six.moves import cPickle as pickle
+from django.utils.translation import ugettext_lazy as _
+
+from djblets.registries.registry import (ALREADY_REGISTERED,
+                                         ATTRIBUTE_REGISTERED,
+                                         DEFAULT_ERRORS,
+                                         Registry,
+                                         UNREGISTER)
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+_registry = None
+
+
+class BaseCacheSerializer(object):
+    """Base class for a serializer for large cached data.
+
+    Subclasses must set :py:attr:`serializer_id` and implement
+    :py:meth:`serialize` and :py:meth:`deserialize`.
+
+    By default, each serialized item is written as a frame prefixed with its
+    length, so that items can be read back one at a time from a stream.
+    Serializers for formats that are already self-delimiting can override
+    :py:meth:`dumps` and :py:meth:`load` instead.
+    """
+
+    #: The unique ID of the serializer.
+    #:
+    #: This is stored in the cache along with the data, and must not change.
+    serializer_id = None
+
+    _frame_header = struct.Struct(str('>I'))
+
+    def serialize(self, item):
+        """Serialize an item.
+
+        Args:
+            item (object):
+                The item to serialize.
+
+        Returns:
+            bytes:
+            The serialized data.
+        """
+        raise NotImplementedError
+
+    def deserialize(self, data):
+        """Deserialize an item.
+
+        Args:
+            data (bytes):
+                The data for the item, as returned by :py:meth:`serialize`.
+
+        Returns:
+            object:
+            The deserialized item.
+        """
+        raise NotImplementedError
+
+    def dumps(self, item):
+        """Return the data for an item to write to the stream.
+
+        Args:
+            item (object):
+                The item to serialize.
+
+        Returns:
+            bytes:
+            The data to write to the stream.
+        """
+        data = self.serialize(item)
+
+        return self._frame_header.pack(len(data)) + data
+
+    def load(self, fp):
+        """Load the next item from a stream.
+
+        Args:
+            fp (file):
+                The file-like object to read from.
+
+        Returns:
+            object:
+            The next item in the stream.
+
+        Raises:
+            EOFError:
+                There are no more items in the stream.
+        """
+        header = _read_exactly(fp, self._frame_header.size)
+
+        if not header:
+            raise EOFError
+
+        data_len = self._frame_header.unpack(header)[0]
+
+        return self.deserialize(_read_exactly(fp, data_len))
+
+
+class PickleSerializer(BaseCacheSerializer):
+    """Serializes items using pickle.
+
+    Pickle data is self-delimiting, so items are written to the stream
+    without any framing. This is compatible with data written by older
+    versions of Djblets.
+    """
+
+    def __init__(self, serializer_id, protocol):
+        """Initialize the serializer.
+
+        Args:
+            serializer_id (unicode):
+                The unique ID of the serializer.
+
+            protocol (int):
+                The pickle protocol to write data with. Any protocol supported
+                by the running version of Python can be read.
+        """
+        self.serializer_id = serializer_id
+        self.protocol = protocol
+
+    def dumps(self, item):
+        """Return the data for an item to write to the stream.
+
+        Args:
+            item (object):
+                The item to serialize.
+
+        Returns:
+            bytes:
+            The data to write to the stream.
+        """
+        return pickle.dumps(item, protocol=self.protocol)
+
+    def load(self, fp):
+        """Load the next item from a stream.
+
+        Args:
+            fp (file):
+                The file-like object to read from.
+
+        Returns:
+            object:
+            The next item in the stream.
+
+        Raises:
+            EOFError:
+                There are no more items in the stream.
+        """
+        return pickle.load(fp)
+
+
+class PickleBufferSerializer(BaseCacheSerializer):
+    """Serializes items using pickle protocol 5 with out-of-band buffers.
+
+    Large binary buffers within an item (such as :py:class:`bytearray` or
+    other objects supporting :pep:`574`) are written to the stream as raw
+    frames ahead of the pickle data, rather than being copied into the pickle
+    data itself.
+
+    This requires Python 3.8 or higher.
+    """
+
+    serializer_id = 'pickle-5'
+
+    _buffer_count_header = struct.Struct(str('>I'))
+    _buffer_header = struct.Struct(str('>Q'))
+
+    def dumps(self, item):
+        """Return the data for an item to write to the stream.
+
+        Args:
+            item (object):
+                The item to serialize.
+
+        Returns:
+            bytes:
+            The data to write to the stream.
+        """
+        buffers = []
+        data = pickle.dumps(item, protocol=5, buffer_callback=buffers.append)
+        parts = [self._buffer_count_header.pack(len(buffers))]
+
+        for buf in buffers:
+            raw = buf.raw()
+            parts += [self._buffer_header.pack(raw.nbytes), raw]
+
+        parts.append(data)
+
+        return b''.join(parts)
+
+    def load(self, fp):
+        """Load the next item from a stream.
+
+        Args:
+            fp (file):
+                The file-like object to read from.
+
+        Returns:
+            object:
+            The next item in the stream.
+
+        Raises:
+            EOFError:
+                There are no more items in the stream.
+        """
+        header = _read_exactly(fp, self._buffer_count_header.size)
+
+        if not header:
+            raise EOFError
+
+        buffers = []
+
+        for i in range(self._buffer_count_header.unpack(header)[0]):
+            buf_len = self._buffer_header.unpack(
+                _read_exactly(fp, self._buffer_header.size))[0]
+            buffers.append(_read_exactly(fp, buf_len))
+
+        return pickle.load(fp, buffers=buffers)
+
+
+class MarshalSerializer(BaseCacheSerializer):
+    """Serializes items using marshal.
+
+    This is fast and compact, but only supports built-in types, and data
+    written by one version of Python may not be readable by another.
+    """
+
+    serializer_id = 'marshal'
+
+    def serialize(self, item):
+        """Serialize an item.
+
+        Args:
+            item (object):
+                The item to serialize.
+
+        Returns:
+            bytes:
+            The serialized data.
+        """
+        return marshal.dumps(item)
+
+    def deserialize(self, data):
+        """Deserialize an item.
+
+        Args:
+            data (bytes):
+                The data for the item.
+
+        Returns:
+            object:
+            The deserialized item.
+        """
+        return marshal.loads(data)
+
+
+class JSONSerializer(BaseCacheSerializer):
+    """Serializes items using JSON.
+
+    Only JSON-compatible types are supported. Tuples will be loaded back as
+    lists.
+    """
+
+    serializer_id = 'json'
+
+    def serialize(self, item):
+        """Serialize an item.
+
+        Args:
+            item (object):
+                The item to serialize.
+
+        Returns:
+            bytes:
+            The serialized data.
+        """
+        return json.dumps(item, separators=(',', ':')).encode('utf-8')
+
+    def deserialize(self, data):
+        """Deserialize an item.
+
+        Args:
+            data (bytes):
+                The data for the item.
+
+        Returns:
+            object:
+            The deserialized item.
+        """
+        return json.loads(data.decode('utf-8'))
+
+
+class MsgpackSerializer(BaseCacheSerializer):
+    """Serializes items using msgpack.
+
+    This requires the :pypi:`msgpack` package to be installed.
+    """
+
+    serializer_id = 'msgpack'
+
+    def serialize(self, item):
+        """Serialize an item.
+
+        Args:
+            item (object):
+                The item to serialize.
+
+        Returns:
+            bytes:
+            The serialized data.
+        """
+        return msgpack.packb(item, use_bin_type=True)
+
+    def deserialize(self, data):
+        """Deserialize an item.
+
+        Args:
+            data (bytes):
+                The data for the item.
+
+        Returns:
+            object:
+            The deserialized item.
+        """
+        return msgpack.unpackb(data, raw=False)
+
+
+class CacheSerializersRegistry(Registry):
+    """A registry of serializers for large cached data."""
+
+    lookup_attrs = ('serializer_id',)
+
+    default_errors = dict(DEFAULT_ERRORS, **{
+        ALREADY_REGISTERED: _(
+            'Could not register cache serializer %(item)s: This serializer '
+            'is already registered or its ID conflicts with another '
+            'serializer.'
+        ),
+        ATTRIBUTE_REGISTERED: _(
+            'Could not register cache serializer %(item)s: Another '
+            'serializer (%(duplicate)s) is already registered with the same '
+            'ID.'
+        ),
+        UNREGISTER: _(
+            'Could not unregister cache serializer %(item)s: This serializer '
+            'was not yet registered.'
+        ),
+    })
+
+    def get_defaults(self):
+        """Return the default serializers for the registry.
+
+        Serializers depending on newer versions of Python or optional
+        packages will only be included if they're supported.
+
+        Returns:
+            list of BaseCacheSerializer:
+            The default serializers.
+        """
+        # Protocol 0 is the default, in order to be compatible across both
+        # Python 2 and 3. Protocol 2 is the highest supported by both.
+        serializers = [
+            PickleSerializer('pickle', protocol=0),
+            PickleSerializer('pickle-2', protocol=2),
+            MarshalSerializer(),
+            JSONSerializer(),
+        ]
+
+        if pickle.HIGHEST_PROTOCOL >= 4:
+            serializers.append(PickleSerializer('pickle-4', protocol=4))
+
+        if pickle.HIGHEST_PROTOCOL >= 5:
+            serializers.append(PickleBufferSerializer())
+
+        if msgpack is not None:
+            serializers.append(MsgpackSerializer())
+
+        return serializers
+
+    def get_serializer(self, serializer_id):
+        """Return the serializer with the given ID.
+
+        Args:
+            serializer_id (unicode):
+                The ID of the serializer.
+
+        Returns:
+            BaseCacheSerializer:
+            The serializer.
+
+        Raises:
+            djblets.registries.errors.ItemLookupError:
+                The serializer could not be found.
+        """
+        return self.get('serializer_id', serializer_id)
+
+
+def get_cache_serializers_registry():
+    """Return the registry of serializers for large cached data.
+
+    Returns:
+        CacheSerializersRegistry:
+        The registry of serializers.
+    """
+    global _registry
+
+    if _registry is None:
+        _registry = CacheSerializersRegistry()
+
+    return _registry
+
+
+def _read_exactly(fp, size):
+    """Read exactly the given number of bytes from a stream.
+
+    If the stream is already at its end, empty data will be returned.
+
+    Args:
+        fp (file):
+            The file-like object to read from.
+
+        size (int):
+            The number of bytes to read.
+
+    Returns:
+        bytes:
+        The data read from the stream.
+
+    Raises:
+        EOFError:
+            The stream ended partway through the requested data.
+    """
+    data = fp.read(size)
+
+    if data and len(data) < size:
+        # Some streams may return less data than requested, even if more is
+        # available.
+        parts = [data]
+        remaining = size - len(data)
+
+        while remaining > 0:
+            data = fp.read(remaining)
+
+            if not data:
+                raise EOFError('Unexpected end of cached data stream.')
+
+            parts.append(data)
+            remaining -= len(data)
+
+        data = b''.join(parts)
+
+    return data
@@ -4,20 +4,275 @@ These functions generate stable serial numbers based on the content shipped
 with the product (static media files, templates, locales). These can be used
 in various cache keys, ETags, and URLs to help keep content in cache until
 it changes on disk.
+
+Computing the media and AJAX serials requires finding the latest
+modification time of every file in the static media and template
+directories. To speed this up for large trees, the following settings can be
+used:
+
+``SERIAL_MANIFEST_FILE``:
+    The path to a file used to persist the modification times found in each
+    directory across restarts. On later scans, only directories whose own
+    modification times have changed will have their files re-read.
+
+    Note that a directory's modification time only changes when files are
+    added, removed, or renamed within it. Files modified in place (rather
+    than replaced) won't be noticed until the manifest is deleted.
+
+``SERIAL_SCAN_THREADS``:
+    The number of threads used to scan directories (or, for locale serials,
+    packages) in parallel. This defaults to 1, scanning in the calling
+    thread. This requires :py:mod:`concurrent.futures`.
+
+Serials are computed once per process. Calling the serial-generation
+functions during startup, before a server forks its worker processes, allows
+the workers to inherit the serials rather than computing them again.
 """
 
 from __future__ import unicode_literals
 
 import importlib
+import json
 import logging
 import os
+import tempfile
+import threading
 
 from django.conf import settings
+from django.utils import six
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        # Python 2.7, with the scandir backport.
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # Python 2.7, without the futures backport.
+    ThreadPoolExecutor = None
 
 
 logger = logging.getLogger(__name__)
 
 
+#: The version of the format used for the serial manifest file.
+SERIAL_MANIFEST_VERSION = 2
+
+
+# Guards reading, updating, and writing the manifest file within this
+# process, so that threads don't discard each other's sections.
+_manifest_lock = threading.Lock()
+
+# Locale serials already computed in this process, keyed by the tuple of
+# packages. These are inherited by forked processes.
+_locale_serials = {}
+
+
+def _scan_directory(path, old_entry, file_filter):
+    """Scan a directory for the latest modification time of its files.
+
+    If the directory's modification time matches that in ``old_entry``, the
+    old entry will be returned without reading any files.
+
+    Returns:
+        list:
+        A manifest entry for the directory, containing the directory's
+        modification time, the latest modification time of its files, and
+        the names of its subdirectories. This will be ``None`` if the
+        directory doesn't exist.
+    """
+    try:
+        dir_mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+
+    if old_entry is not None and old_entry[0] == dir_mtime:
+        return old_entry
+
+    latest_mtime = 0
+    subdirs = []
+
+    try:
+        if scandir is not None:
+            # Directory entries come with their types, so only the files
+            # need to be stat'd.
+            entries = [
+                (entry.name, entry.is_dir(), entry.is_symlink, entry.stat)
+                for entry in scandir(path)
+            ]
+        else:
+            entries = []
+
+            for name in os.listdir(path):
+                file_path = os.path.join(path, name)
+                entries.append((name,
+                                os.path.isdir(file_path),
+                                lambda p=file_path: os.path.islink(p),
+                                lambda p=file_path: os.stat(p)))
+    except OSError as e:
+        logger.warning('Unable to scan directory %s for serials: %s',
+                       path, e)
+        return None
+
+    for name, is_dir, is_symlink, stat in entries:
+        if is_dir:
+            # Like os.walk, don't descend into symlinked directories.
+            if not is_symlink():
+                subdirs.append(name)
+        elif file_filter is None or file_filter(name):
+            try:
+                latest_mtime = max(latest_mtime, int(stat().st_mtime))
+            except OSError:
+                # This is likely a broken symlink.
+                pass
+
+    return [dir_mtime, latest_mtime, sorted(subdirs)]
+
+
+def _load_serial_manifest(manifest_file):
+    """Load the serial manifest file.
+
+    Returns:
+        dict:
+        The manifest's sections. This will be empty if the file doesn't exist
+        or can't be read.
+    """
+    try:
+        with open(manifest_file, 'r') as fp:
+            manifest = json.load(fp)
+    except (IOError, OSError, ValueError):
+        return {}
+
+    if (not isinstance(manifest, dict) or
+        manifest.get('version') != SERIAL_MANIFEST_VERSION):
+        return {}
+
+    return manifest.get('sections', {})
+
+
+def _save_serial_manifest(manifest_file, sections):
+    """Save the serial manifest file.
+
+    The file is written atomically, so that other processes never read a
+    partially-written manifest.
+    """
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_file))
+
+    try:
+        fd, temp_path = tempfile.mkstemp(dir=manifest_dir,
+                                         prefix='.serial-manifest')
+
+        with os.fdopen(fd, 'w') as fp:
+            json.dump({
+                'version': SERIAL_MANIFEST_VERSION,
+                'sections': sections,
+            }, fp)
+
+        getattr(os, 'replace', os.rename)(temp_path, manifest_file)
+    except (IOError, OSError) as e:
+        logger.warning('Unable to save the serial manifest file %s: %s',
+                       manifest_file, e)
+
+
+def get_latest_mtime(paths, section, file_filter=None, section_key=None,
+                     num_threads=None):
+    """Return the latest modification time of files in directory trees.
+
+    Directories are scanned level by level, optionally across several
+    threads (see ``settings.SERIAL_SCAN_THREADS``). If
+    ``settings.SERIAL_MANIFEST_FILE`` is set, the results will be persisted,
+    and only directories that have changed since the last scan will have
+    their files re-read.
+
+    Args:
+        paths (list of unicode):
+            The paths to the directory trees to scan.
+
+        section (unicode):
+            The name of the section of the manifest file used for these
+            results. Each type of serial should use its own section.
+
+        file_filter (callable, optional):
+            A function taking a filename and returning whether it should be
+            included. By default, all files are included.
+
+        section_key (unicode, optional):
+            A value identifying what was scanned, such as a package version.
+            If this differs from the value stored with the section, the
+            stored results will be discarded and every directory re-read.
+
+        num_threads (int, optional):
+            The number of threads used to scan directories. This defaults to
+            ``settings.SERIAL_SCAN_THREADS``, or 1.
+
+    Returns:
+        int:
+        The latest modification time, or 0 if there were no files.
+    """
+    manifest_file = getattr(settings, 'SERIAL_MANIFEST_FILE', None)
+
+    if num_threads is None:
+        num_threads = getattr(settings, 'SERIAL_SCAN_THREADS', 1)
+
+    old_entries = {}
+
+    if manifest_file:
+        old_section = _load_serial_manifest(manifest_file).get(section)
+
+        if old_section and old_section.get('key') == section_key:
+            old_entries = old_section.get('entries', {})
+
+    new_entries = {}
+    pending = list(paths)
+
+    if num_threads > 1 and ThreadPoolExecutor is not None:
+        executor = ThreadPoolExecutor(max_workers=num_threads)
+        map_func = executor.map
+    else:
+        executor = None
+        map_func = map
+
+    try:
+        while pending:
+            entries = list(map_func(
+                lambda path: _scan_directory(path, old_entries.get(path),
+                                             file_filter),
+                pending))
+            next_pending = []
+
+            for path, entry in zip(pending, entries):
+                if entry is not None:
+                    new_entries[path] = entry
+                    next_pending += [
+                        os.path.join(path, name)
+                        for name in entry[2]
+                    ]
+
+            pending = next_pending
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if manifest_file and new_entries != old_entries:
+        with _manifest_lock:
+            sections = _load_serial_manifest(manifest_file)
+            sections[section] = {
+                'key': section_key,
+                'entries': new_entries,
+            }
+            _save_serial_manifest(manifest_file, sections)
+
+    return max([0] + [
+        entry[1]
+        for entry in new_entries.values()
+    ])
+
+
 def generate_media_serial():
     """Generate a media serial number for static media files.
 
@@ -30,21 +285,19 @@ def generate_media_serial():
     :setting:`MEDIA_SERIAL_DIRS` if specified, or all of
     :django:setting:`STATIC_ROOT` otherwise), figuring out the latest
     timestamp, and return that value.
+
+    See the module documentation for settings that speed up the crawl.
     """
     MEDIA_SERIAL = getattr(settings, "MEDIA_SERIAL", 0)
 
     if not MEDIA_SERIAL:
         media_dirs = getattr(settings, "MEDIA_SERIAL_DIRS", ["."])
-
-        for media_dir in media_dirs:
-            media_path = os.path.join(settings.STATIC_ROOT, media_dir)
-
-            for root, dirs, files in os.walk(media_path):
-                for name in files:
-                    mtime = int(os.stat(os.path.join(root, name)).st_mtime)
-
-                    if mtime > MEDIA_SERIAL:
-                        MEDIA_SERIAL = mtime
+        MEDIA_SERIAL = get_latest_mtime(
+            [
+                os.path.join(settings.STATIC_ROOT, media_dir)
+                for media_dir in media_dirs
+            ],
+            section='media')
 
         setattr(settings, "MEDIA_SERIAL", MEDIA_SERIAL)
 
@@ -59,19 +312,14 @@ def generate_ajax_serial():
     This will crawl the template files (using directories in
     :django:setting:`TEMPLATE_DIRS`), figuring out the latest timestamp, and
     return that value.
+
+    See the module documentation for settings that speed up the crawl.
     """
     AJAX_SERIAL = getattr(settings, "AJAX_SERIAL", 0)
 
     if not AJAX_SERIAL:
         template_dirs = getattr(settings, "TEMPLATE_DIRS", ["."])
-
-        for template_path in template_dirs:
-            for root, dirs, files in os.walk(template_path):
-                for name in files:
-                    mtime = int(os.stat(os.path.join(root, name)).st_mtime)
-
-                    if mtime > AJAX_SERIAL:
-                        AJAX_SERIAL = mtime
+        AJAX_SERIAL = get_latest_mtime(template_dirs, section='ajax')
 
         setattr(settings, "AJAX_SERIAL", AJAX_SERIAL)
 
@@ -83,7 +331,13 @@ def generate_locale_serial(packages):
     contribute to the localization of the given packages.
 
     Unlike the other serial-generation functions, this will return the
-    value, rather than setting it on ``settings``.
+    value, rather than setting it on ``settings``. The value is computed
+    once per process for each set of packages.
+
+    The packages are scanned in parallel when ``settings.SERIAL_SCAN_THREADS``
+    is set. If ``settings.SERIAL_MANIFEST_FILE`` is set, the results for each
+    package are persisted along with the package's version, and reused by
+    later processes until the version or the locale directories change.
 
     Args:
         packages (list of unicode):
@@ -93,30 +347,66 @@ def generate_locale_serial(packages):
     Returns:
         int: The resulting serial number.
     """
-    serial = 0
+    packages = tuple(packages)
+
+    try:
+        return _locale_serials[packages]
+    except KeyError:
+        pass
+
+    num_threads = min(getattr(settings, 'SERIAL_SCAN_THREADS', 1),
+                      len(packages))
+
+    if num_threads > 1 and ThreadPoolExecutor is not None:
+        executor = ThreadPoolExecutor(max_workers=num_threads)
 
-    paths = []
-    for package in packages:
         try:
-            p = importlib.import_module(package)
-            path = os.path.join(os.path.dirname(p.__file__), 'locale')
-            paths.append(path)
-        except Exception as e:
-            logger.exception(
-                'Failed to import package %s to compute locale serial: %s',
-                package, e)
-
-    for locale_path in paths:
-        for root, dirs, files in os.walk(locale_path):
-            for name in files:
-                if name.endswith('.mo'):
-                    mtime = int(os.stat(os.path.join(root, name)).st_mtime)
-                    if mtime > serial:
-                        serial = mtime
+            package_serials = list(executor.map(_get_package_locale_serial,
+                                                packages))
+        finally:
+            executor.shutdown()
+    else:
+        package_serials = [
+            _get_package_locale_serial(package)
+            for package in packages
+        ]
+
+    serial = max([0] + package_serials)
+    _locale_serials[packages] = serial
 
     return serial
 
 
+def _get_package_locale_serial(package):
+    """Return the locale serial for a single package.
+
+    Returns:
+        int:
+        The most recent mtime of the package's .mo files, or 0 if the package
+        couldn't be imported.
+    """
+    try:
+        p = importlib.import_module(package)
+        path = os.path.join(os.path.dirname(p.__file__), 'locale')
+    except Exception as e:
+        logger.exception(
+            'Failed to import package %s to compute locale serial: %s',
+            package, e)
+        return 0
+
+    version = getattr(p, '__version__', None) or getattr(p, 'VERSION', None)
+
+    if version is not None:
+        version = six.text_type(version)
+
+    return get_latest_mtime(
+        [path],
+        section='locale:%s' % package,
+        section_key=version,
+        file_filter=lambda name: name.endswith('.mo'),
+        num_threads=1)
+
+
 def generate_cache_serials():
     """Generate both static media and AJAX serial numbers.
 
@@ -0,0 +1,92 @@
+"""Signals for instrumenting cache operations.
+
+These are emitted by :py:mod:`djblets.cache.backend` and
+:py:mod:`djblets.cache.synchronizer`. See :py:mod:`djblets.cache.stats` for
+aggregating them into statistics.
+"""
+
+from __future__ import unicode_literals
+
+from django.dispatch import Signal
+
+
+#: Emitted when a memoized value is found in the cache.
+#:
+#: Args:
+#:     key (unicode):
+#:         The base key of the value.
+#:
+#:     key_prefix (unicode):
+#:         The prefix of the key that statistics are grouped by.
+#:
+#:     source (unicode):
+#:         Where the value was found. This is ``'cache'`` for the configured
+#:         cache, or ``'local'`` for a process-local cache.
+#:
+#:     chunk_count (int):
+#:         The number of chunks the value was stored in, for large data.
+#:
+#:     data_size (int):
+#:         The size of the stored data, in bytes, for large data.
+#:
+#:     decompress_time (float):
+#:         The time spent decompressing the data, in seconds, for large data.
+cache_hit = Signal(providing_args=['key', 'key_prefix', 'source',
+                                   'chunk_count', 'data_size',
+                                   'decompress_time'])
+
+
+#: Emitted when a memoized value is not found in the cache.
+#:
+#: Args:
+#:     key (unicode):
+#:         The base key of the value.
+#:
+#:     key_prefix (unicode):
+#:         The prefix of the key that statistics are grouped by.
+cache_miss = Signal(providing_args=['key', 'key_prefix'])
+
+
+#: Emitted when a memoized value has been computed and stored in the cache.
+#:
+#: Args:
+#:     key (unicode):
+#:         The base key of the value.
+#:
+#:     key_prefix (unicode):
+#:         The prefix of the key that statistics are grouped by.
+#:
+#:     recompute_time (float):
+#:         The time spent computing and storing the value, in seconds.
+#:
+#:     chunk_count (int):
+#:         The number of chunks the value was stored in, for large data.
+#:
+#:     data_size (int):
+#:         The size of the stored data, in bytes, for large data.
+#:
+#:     compress_time (float):
+#:         The time spent compressing the data, in seconds, for large data.
+cache_recomputed = Signal(providing_args=['key', 'key_prefix',
+                                          'recompute_time', 'chunk_count',
+                                          'data_size', 'compress_time'])
+
+
+#: Emitted when a generation synchronizer checks whether it's expired.
+#:
+#: Args:
+#:     key (unicode):
+#:         The base synchronization cache key, before normalization.
+#:
+#:     key_prefix (unicode):
+#:         The prefix of the key that statistics are grouped by.
+#:
+#:     source (unicode):
+#:         Where the generation was read from. This is ``'cache'``,
+#:         ``'batch'`` for a batch of generation checks, or ``'notifier'``
+#:         for a notifier.
+#:
+#:     expired (bool):
+#:         Whether the synchronizer was expired.
+generation_checked = Signal(providing_args=['key', 'key_prefix', 'source',
+                                            'expired'])
@@ -0,0 +1,438 @@
+"""Statistics on cache operations.
+
+Operations performed by :py:mod:`djblets.cache.backend` and
+:py:mod:`djblets.cache.synchronizer` are recorded as events, grouped by the
+prefix of the key involved (see :py:func:`get_cache_key_prefix`). Each event
+is:
+
+* Emitted through the signals in :py:mod:`djblets.cache.signals`.
+* Passed to the configured stats sink, if any.
+* Added to the statistics for the current HTTP request, if being collected.
+
+A stats sink can be configured by setting ``settings.CACHE_STATS_SINK`` to
+the class path of a sink, and ``settings.CACHE_STATS_SINK_OPTIONS`` to a
+dictionary of keyword arguments for it. For example:
+
+.. code-block:: python
+
+   CACHE_STATS_SINK = 'djblets.cache.stats.MemoryCacheStatsSink'
+
+Statistics for each HTTP request can be logged by
+:py:class:`~djblets.log.middleware.LoggingMiddleware` by setting
+``settings.LOGGING_CACHE_STATS`` to ``True``.
+"""
+
+from __future__ import unicode_literals
+
+import re
+import threading
+from importlib import import_module
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import six
+
+from djblets.cache.signals import (cache_hit, cache_miss, cache_recomputed,
+                                   generation_checked)
+
+
+#: An event for a value found in the cache.
+EVENT_HIT = 'hit'
+
+#: An event for a value not found in the cache.
+EVENT_MISS = 'miss'
+
+#: An event for a value computed and stored in the cache.
+EVENT_RECOMPUTED = 'recomputed'
+
+#: An event for a generation synchronizer checking whether it's expired.
+EVENT_GENERATION_CHECKED = 'generation-checked'
+
+
+_EVENT_SIGNALS = {
+    EVENT_HIT: cache_hit,
+    EVENT_MISS: cache_miss,
+    EVENT_RECOMPUTED: cache_recomputed,
+    EVENT_GENERATION_CHECKED: generation_checked,
+}
+
+_KEY_PREFIX_RE = re.compile(r'^[^:\-/]*')
+
+_sink = None
+_sink_loaded = False
+_request_local = threading.local()
+
+
+class CacheStats(object):
+    """Aggregated statistics on cache operations.
+
+    Attributes:
+        hits (int):
+            The number of values found in the cache.
+
+        local_hits (int):
+            The number of values found in a process-local cache. These are
+            also counted in :py:attr:`hits`.
+
+        misses (int):
+            The number of values not found in the cache.
+
+        recomputes (int):
+            The number of values computed and stored in the cache.
+
+        chunk_count (int):
+            The number of chunks of large data read and written.
+
+        data_size (int):
+            The number of bytes of large data read and written.
+
+        compress_time (float):
+            The time spent compressing large data, in seconds.
+
+        decompress_time (float):
+            The time spent decompressing large data, in seconds.
+
+        recompute_time (float):
+            The time spent computing and storing values, in seconds.
+
+        generation_checks (int):
+            The number of expiration checks made by generation
+            synchronizers.
+
+        generation_cache_checks (int):
+            The number of expiration checks that had to read from the cache.
+
+        generations_expired (int):
+            The number of expiration checks that found the synchronizer to be
+            expired.
+    """
+
+    def __init__(self):
+        """Initialize the statistics."""
+        self.hits = 0
+        self.local_hits = 0
+        self.misses = 0
+        self.recomputes = 0
+        self.chunk_count = 0
+        self.data_size = 0
+        self.compress_time = 0.0
+        self.decompress_time = 0.0
+        self.recompute_time = 0.0
+        self.generation_checks = 0
+        self.generation_cache_checks = 0
+        self.generations_expired = 0
+
+    @property
+    def hit_ratio(self):
+        """The ratio of hits to all lookups, or ``None`` if there were none.
+
+        Type:
+            float
+        """
+        lookups = self.hits + self.misses
+
+        if lookups == 0:
+            return None
+
+        return float(self.hits) / lookups
+
+    def record(self, event, values):
+        """Record an event.
+
+        Args:
+            event (unicode):
+                The type of event.
+
+            values (dict):
+                The values recorded for the event. See
+                :py:mod:`djblets.cache.signals` for the values provided for
+                each event.
+        """
+        if event == EVENT_HIT:
+            self.hits += 1
+
+            if values.get('source') == 'local':
+                self.local_hits += 1
+        elif event == EVENT_MISS:
+            self.misses += 1
+        elif event == EVENT_RECOMPUTED:
+            self.recomputes += 1
+            self.recompute_time += values.get('recompute_time', 0)
+            self.compress_time += values.get('compress_time', 0)
+        elif event == EVENT_GENERATION_CHECKED:
+            self.generation_checks += 1
+
+            if values.get('source') == 'cache':
+                self.generation_cache_checks += 1
+
+            if values.get('expired'):
+                self.generations_expired += 1
+
+        self.chunk_count += values.get('chunk_count', 0)
+        self.data_size += values.get('data_size', 0)
+        self.decompress_time += values.get('decompress_time', 0)
+
+    def merge(self, stats):
+        """Add the counts from other statistics to these statistics.
+
+        Args:
+            stats (CacheStats):
+                The statistics to add.
+        """
+        for name, value in six.iteritems(vars(stats)):
+            setattr(self, name, getattr(self, name) + value)
+
+    def to_dict(self):
+        """Return the statistics as a dictionary.
+
+        Returns:
+            dict:
+            The statistics.
+        """
+        return {
+            'hits': self.hits,
+            'local_hits': self.local_hits,
+            'misses': self.misses,
+            'hit_ratio': self.hit_ratio,
+            'recomputes': self.recomputes,
+            'chunk_count': self.chunk_count,
+            'data_size': self.data_size,
+            'compress_time': self.compress_time,
+            'decompress_time': self.decompress_time,
+            'recompute_time': self.recompute_time,
+            'generation_checks': self.generation_checks,
+            'generation_cache_checks': self.generation_cache_checks,
+            'generations_expired': self.generations_expired,
+        }
+
+    def __str__(self):
+        """Return a summary of the statistics.
+
+        Returns:
+            unicode:
+            The summary.
+        """
+        return (
+            '%d hits (%d local), %d misses, %d recomputes (%.3fs), '
+            '%d chunks (%d bytes), %d generation checks (%d from cache)'
+            % (self.hits, self.local_hits, self.misses, self.recomputes,
+               self.recompute_time, self.chunk_count, self.data_size,
+               self.generation_checks, self.generation_cache_checks))
+
+
+class BaseCacheStatsSink(object):
+    """Base class for a sink receiving cache events.
+
+    Subclasses must implement :py:meth:`record`. This may be called from
+    many threads at once.
+    """
+
+    def record(self, event, key_prefix, values):
+        """Record an event.
+
+        Args:
+            event (unicode):
+                The type of event.
+
+            key_prefix (unicode):
+                The prefix of the key involved.
+
+            values (dict):
+                The values recorded for the event. See
+                :py:mod:`djblets.cache.signals` for the values provided for
+                each event.
+        """
+        raise NotImplementedError
+
+
+class MemoryCacheStatsSink(BaseCacheStatsSink):
+    """A sink aggregating statistics in memory for each key prefix.
+
+    The statistics can be retrieved through :py:meth:`get_stats`, for
+    reporting or exporting to a monitoring system.
+    """
+
+    def __init__(self):
+        """Initialize the sink."""
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, event, key_prefix, values):
+        """Record an event.
+
+        Args:
+            event (unicode):
+                The type of event.
+
+            key_prefix (unicode):
+                The prefix of the key involved.
+
+            values (dict):
+                The values recorded for the event.
+        """
+        with self._lock:
+            try:
+                stats = self._stats[key_prefix]
+            except KeyError:
+                stats = CacheStats()
+                self._stats[key_prefix] = stats
+
+            stats.record(event, values)
+
+    def get_stats(self):
+        """Return the statistics for each key prefix.
+
+        Returns:
+            dict:
+            A dictionary mapping key prefixes to dictionaries of statistics
+            (see :py:meth:`CacheStats.to_dict`).
+        """
+        with self._lock:
+            return {
+                key_prefix: stats.to_dict()
+                for key_prefix, stats in six.iteritems(self._stats)
+            }
+
+    def reset(self):
+        """Reset all statistics."""
+        with self._lock:
+            self._stats = {}
+
+
+def get_cache_key_prefix(key):
+    """Return the prefix of a key that statistics are grouped by.
+
+    This is the part of the key before the first ``:``, ``-``, or ``/``.
+
+    Args:
+        key (unicode):
+            The base key.
+
+    Returns:
+        unicode:
+        The prefix of the key.
+    """
+    if isinstance(key, bytes):
+        key = key.decode('utf-8')
+
+    return _KEY_PREFIX_RE.match(key).group(0)
+
+
+def record_cache_event(event, key, **values):
+    """Record a cache event.
+
+    The event will be emitted as a signal, passed to the configured stats
+    sink, and added to the statistics for the current request, as
+    applicable. If none of these are in use, this does nothing.
+
+    Args:
+        event (unicode):
+            The type of event.
+
+        key (unicode):
+            The key involved.
+
+        **values (dict):
+            The values recorded for the event. See
+            :py:mod:`djblets.cache.signals` for the values provided for each
+            event.
+    """
+    sink = get_cache_stats_sink()
+    request_stats = getattr(_request_local, 'stats', None)
+    signal = _EVENT_SIGNALS[event]
+
+    if sink is None and request_stats is None and not signal.receivers:
+        return
+
+    key_prefix = get_cache_key_prefix(key)
+
+    if sink is not None:
+        sink.record(event, key_prefix, values)
+
+    if request_stats is not None:
+        try:
+            stats = request_stats[key_prefix]
+        except KeyError:
+            stats = CacheStats()
+            request_stats[key_prefix] = stats
+
+        stats.record(event, values)
+
+    if signal.receivers:
+        signal.send(sender=None, key=key, key_prefix=key_prefix, **values)
+
+
+def begin_request_stats():
+    """Begin collecting statistics for the current request.
+
+    Statistics are collected for operations made in the current thread,
+    until :py:func:`end_request_stats` is called.
+    """
+    _request_local.stats = {}
+
+
+def end_request_stats():
+    """Finish collecting statistics for the current request.
+
+    Returns:
+        dict:
+        A dictionary mapping key prefixes to :py:class:`CacheStats`, or
+        ``None`` if statistics weren't being collected.
+    """
+    stats = getattr(_request_local, 'stats', None)
+    _request_local.stats = None
+
+    return stats
+
+
+def get_cache_stats_sink():
+    """Return the configured stats sink.
+
+    This is loaded from ``settings.CACHE_STATS_SINK`` and
+    ``settings.CACHE_STATS_SINK_OPTIONS`` the first time it's needed.
+
+    Returns:
+        BaseCacheStatsSink:
+        The stats sink, or ``None`` if one isn't configured.
+
+    Raises:
+        django.core.exceptions.ImproperlyConfigured:
+            The configured stats sink could not be loaded.
+    """
+    global _sink, _sink_loaded
+
+    if not _sink_loaded:
+        class_path = getattr(settings, 'CACHE_STATS_SINK', None)
+
+        if class_path:
+            if isinstance(class_path, six.string_types):
+                mod_name, attr = str(class_path).rsplit(str('.'), 1)
+
+                try:
+                    sink_cls = getattr(import_module(mod_name), attr)
+                except (AttributeError, ImportError) as e:
+                    raise ImproperlyConfigured(
+                        'settings.CACHE_STATS_SINK %r could not be '
+                        'imported: %s'
+                        % (class_path, e))
+            else:
+                sink_cls = class_path
+
+            _sink = sink_cls(
+                **getattr(settings, 'CACHE_STATS_SINK_OPTIONS', {}))
+
+        _sink_loaded = True
+
+    return _sink
+
+
+def reset_cache_stats_sink():
+    """Reset the configured stats sink.
+
+    The stats sink will be loaded again from settings the next time it's
+    needed.
+    """
+    global _sink, _sink_loaded
+
+    _sink = None
+    _sink_loaded = False
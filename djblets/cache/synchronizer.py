@@ -1,10 +1,167 @@
+"""Synchronization of generation state across processes."""
+
 from __future__ import unicode_literals
 
+import logging
+import threading
 import time
+import weakref
 from datetime import datetime
 
+from django.conf import settings
 from django.core.cache import cache
+from django.utils.encoding import force_text
+
 from djblets.cache.backend import make_cache_key
+from djblets.cache.notifiers import get_sync_notifier
+from djblets.cache.stats import EVENT_GENERATION_CHECKED, record_cache_event
+
+
+# The default minimum amount of time, in seconds, between batched fetches of
+# all synchronization generation IDs. This can be overridden with the
+# CACHE_GENERATION_SYNC_INTERVAL setting.
+DEFAULT_GENERATION_SYNC_INTERVAL = 0
+
+
+logger = logging.getLogger(__name__)
+
+
+_registry = None
+
+
+class GenerationSynchronizerRegistry(object):
+    """Tracks synchronizers, for checking their generations in a batch.
+
+    Each :py:class:`GenerationSynchronizer` registers itself here when
+    created. Rather than having each synchronizer fetch its generation from
+    the cache when checking for expiration, :py:meth:`begin_batch` can fetch
+    the generations for all synchronizers at once, in a single request. Any
+    checks made in the same thread will then use those generations, until
+    :py:meth:`end_batch` is called.
+
+    This is normally managed by
+    :py:class:`~djblets.cache.middleware.GenerationSyncMiddleware`, which
+    batches the checks for each HTTP request.
+
+    If ``settings.CACHE_GENERATION_SYNC_INTERVAL`` is set, generations will
+    be fetched at most once per that many seconds, with batches in between
+    sharing the last fetched generations. This trades a small delay in
+    noticing changes from other processes for fewer cache requests.
+    """
+
+    def __init__(self):
+        """Initialize the registry."""
+        self._synchronizers = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shared_generations = None
+        self._shared_fetched_at = None
+
+    def register(self, synchronizer):
+        """Register a synchronizer.
+
+        Synchronizers are held by weak reference, and will be removed once
+        they're no longer used.
+
+        Args:
+            synchronizer (GenerationSynchronizer):
+                The synchronizer to register.
+        """
+        with self._lock:
+            self._synchronizers.add(synchronizer)
+
+    def unregister(self, synchronizer):
+        """Unregister a synchronizer.
+
+        Args:
+            synchronizer (GenerationSynchronizer):
+                The synchronizer to unregister.
+        """
+        with self._lock:
+            self._synchronizers.discard(synchronizer)
+
+    def begin_batch(self):
+        """Begin a batch of generation checks in this thread.
+
+        The generations for all registered synchronizers will be fetched
+        from the cache in a single request, unless they've been fetched
+        within the configured interval.
+        """
+        interval = getattr(settings, 'CACHE_GENERATION_SYNC_INTERVAL',
+                           DEFAULT_GENERATION_SYNC_INTERVAL)
+        now = time.time()
+        generations = self._shared_generations
+
+        if (generations is None or
+            interval <= 0 or
+            now - self._shared_fetched_at >= interval):
+            with self._lock:
+                # Synchronizers receiving changes through a notifier don't
+                # need to check the cache.
+                cache_keys = set(
+                    synchronizer.cache_key
+                    for synchronizer in self._synchronizers
+                    if not synchronizer._is_notified()
+                )
+
+            generations = dict.fromkeys(cache_keys)
+
+            if cache_keys:
+                generations.update(cache.get_many(list(cache_keys)))
+
+            self._shared_generations = generations
+            self._shared_fetched_at = now
+
+        self._local.generations = generations
+
+    def end_batch(self):
+        """End the current batch of generation checks in this thread.
+
+        Checks made after this will fetch their generation from the cache
+        directly.
+        """
+        self._local.generations = None
+
+    def get_generation(self, cache_key):
+        """Return a generation from the current batch.
+
+        Args:
+            cache_key (unicode):
+                The synchronization cache key.
+
+        Returns:
+            tuple:
+            A 2-tuple of:
+
+            1. Whether the generation is part of the current batch
+               (:py:class:`bool`).
+            2. The generation, or ``None`` if it's not in the cache
+               (:py:class:`int`).
+        """
+        generations = getattr(self._local, 'generations', None)
+
+        if generations is None or cache_key not in generations:
+            return False, None
+
+        return True, generations[cache_key]
+
+    def set_generation(self, cache_key, sync_gen):
+        """Update a generation in the current batch.
+
+        This is called when a synchronizer changes its generation, so that
+        checks in the rest of the batch see the change.
+
+        Args:
+            cache_key (unicode):
+                The synchronization cache key.
+
+            sync_gen (int):
+                The new generation, or ``None`` if it was cleared.
+        """
+        generations = getattr(self._local, 'generations', None)
+
+        if generations is not None and cache_key in generations:
+            generations[cache_key] = sync_gen
 
 
 class GenerationSynchronizer(object):
@@ -29,6 +186,11 @@ class GenerationSynchronizer(object):
     then call :py:meth:`refresh` to refresh the instance's counter from the
     cache.
 
+    If a notifier is configured (see :py:mod:`djblets.cache.notifiers`),
+    generation changes are also published to other processes as they're
+    made, and :py:meth:`is_expired` won't need to check the cache while the
+    notifier is connected.
+
     Attributes:
         sync_gen (int):
             The synchronization generation number last fetched or set by
@@ -38,7 +200,7 @@ class GenerationSynchronizer(object):
             The synchronization cache key.
     """
 
-    def __init__(self, cache_key, normalize_cache_key=True):
+    def __init__(self, cache_key, normalize_cache_key=True, notifier=None):
         """Initialize the synchronizer.
 
         Args:
@@ -52,27 +214,75 @@ class GenerationSynchronizer(object):
                 ensure it can fit within the key length constraints, and
                 reduces changes of colliding with keys from other services.
                 This is enabled by default.
+
+            notifier (djblets.cache.notifiers.BaseSyncNotifier, optional):
+                The notifier used to publish and receive generation changes.
+                This defaults to the notifier returned by
+                :py:func:`~djblets.cache.notifiers.get_sync_notifier`, if
+                any.
         """
+        # Statistics are grouped by the prefix of the base key, rather than
+        # the site prefix added when normalizing.
+        self._stats_key = cache_key
+
         if normalize_cache_key:
             cache_key = make_cache_key(cache_key)
 
+        if notifier is None:
+            notifier = get_sync_notifier()
+
         self.cache_key = cache_key
         self.sync_gen = None
 
+        self._notifier = notifier
+        self._notifier_connection_id = None
+        self._notification_count = 0
+        self._latest_sync_gen = None
+
+        if notifier is not None:
+            # Subscribe before fetching the generation, so that no changes
+            # can be missed in between. The notifier only holds a weak
+            # reference to the handler, so we need to hold onto it.
+            self._channel = force_text(cache_key)
+            self._notification_handler = self._on_notification
+            notifier.subscribe(self._channel, self._notification_handler)
+
         self._fetch_or_create_sync_gen()
 
+        get_generation_synchronizer_registry().register(self)
+
     def is_expired(self):
         """Return whether the current state has expired.
 
+        If a notifier is connected, the latest generation it received will be
+        used, rather than fetching it from the cache. The cache will only be
+        checked the first time after the notifier connects.
+
+        Otherwise, if a batch of generation checks is in progress (see
+        :py:class:`GenerationSynchronizerRegistry`), the generation fetched
+        for the batch will be used.
+
         Returns:
             bool:
             ``True`` if the state has expired. ``False`` if this has the
             latest cached generation.
         """
-        sync_gen = self._get_latest_sync_gen()
+        if self._is_notified():
+            sync_gen = self._latest_sync_gen
+            source = 'notifier'
+        else:
+            check_state = self._get_notifier_state()
+            sync_gen, source = self._get_latest_sync_gen()
+            self._on_cache_checked(check_state, sync_gen)
 
-        return (sync_gen is None or
-                (type(sync_gen) is int and sync_gen != self.sync_gen))
+        expired = (sync_gen is None or
+                   (type(sync_gen) is int and sync_gen != self.sync_gen))
+
+        record_cache_event(EVENT_GENERATION_CHECKED, self._stats_key,
+                           source=source,
+                           expired=expired)
+
+        return expired
 
     def refresh(self):
         """Refresh the generation ID from cache.
@@ -88,6 +298,8 @@ class GenerationSynchronizer(object):
         re-fetch and store the cache state.
         """
         cache.delete(self.cache_key)
+        self._set_latest_sync_gen(None)
+        self._publish('')
 
     def mark_updated(self):
         """Mark the synchronized state as having been updated.
@@ -100,9 +312,12 @@ class GenerationSynchronizer(object):
         except ValueError:
             self._fetch_or_create_sync_gen()
 
+        self._publish('%s' % self.sync_gen)
+
     def _increment_sync_gen(self):
         """Increment the synchronization generation ID."""
         self.sync_gen = cache.incr(self.cache_key)
+        self._set_latest_sync_gen(self.sync_gen)
 
     def _fetch_or_create_sync_gen(self):
         """Return or create a new synchronization generation ID.
@@ -111,16 +326,155 @@ class GenerationSynchronizer(object):
         the a new generation ID will be stored.
         """
         sync_gen = int(time.mktime(datetime.now().timetuple()))
+        check_state = self._get_notifier_state()
 
         if cache.add(self.cache_key, sync_gen):
             self.sync_gen = sync_gen
         else:
-            self.sync_gen = self._get_latest_sync_gen()
+            self.sync_gen = cache.get(self.cache_key)
+
+        self._set_latest_sync_gen(self.sync_gen)
+        self._on_cache_checked(check_state, self.sync_gen)
 
     def _get_latest_sync_gen(self):
         """Return the latest synchronization generation ID.
 
         Returns:
-            int: The latest generation ID from cache.
+            tuple:
+            A 2-tuple containing:
+
+            1. The latest generation ID from cache (:py:class:`int`).
+            2. Where the generation ID was read from (:py:class:`unicode`).
+               This is ``'batch'`` if read from a batch of generation checks,
+               or ``'cache'`` otherwise.
+        """
+        in_batch, sync_gen = \
+            get_generation_synchronizer_registry().get_generation(
+                self.cache_key)
+
+        if in_batch:
+            return sync_gen, 'batch'
+
+        return cache.get(self.cache_key), 'cache'
+
+    def _set_latest_sync_gen(self, sync_gen):
+        """Set the latest known synchronization generation ID.
+
+        Args:
+            sync_gen (int):
+                The latest generation ID, or ``None`` if it was cleared.
+        """
+        self._latest_sync_gen = sync_gen
+        get_generation_synchronizer_registry().set_generation(
+            self.cache_key, sync_gen)
+
+    def _get_notifier_state(self):
+        """Return the state of the notifier before checking the cache.
+
+        This is passed to :py:meth:`_on_cache_checked` once the cache has
+        been checked.
+
+        Returns:
+            tuple:
+            A 2-tuple of the notifier's connection ID (or ``None`` if not
+            connected) and the number of notifications received.
+        """
+        notifier = self._notifier
+
+        if notifier is not None and notifier.is_connected:
+            connection_id = notifier.connection_id
+        else:
+            connection_id = None
+
+        return connection_id, self._notification_count
+
+    def _on_cache_checked(self, notifier_state, sync_gen):
+        """Handle having checked the generation in the cache.
+
+        If the notifier was connected, later checks can rely on its
+        notifications until it reconnects. If a notification arrived while
+        the cache was being checked, the cache will be checked again next
+        time, since the notification may be newer.
+
+        Args:
+            notifier_state (tuple):
+                The state returned by :py:meth:`_get_notifier_state` before
+                checking the cache.
+
+            sync_gen (int):
+                The generation found in the cache.
+        """
+        connection_id, notification_count = notifier_state
+
+        if (connection_id is not None and
+            notification_count == self._notification_count):
+            self._latest_sync_gen = sync_gen
+            self._notifier_connection_id = connection_id
+
+    def _is_notified(self):
+        """Return whether changes are being received through the notifier.
+
+        Returns:
+            bool:
+            ``True`` if the notifier is connected and the generation has been
+            checked since it connected.
+        """
+        notifier = self._notifier
+
+        return (notifier is not None and
+                notifier.is_connected and
+                notifier.connection_id == self._notifier_connection_id)
+
+    def _publish(self, message):
+        """Publish a generation change through the notifier, if any.
+
+        Args:
+            message (unicode):
+                The new generation ID, or an empty string if cleared.
         """
-        return cache.get(self.cache_key)
+        if self._notifier is not None:
+            try:
+                self._notifier.publish(self._channel, message)
+            except Exception as e:
+                logger.exception('Failed to publish sync notification for '
+                                 '%s: %s',
+                                 self.cache_key, e)
+
+    def _on_notification(self, channel, message):
+        """Handle a generation change published by another synchronizer.
+
+        Args:
+            channel (unicode):
+                The channel the notification was received on.
+
+            message (unicode):
+                The new generation ID, or an empty string if cleared.
+        """
+        if message:
+            try:
+                sync_gen = int(message)
+            except ValueError:
+                logger.warning('Received invalid sync notification for '
+                               '%s: %r',
+                               self.cache_key, message)
+                sync_gen = None
+        else:
+            sync_gen = None
+
+        self._notification_count += 1
+        self._latest_sync_gen = sync_gen
+
+
+def get_generation_synchronizer_registry():
+    """Return the registry of generation synchronizers.
+
+    Returns:
+        GenerationSynchronizerRegistry:
+        The registry of generation synchronizers.
+    """
+    global _registry
+
+    if _registry is None:
+        _registry = GenerationSynchronizerRegistry()
+
+    return _registry
@@ -1,18 +1,76 @@
 # coding: utf-8
 from __future__ import unicode_literals
 
+import hashlib
 import inspect
+import time
+import unittest
 import zlib
 
+from django.contrib.sites.models import Site
 from django.core.cache import cache
 from django.utils.six.moves import cPickle as pickle
 from kgb import SpyAgency
+from mock import patch
 
-from djblets.cache.backend import (cache_memoize, cache_memoize_iter,
+from djblets.cache import backend as cache_backend
+from djblets.cache.backend import (LocalCache,
+                                   cache_memoize, cache_memoize_iter,
+                                   cache_memoize_many,
+                                   disable_local_cache, enable_local_cache,
                                    make_cache_key,
-                                   CACHE_CHUNK_SIZE)
+                                   CACHE_CHUNK_SIZE,
+                                   MAX_KEY_SIZE,
+                                   STAMPEDE_PROTECTION_EARLY_EXPIRATION,
+                                   STAMPEDE_PROTECTION_LOCK)
+from djblets.cache.compression import (ZlibCodec,
+                                       get_cache_compression_codecs_registry)
 from djblets.testing.testcases import TestCase
 
+try:
+    # Django >= 1.7
+    from django.core.cache import caches
+except ImportError:
+    # Django < 1.7
+    caches = None
+
+
+def _get_default_cache():
+    """Return the backend instance behind the default cache.
+
+    On Django >= 1.7, :py:data:`django.core.cache.cache` is a proxy for the
+    backend, which must be used to spy on its methods. On older versions,
+    it's the backend itself.
+    """
+    if caches is None:
+        return cache
+    else:
+        return caches['default']
+
+
+class SyncExecutor(object):
+    """An executor for tests that runs functions in the calling thread.
+
+    If ``deferred`` is ``True``, functions will only be run once
+    :py:meth:`run_deferred` is called.
+    """
+
+    def __init__(self, deferred=False):
+        self.deferred = deferred
+        self._pending = []
+
+    def submit(self, fn, *args, **kwargs):
+        if self.deferred:
+            self._pending.append((fn, args, kwargs))
+        else:
+            fn(*args, **kwargs)
+
+    def run_deferred(self):
+        for fn, args, kwargs in self._pending:
+            fn(*args, **kwargs)
+
+        self._pending = []
+
 
 class CacheTests(SpyAgency, TestCase):
     def tearDown(self):
@@ -72,13 +130,13 @@ class CacheTests(SpyAgency, TestCase):
         self.assertEqual(result, data)
         self.assertTrue(cache_func.spy.called)
 
-        cache_key_0 = make_cache_key('%s-0' % cache_key)
-        cache_key_1 = make_cache_key('%s-1' % cache_key)
+        cache_key_0 = self._get_chunk_cache_key(cache_key, 0)
+        cache_key_1 = self._get_chunk_cache_key(cache_key, 1)
 
         self.assertTrue(make_cache_key(cache_key) in cache)
         self.assertTrue(cache_key_0 in cache)
         self.assertTrue(cache_key_1 in cache)
-        self.assertFalse(make_cache_key('%s-2' % cache_key) in cache)
+        self.assertFalse(self._get_chunk_cache_key(cache_key, 2) in cache)
 
         # Verify the contents of the stored data.
         stored_data = b''.join(cache.get(cache_key_0) + cache.get(cache_key_1))
@@ -112,15 +170,15 @@ class CacheTests(SpyAgency, TestCase):
         self.assertEqual(result, data)
         self.assertTrue(cache_func.spy.called)
 
-        cache_key_0 = make_cache_key('%s-0' % cache_key)
-        cache_key_1 = make_cache_key('%s-1' % cache_key)
-        cache_key_2 = make_cache_key('%s-2' % cache_key)
+        cache_key_0 = self._get_chunk_cache_key(cache_key, 0)
+        cache_key_1 = self._get_chunk_cache_key(cache_key, 1)
+        cache_key_2 = self._get_chunk_cache_key(cache_key, 2)
 
         self.assertTrue(make_cache_key(cache_key) in cache)
         self.assertTrue(cache_key_0 in cache)
         self.assertTrue(cache_key_1 in cache)
         self.assertTrue(cache_key_2 in cache)
-        self.assertFalse(make_cache_key('%s-3' % cache_key) in cache)
+        self.assertFalse(self._get_chunk_cache_key(cache_key, 3) in cache)
 
         # Verify the contents of the stored data.
         stored_data = b''.join(cache.get(cache_key_0) +
@@ -151,12 +209,12 @@ class CacheTests(SpyAgency, TestCase):
                                compress_large_data=True)
         self.assertTrue(cache_func.spy.called)
 
-        cache_key_0 = make_cache_key('%s-0' % cache_key)
+        cache_key_0 = self._get_chunk_cache_key(cache_key, 0)
 
         self.assertTrue(make_cache_key(cache_key) in cache)
         self.assertTrue(cache_key_0 in cache)
-        self.assertFalse(make_cache_key('%s-1' % cache_key) in cache)
-        self.assertFalse(make_cache_key('%s-2' % cache_key) in cache)
+        self.assertFalse(self._get_chunk_cache_key(cache_key, 1) in cache)
+        self.assertFalse(self._get_chunk_cache_key(cache_key, 2) in cache)
 
         # Verify the contents of the stored data.
         stored_data = cache.get(cache_key_0)[0]
@@ -276,24 +334,35 @@ class CacheTests(SpyAgency, TestCase):
         self.assertTrue(cache_func.spy.called)
 
         cache_key_main = make_cache_key(cache_key)
-        cache_key_0 = make_cache_key('%s-0' % cache_key)
-        cache_key_1 = make_cache_key('%s-1' % cache_key)
-        cache_key_2 = make_cache_key('%s-2' % cache_key)
-        cache_key_3 = make_cache_key('%s-3' % cache_key)
+        cache_key_0 = self._get_chunk_cache_key(cache_key, 0)
+        cache_key_1 = self._get_chunk_cache_key(cache_key, 1)
+        cache_key_2 = self._get_chunk_cache_key(cache_key, 2)
+        cache_key_3 = self._get_chunk_cache_key(cache_key, 3)
 
         self.assertTrue(cache_key_main in cache)
         self.assertTrue(cache_key_0 in cache)
         self.assertTrue(cache_key_1 in cache)
         self.assertTrue(cache_key_2 in cache)
         self.assertTrue(cache_key_3 in cache)
-        self.assertFalse(make_cache_key('%s-4' % cache_key) in cache)
+        self.assertFalse(self._get_chunk_cache_key(cache_key, 4) in cache)
 
         # Verify the contents of the stored data.
         stored_data = b''.join(cache.get(cache_key_0) +
                                cache.get(cache_key_1) +
                                cache.get(cache_key_2) +
                                cache.get(cache_key_3))
-        self.assertEqual(cache.get(cache_key_main), '4')
+        stored_info = cache.get(cache_key_main)
+        self.assertTrue(stored_info['generation'])
+        self.assertEqual(
+            stored_info,
+            {
+                'version': 2,
+                'chunk_count': 4,
+                'codec': None,
+                'serializer': 'pickle',
+                'generation': stored_info['generation'],
+                'previous_chunks': None,
+            })
         self.assertEqual(stored_data, pickled_data_1 + pickled_data_2)
 
         # Try fetching the data we stored.
@@ -349,14 +418,25 @@ class CacheTests(SpyAgency, TestCase):
         self.assertTrue(cache_func.spy.called)
 
         cache_key_main = make_cache_key(cache_key)
-        cache_key_0 = make_cache_key('%s-0' % cache_key)
+        cache_key_0 = self._get_chunk_cache_key(cache_key, 0)
 
         self.assertTrue(cache_key_main in cache)
         self.assertTrue(cache_key_0 in cache)
-        self.assertFalse(make_cache_key('%s-1' % cache_key) in cache)
+        self.assertFalse(self._get_chunk_cache_key(cache_key, 1) in cache)
 
         # Verify the contents of the stored data.
-        self.assertEqual(cache.get(cache_key_main), '1')
+        stored_info = cache.get(cache_key_main)
+        self.assertTrue(stored_info['generation'])
+        self.assertEqual(
+            stored_info,
+            {
+                'version': 2,
+                'chunk_count': 1,
+                'codec': 'zlib',
+                'serializer': 'pickle',
+                'generation': stored_info['generation'],
+                'previous_chunks': None,
+            })
         self.assertEqual(cache.get(cache_key_0)[0],
                          zlib.compress(pickled_data_1 + pickled_data_2))
 
@@ -376,6 +456,776 @@ class CacheTests(SpyAgency, TestCase):
         self.assertEqual(data_yielded, [])
         self.assertFalse(cache_func.spy.called)
 
+    def test_cache_memoize_iter_with_serializer(self):
+        """Testing cache_memoize_iter with serializer"""
+        cache_key = 'abc123'
+        data = [{'a': [1, 2]}, 'b' * 100, 3]
+
+        def cache_func():
+            return data
+
+        self.spy_on(cache_func, call_original=True)
+
+        result = list(cache_memoize_iter(cache_key, cache_func,
+                                         serializer='json'))
+        self.assertEqual(result, data)
+        self.assertTrue(cache_func.spy.called)
+        self.assertEqual(cache.get(make_cache_key(cache_key))['serializer'],
+                         'json')
+
+        # The data should be loaded using the serializer it was stored with,
+        # regardless of the one requested.
+        cache_func.spy.reset_calls()
+
+        result = list(cache_memoize_iter(cache_key, cache_func))
+        self.assertEqual(result, data)
+        self.assertFalse(cache_func.spy.called)
+
+    def test_cache_memoize_iter_with_unknown_serializer_in_cache(self):
+        """Testing cache_memoize_iter with cached data using an unknown
+        serializer
+        """
+        cache_key = 'abc123'
+
+        cache.set(make_cache_key(cache_key), {
+            'version': 2,
+            'chunk_count': 1,
+            'codec': None,
+            'serializer': 'unknown',
+            'generation': 'abc',
+        })
+        cache.set(make_cache_key('%s-abc-0' % cache_key), [b'xxx'])
+
+        def cache_func():
+            return ['abc']
+
+        self.spy_on(cache_func, call_original=True)
+
+        result = list(cache_memoize_iter(cache_key, cache_func))
+        self.assertEqual(result, ['abc'])
+        self.assertTrue(cache_func.spy.called)
+        self.assertEqual(cache.get(make_cache_key(cache_key))['serializer'],
+                         'pickle')
+
+    def test_cache_memoize_iter_with_compression_codec(self):
+        """Testing cache_memoize_iter with compression_codec"""
+        cache_key = 'abc123'
+        data = ['x' * 1000, 'y' * 1000]
+
+        def cache_func():
+            return data
+
+        codec = ZlibCodec()
+
+        self.spy_on(cache_func, call_original=True)
+        self.spy_on(codec.compressobj, call_original=True)
+
+        result = list(cache_memoize_iter(cache_key, cache_func,
+                                         compression_codec=codec,
+                                         compression_level=9))
+        self.assertEqual(result, data)
+        self.assertTrue(cache_func.spy.called)
+        self.assertTrue(codec.compressobj.last_called_with(level=9))
+
+        cache_key_0 = self._get_chunk_cache_key(cache_key, 0)
+        self.assertEqual(cache.get(make_cache_key(cache_key))['codec'],
+                         'zlib')
+        self.assertEqual(
+            zlib.decompress(cache.get(cache_key_0)[0]),
+            b''.join(pickle.dumps(item, protocol=0) for item in data))
+
+        cache_func.spy.reset_calls()
+
+        result = list(cache_memoize_iter(cache_key, cache_func))
+        self.assertEqual(result, data)
+        self.assertFalse(cache_func.spy.called)
+
+    def test_cache_memoize_iter_with_compression_codec_setting(self):
+        """Testing cache_memoize_iter with CACHE_COMPRESSION_CODEC setting"""
+        cache_key = 'abc123'
+        data = ['x' * 1000, 'y' * 1000]
+
+        class DummyCodec(ZlibCodec):
+            codec_id = 'dummy'
+
+        codec = DummyCodec()
+        registry = get_cache_compression_codecs_registry()
+        registry.register(codec)
+
+        try:
+            with self.settings(CACHE_COMPRESSION_CODEC='dummy'):
+                result = list(cache_memoize_iter(cache_key, lambda: data))
+
+            self.assertEqual(result, data)
+            self.assertEqual(cache.get(make_cache_key(cache_key))['codec'],
+                             'dummy')
+
+            # The data should be read using the stored codec, even if another
+            # is now the default.
+            self.spy_on(codec.decompress, call_original=True)
+
+            result = list(cache_memoize_iter(cache_key, lambda: []))
+            self.assertEqual(result, data)
+            self.assertTrue(codec.decompress.called)
+        finally:
+            registry.unregister(codec)
+
+    def test_cache_memoize_iter_streamed_uncompressed(self):
+        """Testing cache_memoize_iter with stream_large_data=True without
+        compression
+        """
+        self._test_cache_memoize_iter_streamed(compress_large_data=False,
+                                               expected_batches=4)
+
+    def test_cache_memoize_iter_streamed_compressed(self):
+        """Testing cache_memoize_iter with stream_large_data=True with
+        compression
+        """
+        self._test_cache_memoize_iter_streamed(compress_large_data=True,
+                                               expected_batches=1)
+
+    def test_cache_memoize_iter_streamed_with_max_memory_setting(self):
+        """Testing cache_memoize_iter with stream_large_data=True and
+        settings.CACHE_STREAM_MAX_MEMORY
+        """
+        with self.settings(CACHE_STREAM_MAX_MEMORY=CACHE_CHUNK_SIZE):
+            self._test_cache_memoize_iter_streamed(compress_large_data=False,
+                                                   expected_batches=4,
+                                                   stream_max_memory=None)
+
+    def test_cache_memoize_iter_streamed_missing_first_chunk(self):
+        """Testing cache_memoize_iter with stream_large_data=True and missing
+        chunk in first batch
+        """
+        cache_key = 'abc123'
+        data1 = self._build_test_chunk_data(num_chunks=2)[0]
+        data2 = self._build_test_chunk_data(num_chunks=2)[0]
+
+        def cache_func():
+            yield data1
+            yield data2
+
+        list(cache_memoize_iter(cache_key, cache_func,
+                                compress_large_data=False))
+        cache.delete(self._get_chunk_cache_key(cache_key, 0))
+
+        self.spy_on(cache_func, call_original=True)
+
+        result = list(cache_memoize_iter(cache_key, cache_func,
+                                         compress_large_data=False,
+                                         stream_large_data=True,
+                                         stream_max_memory=CACHE_CHUNK_SIZE))
+        self.assertEqual(result, [data1, data2])
+        self.assertTrue(cache_func.spy.called)
+        self.assertTrue(self._get_chunk_cache_key(cache_key, 0) in cache)
+
+    def test_cache_memoize_iter_streamed_missing_later_chunk(self):
+        """Testing cache_memoize_iter with stream_large_data=True and missing
+        chunk after items were yielded
+        """
+        cache_key = 'abc123'
+        data1 = self._build_test_chunk_data(num_chunks=2)[0]
+        data2 = self._build_test_chunk_data(num_chunks=2)[0]
+
+        def cache_func():
+            yield data1
+            yield data2
+
+        list(cache_memoize_iter(cache_key, cache_func,
+                                compress_large_data=False))
+        cache.delete(self._get_chunk_cache_key(cache_key, 3))
+
+        self.spy_on(cache_func, call_original=True)
+
+        result = cache_memoize_iter(cache_key, cache_func,
+                                    compress_large_data=False,
+                                    stream_large_data=True,
+                                    stream_max_memory=CACHE_CHUNK_SIZE)
+
+        self.assertEqual(next(result), data1)
+        self.assertFalse(cache_func.spy.called)
+
+        self.assertEqual(next(result), data2)
+        self.assertTrue(cache_func.spy.called)
+
+        with self.assertRaises(StopIteration):
+            next(result)
+
+        # The data should have been stored again in full.
+        self.assertTrue(self._get_chunk_cache_key(cache_key, 3) in cache)
+
+    def test_cache_memoize_iter_streamed_with_concurrent_overwrite(self):
+        """Testing cache_memoize_iter with stream_large_data=True and data
+        overwritten while streaming
+        """
+        cache_key = 'abc123'
+        data1 = self._build_test_chunk_data(num_chunks=2)[0]
+        data2 = data1.replace('x', 'y')
+
+        list(cache_memoize_iter(cache_key, [data1, data1],
+                                compress_large_data=False))
+        old_generation = cache.get(make_cache_key(cache_key))['generation']
+
+        result = cache_memoize_iter(cache_key, [],
+                                    compress_large_data=False,
+                                    stream_large_data=True,
+                                    stream_max_memory=CACHE_CHUNK_SIZE)
+        self.assertEqual(next(result), data1)
+
+        # Store new data while the old data is still being read.
+        list(cache_memoize_iter(cache_key, [data2, data2],
+                                compress_large_data=False,
+                                force_overwrite=True))
+        self.assertNotEqual(cache.get(make_cache_key(cache_key))['generation'],
+                            old_generation)
+
+        # The reader should continue to see the old data.
+        self.assertEqual(next(result), data1)
+
+        with self.assertRaises(StopIteration):
+            next(result)
+
+        # New readers will see the new data.
+        self.assertEqual(list(cache_memoize_iter(cache_key, [])),
+                         [data2, data2])
+
+    def test_cache_memoize_iter_deletes_old_generations(self):
+        """Testing cache_memoize_iter deletes chunks from older generations
+        when overwriting data
+        """
+        cache_key = 'abc123'
+        data = self._build_test_chunk_data(num_chunks=2)[0]
+        generations = []
+
+        for i in range(3):
+            list(cache_memoize_iter(cache_key, [data, data],
+                                    compress_large_data=False,
+                                    force_overwrite=True))
+            generations.append(
+                cache.get(make_cache_key(cache_key))['generation'])
+
+        stored_info = cache.get(make_cache_key(cache_key))
+        self.assertEqual(stored_info['previous_chunks'], {
+            'generation': generations[1],
+            'chunk_count': stored_info['chunk_count'],
+        })
+
+        # The first generation has been deleted, but the previous one is
+        # kept for any readers still working through it.
+        self.assertFalse(make_cache_key('%s-%s-0' % (cache_key,
+                                                     generations[0]))
+                         in cache)
+        self.assertTrue(make_cache_key('%s-%s-0' % (cache_key,
+                                                    generations[1]))
+                        in cache)
+        self.assertEqual(list(cache_memoize_iter(cache_key, [])),
+                         [data, data])
+
+    def test_cache_memoize_large_files_streamed(self):
+        """Testing cache_memoize with large files and stream_large_data=True
+        """
+        cache_key = 'abc123'
+        data = self._build_test_chunk_data(num_chunks=2)[0]
+
+        def cache_func():
+            return data
+
+        self.spy_on(cache_func, call_original=True)
+
+        result = cache_memoize(cache_key, cache_func, large_data=True,
+                               stream_large_data=True)
+        self.assertEqual(result, data)
+        self.assertTrue(cache_func.spy.called)
+
+        cache_func.spy.reset_calls()
+
+        result = cache_memoize(cache_key, cache_func, large_data=True,
+                               stream_large_data=True)
+        self.assertEqual(result, data)
+        self.assertFalse(cache_func.spy.called)
+
+    def _test_cache_memoize_iter_streamed(self, compress_large_data,
+                                          expected_batches,
+                                          stream_max_memory=CACHE_CHUNK_SIZE):
+        """Common tests for streaming large data from the cache.
+
+        Args:
+            compress_large_data (bool):
+                Whether to compress the cached data.
+
+            expected_batches (int):
+                The number of batches of chunks expected to be fetched.
+
+            stream_max_memory (int, optional):
+                The maximum memory to use when streaming, or ``None`` to
+                use the default.
+        """
+        cache_key = 'abc123'
+        data1 = self._build_test_chunk_data(num_chunks=2)[0]
+        data2 = self._build_test_chunk_data(num_chunks=2)[0]
+
+        def cache_func():
+            yield data1
+            yield data2
+
+        list(cache_memoize_iter(cache_key, cache_func,
+                                compress_large_data=compress_large_data))
+
+        default_cache = _get_default_cache()
+
+        self.spy_on(cache_func, call_original=True)
+        self.spy_on(default_cache.get_many, call_original=True)
+
+        result = cache_memoize_iter(cache_key, cache_func,
+                                    compress_large_data=compress_large_data,
+                                    stream_large_data=True,
+                                    stream_max_memory=stream_max_memory)
+        self.assertTrue(inspect.isgenerator(result))
+
+        self.assertEqual(next(result), data1)
+
+        if expected_batches > 1:
+            # Only the chunks needed so far should have been fetched.
+            self.assertTrue(len(default_cache.get_many.spy.calls) <
+                            expected_batches)
+
+        self.assertEqual(next(result), data2)
+
+        with self.assertRaises(StopIteration):
+            next(result)
+
+        self.assertFalse(cache_func.spy.called)
+        self.assertEqual(len(default_cache.get_many.spy.calls),
+                         expected_batches)
+
+        for call in default_cache.get_many.spy.calls:
+            self.assertEqual(len(call.args[0]), 1)
+
+    def test_cache_memoize_with_lock_protection(self):
+        """Testing cache_memoize with stampede_protection=LOCK"""
+        cache_key = 'abc123'
+
+        def cache_func():
+            return 'abc'
+
+        self.spy_on(cache_func, call_original=True)
+
+        result = cache_memoize(cache_key, cache_func,
+                               stampede_protection=STAMPEDE_PROTECTION_LOCK)
+        self.assertEqual(result, 'abc')
+        self.assertTrue(cache_func.spy.called)
+        self.assertFalse(self._is_recompute_locked(cache_key))
+
+        cache_func.spy.reset_calls()
+
+        result = cache_memoize(cache_key, cache_func,
+                               stampede_protection=STAMPEDE_PROTECTION_LOCK)
+        self.assertEqual(result, 'abc')
+        self.assertFalse(cache_func.spy.called)
+
+    def test_cache_memoize_without_protection_after_lock_protection(self):
+        """Testing cache_memoize without stampede_protection returns values
+        stored with stampede_protection=LOCK
+        """
+        cache_key = 'abc123'
+
+        cache_memoize(cache_key, lambda: 'abc',
+                      stampede_protection=STAMPEDE_PROTECTION_LOCK)
+
+        def cache_func():
+            return 'def'
+
+        self.spy_on(cache_func, call_original=True)
+
+        result = cache_memoize(cache_key, cache_func)
+        self.assertEqual(result, 'abc')
+        self.assertFalse(cache_func.spy.called)
+
+    def test_cache_memoize_with_lock_protection_expired(self):
+        """Testing cache_memoize with stampede_protection=LOCK and expired
+        value
+        """
+        cache_key = 'abc123'
+        self._store_expired_value(cache_key, 'old')
+
+        def cache_func():
+            self.assertTrue(self._is_recompute_locked(cache_key))
+
+            return 'new'
+
+        self.spy_on(cache_func, call_original=True)
+
+        result = cache_memoize(cache_key, cache_func,
+                               stampede_protection=STAMPEDE_PROTECTION_LOCK)
+        self.assertEqual(result, 'new')
+        self.assertTrue(cache_func.spy.called)
+        self.assertFalse(self._is_recompute_locked(cache_key))
+
+    def test_cache_memoize_with_lock_protection_expired_and_locked(self):
+        """Testing cache_memoize with stampede_protection=LOCK and expired
+        value being recomputed by another process
+        """
+        cache_key = 'abc123'
+        self._store_expired_value(cache_key, 'old')
+        cache.add(make_cache_key('%s-recompute-lock' % cache_key), True)
+
+        def cache_func():
+            return 'new'
+
+        self.spy_on(cache_func, call_original=True)
+
+        result = cache_memoize(cache_key, cache_func,
+                               stampede_protection=STAMPEDE_PROTECTION_LOCK)
+        self.assertEqual(result, 'old')
+        self.assertFalse(cache_func.spy.called)
+
+    def test_cache_memoize_with_lock_protection_missing_and_locked(self):
+        """Testing cache_memoize with stampede_protection=LOCK and value
+        being computed by another process
+        """
+        cache_key = 'abc123'
+        cache.add(make_cache_key('%s-recompute-lock' % cache_key), True)
+
+        def _wait_for_cache_value(wait_cache_key):
+            # Simulate the other process storing the value.
+            cache.set(wait_cache_key, 'other')
+
+            return cache.get(wait_cache_key)
+
+        def cache_func():
+            return 'new'
+
+        self.spy_on(cache_func, call_original=True)
+        self.spy_on(cache_backend._wait_for_cache_value,
+                    call_fake=_wait_for_cache_value)
+
+        result = cache_memoize(cache_key, cache_func,
+                               stampede_protection=STAMPEDE_PROTECTION_LOCK)
+        self.assertEqual(result, 'other')
+        self.assertTrue(cache_backend._wait_for_cache_value.called)
+        self.assertFalse(cache_func.spy.called)
+
+    def test_cache_memoize_with_lock_protection_missing_and_wait_expired(
+            self):
+        """Testing cache_memoize with stampede_protection=LOCK and value
+        never computed by the locking process
+        """
+        cache_key = 'abc123'
+        cache.add(make_cache_key('%s-recompute-lock' % cache_key), True)
+
+        def cache_func():
+            return 'new'
+
+        self.spy_on(cache_func, call_original=True)
+        self.spy_on(cache_backend._wait_for_cache_value,
+                    call_fake=lambda cache_key: None)
+
+        result = cache_memoize(cache_key, cache_func,
+                               stampede_protection=STAMPEDE_PROTECTION_LOCK)
+        self.assertEqual(result, 'new')
+        self.assertTrue(cache_func.spy.called)
+
+    def test_cache_memoize_with_early_expiration(self):
+        """Testing cache_memoize with stampede_protection=EARLY_EXPIRATION"""
+        cache_key = 'abc123'
+        stampede_protection = STAMPEDE_PROTECTION_EARLY_EXPIRATION
+
+        def cache_func():
+            return 'new'
+
+        self.spy_on(cache_func, call_original=True)
+
+        # The random roll is fixed, so that the outcome of each lookup is
+        # known. A roll of 0.5 moves the current time ahead by about 0.69
+        # times the time it took to compute the value.
+        with patch.object(cache_backend.random, 'random', return_value=0.5):
+            # A value that's quick to compute, far from expiration,
+            # shouldn't be recomputed.
+            cache.set(make_cache_key(cache_key),
+                      cache_backend._MemoizedEntry(
+                          value='old',
+                          expires_at=time.time() + 1000,
+                          delta=1))
+
+            result = cache_memoize(cache_key, cache_func,
+                                   stampede_protection=stampede_protection)
+            self.assertEqual(result, 'old')
+            self.assertFalse(cache_func.spy.called)
+
+            # A value that's very expensive to compute should be
+            # recomputed well before expiration.
+            cache.set(make_cache_key(cache_key),
+                      cache_backend._MemoizedEntry(
+                          value='old',
+                          expires_at=time.time() + 1000,
+                          delta=1e9))
+
+            result = cache_memoize(cache_key, cache_func,
+                                   stampede_protection=stampede_protection)
+            self.assertEqual(result, 'new')
+            self.assertTrue(cache_func.spy.called)
+
+        entry = cache.get(make_cache_key(cache_key))
+        self.assertIsInstance(entry, cache_backend._MemoizedEntry)
+        self.assertEqual(entry.value, 'new')
+
+    def test_cache_memoize_iter_with_lock_protection_expired_and_locked(
+            self):
+        """Testing cache_memoize_iter with stampede_protection=LOCK and
+        expired items being recomputed by another process
+        """
+        cache_key = 'abc123'
+        list(cache_memoize_iter(cache_key, ['old'],
+                                stampede_protection=STAMPEDE_PROTECTION_LOCK))
+
+        info = cache.get(make_cache_key(cache_key))
+        self.assertIn('expires_at', info)
+        self.assertIn('delta', info)
+
+        info['expires_at'] = time.time() - 1
+        cache.set(make_cache_key(cache_key), info)
+        cache.add(make_cache_key('%s-recompute-lock' % cache_key), True)
+
+        result = list(cache_memoize_iter(
+            cache_key, ['new'],
+            stampede_protection=STAMPEDE_PROTECTION_LOCK))
+        self.assertEqual(result, ['old'])
+
+        # Once the lock is released, the next caller should recompute.
+        cache.delete(make_cache_key('%s-recompute-lock' % cache_key))
+
+        result = list(cache_memoize_iter(
+            cache_key, ['new'],
+            stampede_protection=STAMPEDE_PROTECTION_LOCK))
+        self.assertEqual(result, ['new'])
+        self.assertFalse(self._is_recompute_locked(cache_key))
+
+        result = list(cache_memoize_iter(
+            cache_key, ['newer'],
+            stampede_protection=STAMPEDE_PROTECTION_LOCK))
+        self.assertEqual(result, ['new'])
+
+    def test_cache_memoize_iter_with_early_expiration(self):
+        """Testing cache_memoize_iter with
+        stampede_protection=EARLY_EXPIRATION
+        """
+        cache_key = 'abc123'
+        stampede_protection = STAMPEDE_PROTECTION_EARLY_EXPIRATION
+
+        list(cache_memoize_iter(cache_key, ['old'],
+                                stampede_protection=stampede_protection))
+
+        # The random roll is fixed, so that the outcome of each lookup is
+        # known. A roll of 0.5 moves the current time ahead by about 0.69
+        # times the time it took to compute the value.
+        with patch.object(cache_backend.random, 'random', return_value=0.5):
+            # A value that's quick to compute, far from expiration,
+            # shouldn't be recomputed.
+            info = cache.get(make_cache_key(cache_key))
+            info['expires_at'] = time.time() + 1000
+            info['delta'] = 1
+            cache.set(make_cache_key(cache_key), info)
+
+            result = list(cache_memoize_iter(
+                cache_key, ['new'],
+                stampede_protection=stampede_protection))
+            self.assertEqual(result, ['old'])
+
+            # A value that's very expensive to compute should be
+            # recomputed well before expiration.
+            info = cache.get(make_cache_key(cache_key))
+            info['delta'] = 1e9
+            cache.set(make_cache_key(cache_key), info)
+
+            result = list(cache_memoize_iter(
+                cache_key, ['new'],
+                stampede_protection=stampede_protection))
+            self.assertEqual(result, ['new'])
+
+    def test_cache_memoize_with_soft_expiration(self):
+        """Testing cache_memoize with soft_expiration"""
+        cache_key = 'abc123'
+        executor = SyncExecutor()
+
+        def cache_func():
+            return 'abc'
+
+        self.spy_on(cache_func, call_original=True)
+        self.spy_on(executor.submit, call_original=True)
+
+        result = cache_memoize(cache_key, cache_func,
+                               soft_expiration=100,
+                               refresh_executor=executor)
+        self.assertEqual(result, 'abc')
+        self.assertTrue(cache_func.spy.called)
+
+        entry = cache.get(make_cache_key(cache_key))
+        self.assertIsInstance(entry, cache_backend._MemoizedEntry)
+        self.assertTrue(entry.expires_at <= time.time() + 100)
+
+        cache_func.spy.reset_calls()
+
+        result = cache_memoize(cache_key, cache_func,
+                               soft_expiration=100,
+                               refresh_executor=executor)
+        self.assertEqual(result, 'abc')
+        self.assertFalse(cache_func.spy.called)
+        self.assertFalse(executor.submit.spy.called)
+
+    def test_cache_memoize_without_soft_expiration_after_soft_expiration(
+            self):
+        """Testing cache_memoize without soft_expiration returns values
+        stored with soft_expiration
+        """
+        cache_key = 'abc123'
+
+        cache_memoize(cache_key, lambda: 'abc',
+                      soft_expiration=100,
+                      refresh_executor=SyncExecutor())
+
+        def cache_func():
+            return 'def'
+
+        self.spy_on(cache_func, call_original=True)
+
+        result = cache_memoize(cache_key, cache_func)
+        self.assertEqual(result, 'abc')
+        self.assertFalse(cache_func.spy.called)
+
+    def test_cache_memoize_with_soft_expiration_stale(self):
+        """Testing cache_memoize with soft_expiration and stale value"""
+        cache_key = 'abc123'
+        executor = SyncExecutor(deferred=True)
+        self._store_expired_value(cache_key, 'old')
+
+        def cache_func():
+            self.assertTrue(self._is_recompute_locked(cache_key))
+
+            return 'new'
+
+        self.spy_on(cache_func, call_original=True)
+        self.spy_on(executor.submit, call_original=True)
+
+        # The stale value should be returned right away, with the refresh
+        # happening outside of the call.
+        result = cache_memoize(cache_key, cache_func,
+                               soft_expiration=100,
+                               refresh_executor=executor)
+        self.assertEqual(result, 'old')
+        self.assertTrue(executor.submit.spy.called)
+        self.assertFalse(cache_func.spy.called)
+        self.assertTrue(self._is_recompute_locked(cache_key))
+
+        # Only one refresh should be scheduled at a time.
+        result = cache_memoize(cache_key, cache_func,
+                               soft_expiration=100,
+                               refresh_executor=executor)
+        self.assertEqual(result, 'old')
+        self.assertEqual(len(executor.submit.spy.calls), 1)
+
+        executor.run_deferred()
+        self.assertTrue(cache_func.spy.called)
+        self.assertFalse(self._is_recompute_locked(cache_key))
+
+        cache_func.spy.reset_calls()
+
+        result = cache_memoize(cache_key, cache_func,
+                               soft_expiration=100,
+                               refresh_executor=executor)
+        self.assertEqual(result, 'new')
+        self.assertFalse(cache_func.spy.called)
+
+    def test_cache_memoize_with_soft_expiration_refresh_error(self):
+        """Testing cache_memoize with soft_expiration and error refreshing
+        stale value
+        """
+        cache_key = 'abc123'
+        self._store_expired_value(cache_key, 'old')
+
+        def cache_func():
+            raise Exception('Oh no')
+
+        result = cache_memoize(cache_key, cache_func,
+                               soft_expiration=100,
+                               refresh_executor=SyncExecutor())
+        self.assertEqual(result, 'old')
+        self.assertFalse(self._is_recompute_locked(cache_key))
+        self.assertEqual(cache.get(make_cache_key(cache_key)).value, 'old')
+
+    def test_cache_memoize_with_soft_expiration_default_executor(self):
+        """Testing cache_memoize with soft_expiration and default executor"""
+        cache_key = 'abc123'
+        self._store_expired_value(cache_key, 'old')
+
+        executor = cache_backend.get_default_refresh_executor()
+        self.assertIs(cache_backend.get_default_refresh_executor(), executor)
+
+        if not hasattr(executor, 'shutdown'):
+            raise self.skipTest('concurrent.futures is not available')
+
+        self.spy_on(executor.submit, call_original=True)
+
+        result = cache_memoize(cache_key, lambda: 'new', soft_expiration=100)
+        self.assertEqual(result, 'old')
+
+        # Wait for the refresh to finish.
+        executor.submit.spy.last_call.return_value.result()
+        self.assertEqual(cache.get(make_cache_key(cache_key)).value, 'new')
+
+    def test_cache_memoize_with_soft_expiration_and_large_data(self):
+        """Testing cache_memoize with soft_expiration and large_data=True"""
+        with self.assertRaises(ValueError):
+            cache_memoize('abc123', lambda: 'abc',
+                          large_data=True,
+                          soft_expiration=100)
+
+    def _store_expired_value(self, cache_key, value):
+        """Store an expired value for stampede protection tests.
+
+        Args:
+            cache_key (unicode):
+                The cache key to store.
+
+            value (object):
+                The value to store.
+        """
+        cache.set(make_cache_key(cache_key), cache_backend._MemoizedEntry(
+            value=value,
+            expires_at=time.time() - 1,
+            delta=0.1))
+
+    def _is_recompute_locked(self, cache_key):
+        """Return whether a cache key has been locked for recomputing.
+
+        Args:
+            cache_key (unicode):
+                The cache key to check.
+
+        Returns:
+            bool:
+            Whether the cache key is locked.
+        """
+        return make_cache_key('%s-recompute-lock' % cache_key) in cache
+
+    def _get_chunk_cache_key(self, cache_key, i):
+        """Return the cache key for a chunk of the latest stored data.
+
+        Args:
+            cache_key (unicode):
+                The main cache key for the data.
+
+            i (int):
+                The index of the chunk.
+
+        Returns:
+            bytes:
+            The cache key for the chunk.
+        """
+        return make_cache_key('%s-%s-%d' % (
+            cache_key,
+            cache.get(make_cache_key(cache_key))['generation'],
+            i))
+
     def _build_test_chunk_data(self, num_chunks):
         """Build enough test data to fill up the specified number of chunks.
 
@@ -389,3 +1239,314 @@ class CacheTests(SpyAgency, TestCase):
         self.assertEqual(len(pickled_data), CACHE_CHUNK_SIZE * num_chunks)
 
         return data, pickled_data
+
+
+class CacheMemoizeManyTests(SpyAgency, TestCase):
+    """Unit tests for djblets.cache.backend.cache_memoize_many."""
+
+    def tearDown(self):
+        super(CacheMemoizeManyTests, self).tearDown()
+
+        cache.clear()
+
+    def test_cache_memoize_many(self):
+        """Testing cache_memoize_many"""
+        cache.set(make_cache_key('key1'), 'value1')
+
+        def lookup_many(keys):
+            self.assertEqual(keys, ['key2', 'key3'])
+
+            return {
+                key: key.replace('key', 'value')
+                for key in keys
+            }
+
+        self.spy_on(cache.get_many)
+        self.spy_on(cache.set_many)
+
+        results = cache_memoize_many(['key1', 'key2', 'key3'], lookup_many)
+
+        self.assertEqual(results, {
+            'key1': 'value1',
+            'key2': 'value2',
+            'key3': 'value3',
+        })
+        self.assertEqual(len(cache.get_many.calls), 1)
+        self.assertEqual(len(cache.set_many.calls), 1)
+        self.assertEqual(cache.get(make_cache_key('key2')), 'value2')
+        self.assertEqual(cache.get(make_cache_key('key3')), 'value3')
+
+    def test_cache_memoize_many_all_cached(self):
+        """Testing cache_memoize_many with all values cached"""
+        cache.set(make_cache_key('key1'), 'value1')
+        cache.set(make_cache_key('key2'), 'value2')
+
+        results = cache_memoize_many(['key1', 'key2'],
+                                     lambda keys: self.fail('Not cached'))
+
+        self.assertEqual(results, {
+            'key1': 'value1',
+            'key2': 'value2',
+        })
+
+    def test_cache_memoize_many_partial_results(self):
+        """Testing cache_memoize_many with lookup results missing keys"""
+        results = cache_memoize_many(['key1', 'key2'],
+                                     lambda keys: {'key1': 'value1'})
+
+        self.assertEqual(results, {'key1': 'value1'})
+        self.assertNotIn(make_cache_key('key2'), cache)
+
+    def test_cache_memoize_many_unexpected_keys(self):
+        """Testing cache_memoize_many with lookup results containing keys
+        that weren't requested
+        """
+        cache.set(make_cache_key('key1'), 'value1')
+
+        self.spy_on(cache_backend.logger.warning)
+
+        results = cache_memoize_many(
+            ['key1', 'key2'],
+            lambda keys: {
+                'key2': 'value2',
+                'key3': 'value3',
+            })
+
+        self.assertEqual(results, {
+            'key1': 'value1',
+            'key2': 'value2',
+        })
+        self.assertEqual(cache.get(make_cache_key('key2')), 'value2')
+        self.assertNotIn(make_cache_key('key3'), cache)
+        self.assertTrue(cache_backend.logger.warning.called)
+
+    def test_cache_memoize_many_force_overwrite(self):
+        """Testing cache_memoize_many with force_overwrite=True"""
+        cache.set(make_cache_key('key1'), 'value1')
+
+        results = cache_memoize_many(['key1'],
+                                     lambda keys: {'key1': 'new-value1'},
+                                     force_overwrite=True)
+
+        self.assertEqual(results, {'key1': 'new-value1'})
+        self.assertEqual(cache.get(make_cache_key('key1')), 'new-value1')
+
+    def test_cache_memoize_many_stampede_protected_values(self):
+        """Testing cache_memoize_many with values stored by cache_memoize
+        with stampede protection
+        """
+        cache_memoize('key1', lambda: 'value1',
+                      stampede_protection=STAMPEDE_PROTECTION_LOCK)
+
+        results = cache_memoize_many(['key1'],
+                                     lambda keys: self.fail('Not cached'))
+
+        self.assertEqual(results, {'key1': 'value1'})
+
+    def test_cache_memoize_many_large_data(self):
+        """Testing cache_memoize_many with large_data=True"""
+        data1 = 'x' * (CACHE_CHUNK_SIZE * 2)
+        data2 = ['y'] * 100
+
+        cache_memoize('key1', lambda: data1, large_data=True)
+
+        results = cache_memoize_many(['key1', 'key2'],
+                                     lambda keys: {'key2': data2},
+                                     large_data=True)
+
+        self.assertEqual(results, {
+            'key1': data1,
+            'key2': data2,
+        })
+        self.assertEqual(
+            cache_memoize('key2', lambda: self.fail('Not cached'),
+                          large_data=True),
+            data2)
+
+    def test_cache_memoize_many_large_data_missing_chunk(self):
+        """Testing cache_memoize_many with large_data=True and missing chunk
+        """
+        cache_memoize('key1', lambda: 'x' * (CACHE_CHUNK_SIZE * 2),
+                      large_data=True,
+                      compress_large_data=False)
+
+        cache_key = make_cache_key('key1')
+        cache.delete(make_cache_key('key1-%s-1'
+                                    % cache.get(cache_key)['generation']))
+
+        results = cache_memoize_many(['key1'],
+                                     lambda keys: {'key1': 'new-value1'},
+                                     large_data=True,
+                                     compress_large_data=False)
+
+        self.assertEqual(results, {'key1': 'new-value1'})
+
+    def test_cache_memoize_many_local_cache(self):
+        """Testing cache_memoize_many with a local cache"""
+        enable_local_cache('local-test:')
+
+        try:
+            cache_memoize('local-test:1', lambda: 'value1')
+            cache.clear()
+
+            results = cache_memoize_many(['local-test:1', 'key2'],
+                                         lambda keys: {'key2': 'value2'})
+        finally:
+            disable_local_cache('local-test:')
+
+        self.assertEqual(results, {
+            'local-test:1': 'value1',
+            'key2': 'value2',
+        })
+
+
+class LocalCacheTests(SpyAgency, TestCase):
+    """Unit tests for djblets.cache.backend.LocalCache."""
+
+    def setUp(self):
+        super(LocalCacheTests, self).setUp()
+
+        self.local_cache = enable_local_cache('local-test:', max_entries=2)
+
+    def tearDown(self):
+        super(LocalCacheTests, self).tearDown()
+
+        disable_local_cache('local-test:')
+        cache.clear()
+
+    def test_cache_memoize(self):
+        """Testing cache_memoize with a local cache"""
+        self.assertEqual(cache_memoize('local-test:1', lambda: 'abc'), 'abc')
+
+        self.spy_on(cache.get)
+
+        self.assertEqual(
+            cache_memoize('local-test:1', lambda: self.fail('Not cached')),
+            'abc')
+        self.assertFalse(cache.get.called)
+
+    def test_cache_memoize_other_prefix(self):
+        """Testing cache_memoize with a local cache and a key not matching the
+        prefix
+        """
+        cache_memoize('other-test:1', lambda: 'abc')
+
+        self.assertIsNone(self.local_cache.get(make_cache_key('other-test:1')))
+
+    def test_cache_memoize_large_data(self):
+        """Testing cache_memoize with a local cache and large_data=True"""
+        cache_memoize('local-test:1', lambda: 'abc', large_data=True)
+
+        self.assertIsNone(self.local_cache.get(make_cache_key('local-test:1')))
+
+    def test_cache_memoize_force_overwrite(self):
+        """Testing cache_memoize with a local cache and force_overwrite=True
+        """
+        cache_memoize('local-test:1', lambda: 'abc')
+
+        self.assertEqual(
+            cache_memoize('local-test:1', lambda: 'def',
+                          force_overwrite=True),
+            'def')
+        self.assertEqual(cache_memoize('local-test:1', lambda: 'ghi'), 'def')
+
+    def test_get_expired(self):
+        """Testing LocalCache.get with an expired value"""
+        self.local_cache.expiration = -1
+        self.local_cache.set('key', 'abc')
+
+        self.assertIsNone(self.local_cache.get('key'))
+
+    def test_set_evicts_least_recently_used(self):
+        """Testing LocalCache.set evicts the least recently used value"""
+        self.local_cache.set('key1', 'abc')
+        self.local_cache.set('key2', 'def')
+        self.local_cache.get('key1')
+        self.local_cache.set('key3', 'ghi')
+
+        self.assertEqual(self.local_cache.get('key1'), 'abc')
+        self.assertIsNone(self.local_cache.get('key2'))
+        self.assertEqual(self.local_cache.get('key3'), 'ghi')
+
+    def test_invalidate(self):
+        """Testing LocalCache.invalidate invalidates other processes"""
+        other_local_cache = LocalCache('local-test:', sync_interval=0)
+        other_local_cache.set('key', 'abc')
+        self.assertEqual(other_local_cache.get('key'), 'abc')
+
+        self.local_cache.invalidate()
+
+        self.assertIsNone(other_local_cache.get('key'))
+
+    def test_enable_local_cache_twice(self):
+        """Testing enable_local_cache with an already-enabled prefix"""
+        with self.assertRaises(KeyError):
+            enable_local_cache('local-test:')
+
+
+class MakeCacheKeyTests(TestCase):
+    """Unit tests for djblets.cache.backend.make_cache_key."""
+
+    def test_make_cache_key(self):
+        """Testing make_cache_key"""
+        self.assertEqual(make_cache_key('test-key'), b'example.com:test-key')
+
+    def test_make_cache_key_strips_whitespace(self):
+        """Testing make_cache_key strips whitespace"""
+        self.assertEqual(make_cache_key('test key\t1\r\n'),
+                         b'example.com:testkey1')
+
+    def test_make_cache_key_with_site_root(self):
+        """Testing make_cache_key with settings.SITE_ROOT"""
+        make_cache_key('test-key')
+
+        with self.settings(SITE_ROOT='/root/'):
+            self.assertEqual(make_cache_key('test-key'),
+                             b'example.com:/root/:test-key')
+
+        self.assertEqual(make_cache_key('test-key'), b'example.com:test-key')
+
+    def test_make_cache_key_after_site_change(self):
+        """Testing make_cache_key after the Site changes"""
+        make_cache_key('test-key')
+
+        site = Site.objects.get_current()
+        site.domain = 'example.org'
+        site.save()
+
+        try:
+            self.assertEqual(make_cache_key('test-key'),
+                             b'example.org:test-key')
+        finally:
+            # Rolling back the test's transaction won't reset this.
+            site.domain = 'example.com'
+            site.save()
+
+    def test_make_cache_key_with_long_key(self):
+        """Testing make_cache_key with a key longer than MAX_KEY_SIZE"""
+        key = 'x' * MAX_KEY_SIZE
+        cache_key = make_cache_key(key)
+
+        self.assertEqual(len(cache_key), MAX_KEY_SIZE)
+        self.assertEqual(
+            cache_key[-32:],
+            hashlib.md5(('example.com:%s' % key).encode('utf-8'))
+            .hexdigest().encode('utf-8'))
+
+    @unittest.skipIf(not hasattr(hashlib, 'blake2b'),
+                     'BLAKE2b is not supported')
+    def test_make_cache_key_with_long_key_and_blake2b(self):
+        """Testing make_cache_key with a key longer than MAX_KEY_SIZE and
+        settings.CACHE_KEY_DIGEST='blake2b'
+        """
+        key = 'x' * MAX_KEY_SIZE
+
+        with self.settings(CACHE_KEY_DIGEST='blake2b'):
+            cache_key = make_cache_key(key)
+
+        self.assertEqual(len(cache_key), MAX_KEY_SIZE)
+        self.assertEqual(
+            cache_key[-32:],
+            hashlib.blake2b(('example.com:%s' % key).encode('utf-8'),
+                            digest_size=16)
+            .hexdigest().encode('utf-8'))
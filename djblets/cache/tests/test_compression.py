@@ -0,0 +1,85 @@
+"""Unit tests for djblets.cache.compression."""
+
+from __future__ import unicode_literals
+
+from djblets.cache import compression
+from djblets.cache.compression import (CacheCompressionCodecsRegistry,
+                                       LZ4Codec,
+                                       LZMACodec,
+                                       ZlibCodec,
+                                       ZstdCodec,
+                                       get_cache_compression_codecs_registry)
+from djblets.testing.testcases import TestCase
+
+
+class CacheCompressionCodecsTests(TestCase):
+    """Unit tests for cache compression codecs."""
+
+    def test_zlib_codec(self):
+        """Testing ZlibCodec"""
+        self._check_codec(ZlibCodec())
+
+    def test_lzma_codec(self):
+        """Testing LZMACodec"""
+        if compression.lzma is None:
+            raise self.skipTest('lzma is not available')
+
+        self._check_codec(LZMACodec())
+
+    def test_lz4_codec(self):
+        """Testing LZ4Codec"""
+        if compression.lz4 is None:
+            raise self.skipTest('lz4 is not installed')
+
+        self._check_codec(LZ4Codec())
+
+    def test_zstd_codec(self):
+        """Testing ZstdCodec"""
+        if compression.zstandard is None:
+            raise self.skipTest('zstandard is not installed')
+
+        self._check_codec(ZstdCodec())
+
+    def test_registry_defaults(self):
+        """Testing CacheCompressionCodecsRegistry default codecs"""
+        registry = CacheCompressionCodecsRegistry()
+
+        self.assertIsInstance(registry.get_codec('zlib'), ZlibCodec)
+        self.assertEqual('lzma' in set(codec.codec_id for codec in registry),
+                         compression.lzma is not None)
+
+    def test_get_cache_compression_codecs_registry(self):
+        """Testing get_cache_compression_codecs_registry"""
+        registry = get_cache_compression_codecs_registry()
+
+        self.assertIsInstance(registry, CacheCompressionCodecsRegistry)
+        self.assertIs(get_cache_compression_codecs_registry(), registry)
+
+    def _check_codec(self, codec):
+        """Check that a codec can compress and decompress data.
+
+        This will compress data in pieces, and then decompress it both all
+        at once and as a stream with a maximum block size.
+
+        Args:
+            codec (djblets.cache.compression.BaseCacheCompressionCodec):
+                The codec to test.
+        """
+        data = [b'abc' * 10000, b'', b'def' * 10000, b'ghi']
+
+        compressor = codec.compressobj()
+        compressed = b''.join(
+            [compressor.compress(block) for block in data] +
+            [compressor.flush()])
+        self.assertTrue(len(compressed) < len(b''.join(data)))
+        self.assertEqual(codec.decompress(compressed), b''.join(data))
+
+        # Split the compressed data up into small blocks, and make sure we
+        # can decompress them as a stream.
+        blocks = [
+            compressed[i:i + 10]
+            for i in range(0, len(compressed), 10)
+        ]
+        result = list(codec.iter_decompress(blocks, max_length=1000))
+
+        self.assertEqual(b''.join(result), b''.join(data))
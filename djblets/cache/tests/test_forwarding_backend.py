@@ -0,0 +1,152 @@
+"""Unit tests for djblets.cache.forwarding_backend."""
+
+from __future__ import unicode_literals
+
+import copy
+import threading
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.six.moves import queue
+from kgb import SpyAgency
+
+from djblets.cache.forwarding_backend import ForwardingCacheBackend
+from djblets.testing.testcases import TestCase
+
+
+class ForwardingCacheBackendTests(SpyAgency, TestCase):
+    """Unit tests for djblets.cache.forwarding_backend.ForwardingCacheBackend.
+    """
+
+    def setUp(self):
+        super(ForwardingCacheBackendTests, self).setUp()
+
+        self.caches_settings = self.settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+            'test-forwarded': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'test-forwarded-1',
+            },
+        })
+        self.caches_settings.enable()
+
+        self.cache = ForwardingCacheBackend('test-forwarded')
+
+    def tearDown(self):
+        self.caches_settings.disable()
+
+        super(ForwardingCacheBackendTests, self).tearDown()
+
+    def test_forwarding(self):
+        """Testing ForwardingCacheBackend forwards to the backend"""
+        self.cache.set('key', 'value')
+
+        self.assertIsInstance(self.cache.backend, LocMemCache)
+        self.assertEqual(self.cache.backend.get('key'), 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertIn('key', self.cache)
+
+    def test_backend_reused(self):
+        """Testing ForwardingCacheBackend.backend reuses the backend"""
+        self.assertIs(self.cache.backend, self.cache.backend)
+
+    def test_reset_backend(self):
+        """Testing ForwardingCacheBackend.reset_backend"""
+        old_backend = self.cache.backend
+        self.spy_on(old_backend.close)
+
+        with self.settings(CACHES={
+            'test-forwarded': {
+                'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+            },
+        }):
+            self.cache.reset_backend()
+
+            self.assertIsNot(self.cache.backend, old_backend)
+            self.assertEqual(type(self.cache.backend).__name__,
+                             'DummyCache')
+
+        self.assertTrue(old_backend.close.called)
+
+    def test_reset_backend_other_threads(self):
+        """Testing ForwardingCacheBackend.reset_backend switches other
+        threads' backends on their next request
+        """
+        other_cache = ForwardingCacheBackend('test-forwarded')
+        requests = queue.Queue()
+        backends = []
+        closed = []
+
+        def _close(*args, **kwargs):
+            closed.append(threading.current_thread())
+
+        def _worker():
+            while requests.get():
+                try:
+                    backend = other_cache.backend
+
+                    if not backends:
+                        backend.close = _close
+
+                    backends.append(backend)
+                finally:
+                    requests.task_done()
+
+            requests.task_done()
+
+        thread = threading.Thread(target=_worker)
+        thread.start()
+
+        try:
+            requests.put(True)
+            requests.join()
+
+            self.cache.reset_backend()
+
+            # The other thread's backend must not be closed from this thread.
+            self.assertEqual(closed, [])
+
+            requests.put(True)
+            requests.join()
+        finally:
+            requests.put(False)
+            thread.join()
+
+        self.assertEqual(len(backends), 2)
+        self.assertIsNot(backends[1], backends[0])
+        self.assertEqual(closed, [thread])
+
+    def test_backend_per_thread(self):
+        """Testing ForwardingCacheBackend uses a backend per thread"""
+        backends = []
+
+        def _use_backend():
+            backends.append(self.cache.backend)
+
+        thread = threading.Thread(target=_use_backend)
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(backends[0], self.cache.backend)
+
+    def test_getattr_before_init(self):
+        """Testing ForwardingCacheBackend attribute lookups before __init__
+        """
+        cache = ForwardingCacheBackend.__new__(ForwardingCacheBackend)
+
+        with self.assertRaises(AttributeError):
+            cache.get
+
+        with self.assertRaises(AttributeError):
+            cache.backend
+
+        self.assertFalse(hasattr(cache, '_local'))
+
+    def test_copy(self):
+        """Testing ForwardingCacheBackend with copy.copy"""
+        self.cache.set('key', 'value')
+
+        cache = copy.copy(self.cache)
+
+        self.assertEqual(cache.get('key'), 'value')
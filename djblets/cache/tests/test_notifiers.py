@@ -0,0 +1,224 @@
+"""Unit tests for djblets.cache.notifiers."""
+
+from __future__ import unicode_literals
+
+import shutil
+import tempfile
+import threading
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+
+from djblets.cache.notifiers import (FileSyncNotifier,
+                                     LocalSyncNotifier,
+                                     RedisSyncNotifier,
+                                     get_sync_notifier,
+                                     reset_sync_notifier)
+from djblets.testing.testcases import TestCase
+
+
+class MessageCollector(object):
+    """Collects messages dispatched by a notifier."""
+
+    def __init__(self):
+        self.messages = []
+
+    def __call__(self, channel, message):
+        self.messages.append((channel, message))
+
+
+class StandInRedisPubSub(object):
+    """A stand-in for a Redis pub/sub connection, recording subscriptions."""
+
+    def __init__(self):
+        self.patterns = {}
+        self.subscribe_threads = []
+        self.stopped = threading.Event()
+
+    def psubscribe(self, **patterns):
+        self.patterns.update(patterns)
+        self.subscribe_threads.append(threading.current_thread())
+
+    def listen(self):
+        self.stopped.wait()
+
+        return iter([])
+
+
+class StandInRedisClient(object):
+    """A stand-in for a Redis client, recording published messages."""
+
+    def __init__(self):
+        self.published = []
+        self.pubsubs = []
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+    def pubsub(self, **kwargs):
+        pubsub = StandInRedisPubSub()
+        self.pubsubs.append(pubsub)
+
+        return pubsub
+
+
+class LocalSyncNotifierTests(TestCase):
+    """Unit tests for djblets.cache.notifiers.LocalSyncNotifier."""
+
+    def test_publish(self):
+        """Testing LocalSyncNotifier.publish"""
+        notifier = LocalSyncNotifier()
+        collector1 = MessageCollector()
+        collector2 = MessageCollector()
+
+        notifier.subscribe('channel1', collector1)
+        notifier.subscribe('channel2', collector2)
+        notifier.publish('channel1', '123')
+
+        self.assertEqual(collector1.messages, [('channel1', '123')])
+        self.assertEqual(collector2.messages, [])
+
+    def test_unsubscribe(self):
+        """Testing LocalSyncNotifier.unsubscribe"""
+        notifier = LocalSyncNotifier()
+        collector = MessageCollector()
+
+        notifier.subscribe('channel1', collector)
+        notifier.unsubscribe('channel1', collector)
+        notifier.publish('channel1', '123')
+
+        self.assertEqual(collector.messages, [])
+
+    def test_dispatch_with_handler_error(self):
+        """Testing LocalSyncNotifier.dispatch with a handler raising an error
+        """
+        def _handler(channel, message):
+            raise Exception('Oh no')
+
+        notifier = LocalSyncNotifier()
+        collector = MessageCollector()
+
+        notifier.subscribe('channel1', _handler)
+        notifier.subscribe('channel1', collector)
+        notifier.publish('channel1', '123')
+
+        self.assertEqual(collector.messages, [('channel1', '123')])
+
+
+class FileSyncNotifierTests(TestCase):
+    """Unit tests for djblets.cache.notifiers.FileSyncNotifier."""
+
+    def setUp(self):
+        super(FileSyncNotifierTests, self).setUp()
+
+        self.path = tempfile.mkdtemp(prefix='djblets-sync-tests')
+
+    def tearDown(self):
+        super(FileSyncNotifierTests, self).tearDown()
+
+        shutil.rmtree(self.path)
+
+    def test_publish(self):
+        """Testing FileSyncNotifier.publish delivers to other notifiers"""
+        publisher = FileSyncNotifier(path=self.path)
+        subscriber = FileSyncNotifier(path=self.path, poll_interval=0.01)
+        collector = MessageCollector()
+
+        subscriber.subscribe('channel1', collector)
+        self.assertTrue(subscriber.is_connected)
+        self.assertFalse(publisher.is_connected)
+
+        publisher.publish('channel1', '123')
+
+        for i in range(200):
+            if collector.messages:
+                break
+
+            time.sleep(0.01)
+
+        self.assertEqual(collector.messages, [('channel1', '123')])
+
+
+class RedisSyncNotifierTests(TestCase):
+    """Unit tests for djblets.cache.notifiers.RedisSyncNotifier."""
+
+    def test_publish(self):
+        """Testing RedisSyncNotifier.publish"""
+        client = StandInRedisClient()
+        notifier = RedisSyncNotifier(client=client)
+        notifier.publish('channel1', '123')
+
+        self.assertEqual(client.published,
+                         [('djblets-sync:channel1', '123')])
+
+    def test_subscribe(self):
+        """Testing RedisSyncNotifier.subscribe only subscribes in Redis
+        before the listener thread starts
+        """
+        client = StandInRedisClient()
+        notifier = RedisSyncNotifier(client=client)
+        collector = MessageCollector()
+
+        try:
+            notifier.subscribe('channel1', collector)
+            notifier.subscribe('channel2', collector)
+
+            self.assertTrue(notifier.is_connected)
+            self.assertEqual(len(client.pubsubs), 1)
+
+            pubsub = client.pubsubs[0]
+            self.assertEqual(list(pubsub.patterns), ['djblets-sync:*'])
+            self.assertEqual(pubsub.subscribe_threads,
+                             [threading.current_thread()])
+        finally:
+            for pubsub in client.pubsubs:
+                pubsub.stopped.set()
+
+    def test_on_message(self):
+        """Testing RedisSyncNotifier dispatches messages from Redis"""
+        notifier = RedisSyncNotifier(client=StandInRedisClient())
+        collector = MessageCollector()
+
+        notifier._handlers['channel1'] = set([collector])
+        notifier._on_message({
+            'channel': b'djblets-sync:channel1',
+            'data': b'123',
+        })
+
+        self.assertEqual(collector.messages, [('channel1', '123')])
+
+
+class GetSyncNotifierTests(TestCase):
+    """Unit tests for djblets.cache.notifiers.get_sync_notifier."""
+
+    def tearDown(self):
+        super(GetSyncNotifierTests, self).tearDown()
+
+        reset_sync_notifier()
+
+    def test_get_sync_notifier_default(self):
+        """Testing get_sync_notifier with no configured notifier"""
+        reset_sync_notifier()
+
+        self.assertIsNone(get_sync_notifier())
+
+    def test_get_sync_notifier_with_setting(self):
+        """Testing get_sync_notifier with settings.CACHE_SYNC_NOTIFIER"""
+        reset_sync_notifier()
+
+        with self.settings(
+            CACHE_SYNC_NOTIFIER='djblets.cache.notifiers.LocalSyncNotifier'):
+            notifier = get_sync_notifier()
+
+        self.assertIsInstance(notifier, LocalSyncNotifier)
+        self.assertIs(get_sync_notifier(), notifier)
+
+    def test_get_sync_notifier_with_invalid_setting(self):
+        """Testing get_sync_notifier with an invalid
+        settings.CACHE_SYNC_NOTIFIER
+        """
+        reset_sync_notifier()
+
+        with self.settings(CACHE_SYNC_NOTIFIER='djblets.cache.notifiers.Bad'):
+            with self.assertRaises(ImproperlyConfigured):
+                get_sync_notifier()
@@ -0,0 +1,103 @@
+"""Unit tests for djblets.cache.serializers."""
+
+from __future__ import unicode_literals
+
+import io
+
+from django.utils.six.moves import cPickle as pickle
+
+from djblets.cache.serializers import (CacheSerializersRegistry,
+                                       JSONSerializer,
+                                       MarshalSerializer,
+                                       PickleSerializer,
+                                       get_cache_serializers_registry)
+from djblets.testing.testcases import TestCase
+
+
+class CacheSerializersTests(TestCase):
+    """Unit tests for cache serializers."""
+
+    def test_pickle_serializer(self):
+        """Testing PickleSerializer"""
+        serializer = PickleSerializer('pickle', protocol=0)
+        data = serializer.dumps({'a': 1})
+
+        self.assertEqual(data, pickle.dumps({'a': 1}, protocol=0))
+        self._check_round_trip(serializer, [{'a': 1}, ('b', 2), None])
+
+    def test_pickle_serializer_loads_any_protocol(self):
+        """Testing PickleSerializer loads data from other pickle protocols"""
+        fp = io.BytesIO(pickle.dumps([1, 2], protocol=2))
+
+        self.assertEqual(PickleSerializer('pickle', protocol=0).load(fp),
+                         [1, 2])
+
+    def test_pickle_buffer_serializer(self):
+        """Testing PickleBufferSerializer"""
+        if pickle.HIGHEST_PROTOCOL < 5:
+            raise self.skipTest('Pickle protocol 5 is not supported')
+
+        from djblets.cache.serializers import PickleBufferSerializer
+
+        self._check_round_trip(PickleBufferSerializer(), [
+            bytearray(b'x' * 1000),
+            {'a': bytearray(b'abc'), 'b': 'def'},
+            'test',
+        ])
+
+    def test_marshal_serializer(self):
+        """Testing MarshalSerializer"""
+        self._check_round_trip(MarshalSerializer(),
+                               [{'a': [1, 2]}, 'abc', b'', 1.5])
+
+    def test_json_serializer(self):
+        """Testing JSONSerializer"""
+        self._check_round_trip(JSONSerializer(),
+                               [{'a': [1, 2]}, 'abc\n123', None, 1.5])
+
+    def test_load_with_truncated_data(self):
+        """Testing BaseCacheSerializer.load with truncated data"""
+        serializer = JSONSerializer()
+        fp = io.BytesIO(serializer.dumps('abc123')[:-2])
+
+        with self.assertRaises(EOFError):
+            serializer.load(fp)
+
+    def test_registry_defaults(self):
+        """Testing CacheSerializersRegistry default serializers"""
+        registry = CacheSerializersRegistry()
+
+        for serializer_id in ('pickle', 'pickle-2', 'marshal', 'json'):
+            self.assertEqual(
+                registry.get_serializer(serializer_id).serializer_id,
+                serializer_id)
+
+        self.assertEqual(registry.get_serializer('pickle').protocol, 0)
+
+    def test_get_cache_serializers_registry(self):
+        """Testing get_cache_serializers_registry"""
+        registry = get_cache_serializers_registry()
+
+        self.assertIsInstance(registry, CacheSerializersRegistry)
+        self.assertIs(get_cache_serializers_registry(), registry)
+
+    def _check_round_trip(self, serializer, items):
+        """Check that items can be written to and read from a stream.
+
+        Args:
+            serializer (djblets.cache.serializers.BaseCacheSerializer):
+                The serializer to test.
+
+            items (list):
+                The items to serialize.
+        """
+        fp = io.BytesIO(b''.join(
+            serializer.dumps(item)
+            for item in items
+        ))
+
+        for item in items:
+            self.assertEqual(serializer.load(fp), item)
+
+        with self.assertRaises(EOFError):
+            serializer.load(fp)
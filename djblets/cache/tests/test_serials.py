@@ -0,0 +1,247 @@
+"""Unit tests for djblets.cache.serials."""
+
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from kgb import SpyAgency
+
+from djblets.cache import serials
+from djblets.cache.serials import (SERIAL_MANIFEST_VERSION,
+                                   generate_locale_serial,
+                                   generate_media_serial,
+                                   get_latest_mtime)
+from djblets.testing.testcases import TestCase
+
+
+class GetLatestMTimeTests(SpyAgency, TestCase):
+    """Unit tests for djblets.cache.serials.get_latest_mtime."""
+
+    def setUp(self):
+        super(GetLatestMTimeTests, self).setUp()
+
+        self.tempdir = tempfile.mkdtemp(prefix='djblets-serials-tests')
+        self.root = os.path.join(self.tempdir, 'root')
+        self.manifest_file = os.path.join(self.tempdir, 'manifest.json')
+
+        self._write_file('a.txt', 1000)
+        self._write_file('sub/b.txt', 3000)
+        self._write_file('sub/deep/c.mo', 2000)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+        super(GetLatestMTimeTests, self).tearDown()
+
+    def test_get_latest_mtime(self):
+        """Testing get_latest_mtime"""
+        self.assertEqual(get_latest_mtime([self.root], 'test'), 3000)
+
+    def test_get_latest_mtime_with_file_filter(self):
+        """Testing get_latest_mtime with file_filter"""
+        self.assertEqual(
+            get_latest_mtime([self.root], 'test',
+                             file_filter=lambda name: name.endswith('.mo')),
+            2000)
+
+    def test_get_latest_mtime_with_missing_dir(self):
+        """Testing get_latest_mtime with a missing directory"""
+        self.assertEqual(
+            get_latest_mtime([os.path.join(self.tempdir, 'missing')],
+                             'test'),
+            0)
+
+    def test_get_latest_mtime_with_threads(self):
+        """Testing get_latest_mtime with settings.SERIAL_SCAN_THREADS"""
+        with self.settings(SERIAL_SCAN_THREADS=4):
+            self.assertEqual(get_latest_mtime([self.root], 'test'), 3000)
+
+    def test_get_latest_mtime_with_manifest(self):
+        """Testing get_latest_mtime with settings.SERIAL_MANIFEST_FILE saves
+        the manifest
+        """
+        with self.settings(SERIAL_MANIFEST_FILE=self.manifest_file):
+            self.assertEqual(get_latest_mtime([self.root], 'test'), 3000)
+
+        with open(self.manifest_file, 'r') as fp:
+            manifest = json.load(fp)
+
+        self.assertEqual(manifest['version'], SERIAL_MANIFEST_VERSION)
+        self.assertEqual(
+            set(manifest['sections']['test']['entries']),
+            set([
+                self.root,
+                os.path.join(self.root, 'sub'),
+                os.path.join(self.root, 'sub', 'deep'),
+            ]))
+
+    def test_get_latest_mtime_with_manifest_reuses_entries(self):
+        """Testing get_latest_mtime with settings.SERIAL_MANIFEST_FILE only
+        re-reads changed directories
+        """
+        with self.settings(SERIAL_MANIFEST_FILE=self.manifest_file):
+            get_latest_mtime([self.root], 'test')
+
+            # Add a new file to one directory. Only that directory should
+            # be re-read.
+            self._write_file('sub/d.txt', 4000)
+
+            self.spy_on(serials._scan_directory)
+
+            self.assertEqual(get_latest_mtime([self.root], 'test'), 4000)
+
+        rescanned = [
+            call.args[0]
+            for call in serials._scan_directory.spy.calls
+            if call.return_value is not call.args[1]
+        ]
+        self.assertEqual(rescanned, [os.path.join(self.root, 'sub')])
+
+    def test_get_latest_mtime_with_invalid_manifest(self):
+        """Testing get_latest_mtime with an invalid manifest file"""
+        with open(self.manifest_file, 'w') as fp:
+            fp.write('{invalid')
+
+        with self.settings(SERIAL_MANIFEST_FILE=self.manifest_file):
+            self.assertEqual(get_latest_mtime([self.root], 'test'), 3000)
+
+    def test_generate_media_serial(self):
+        """Testing generate_media_serial"""
+        with self.settings(STATIC_ROOT=self.root,
+                           MEDIA_SERIAL=0,
+                           MEDIA_SERIAL_DIRS=['sub']):
+            from django.conf import settings
+
+            generate_media_serial()
+
+            self.assertEqual(settings.MEDIA_SERIAL, 3000)
+
+    def _write_file(self, path, mtime):
+        """Write a file in the test tree with the given modification time."""
+        path = os.path.join(self.root, path)
+        dirname = os.path.dirname(path)
+
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        with open(path, 'w') as fp:
+            fp.write('test')
+
+        os.utime(path, (mtime, mtime))
+
+
+class GenerateLocaleSerialTests(TestCase):
+    """Unit tests for djblets.cache.serials.generate_locale_serial."""
+
+    def setUp(self):
+        super(GenerateLocaleSerialTests, self).setUp()
+
+        self.tempdir = tempfile.mkdtemp(prefix='djblets-serials-tests')
+        self.manifest_file = os.path.join(self.tempdir, 'manifest.json')
+        sys.path.insert(0, self.tempdir)
+
+        self._write_package('djblets_serials_pkg1', '1.0', 1000)
+        self._write_package('djblets_serials_pkg2', '2.0', 2000)
+
+        serials._locale_serials.clear()
+
+    def tearDown(self):
+        sys.path.remove(self.tempdir)
+        sys.modules.pop('djblets_serials_pkg1', None)
+        sys.modules.pop('djblets_serials_pkg2', None)
+        shutil.rmtree(self.tempdir)
+        serials._locale_serials.clear()
+
+        super(GenerateLocaleSerialTests, self).tearDown()
+
+    def test_generate_locale_serial(self):
+        """Testing generate_locale_serial"""
+        self.assertEqual(
+            generate_locale_serial(['djblets_serials_pkg1',
+                                    'djblets_serials_pkg2']),
+            2000)
+
+    def test_generate_locale_serial_with_threads(self):
+        """Testing generate_locale_serial with settings.SERIAL_SCAN_THREADS
+        """
+        with self.settings(SERIAL_SCAN_THREADS=2):
+            self.assertEqual(
+                generate_locale_serial(['djblets_serials_pkg1',
+                                        'djblets_serials_pkg2']),
+                2000)
+
+    def test_generate_locale_serial_with_bad_package(self):
+        """Testing generate_locale_serial with a package that can't be
+        imported
+        """
+        self.assertEqual(
+            generate_locale_serial(['djblets_serials_pkg1',
+                                    'djblets_serials_bad']),
+            1000)
+
+    def test_generate_locale_serial_computed_once(self):
+        """Testing generate_locale_serial computes the serial once per
+        process
+        """
+        packages = ['djblets_serials_pkg1']
+
+        self.assertEqual(generate_locale_serial(packages), 1000)
+
+        self._write_package('djblets_serials_pkg1', '1.0', 3000)
+        self.assertEqual(generate_locale_serial(packages), 1000)
+
+    def test_generate_locale_serial_with_manifest_version_change(self):
+        """Testing generate_locale_serial with settings.SERIAL_MANIFEST_FILE
+        rescans packages when their versions change
+        """
+        packages = ['djblets_serials_pkg1']
+
+        with self.settings(SERIAL_MANIFEST_FILE=self.manifest_file):
+            self.assertEqual(generate_locale_serial(packages), 1000)
+
+            with open(self.manifest_file, 'r') as fp:
+                manifest = json.load(fp)
+
+            self.assertEqual(
+                manifest['sections']['locale:djblets_serials_pkg1']['key'],
+                '1.0')
+
+            # Modify the catalog in place, which won't change the directory's
+            # modification time. Only a version change will pick this up.
+            mo_path = os.path.join(self.tempdir, 'djblets_serials_pkg1',
+                                   'locale', 'en', 'LC_MESSAGES',
+                                   'django.mo')
+            os.utime(mo_path, (3000, 3000))
+
+            serials._locale_serials.clear()
+            self.assertEqual(generate_locale_serial(packages), 1000)
+
+            sys.modules['djblets_serials_pkg1'].__version__ = '1.1'
+            serials._locale_serials.clear()
+            self.assertEqual(generate_locale_serial(packages), 3000)
+
+    def _write_package(self, name, version, mtime):
+        """Write a package with a compiled catalog to the test directory."""
+        package_dir = os.path.join(self.tempdir, name)
+        messages_dir = os.path.join(package_dir, 'locale', 'en',
+                                    'LC_MESSAGES')
+
+        if not os.path.exists(messages_dir):
+            os.makedirs(messages_dir)
+
+        with open(os.path.join(package_dir, '__init__.py'), 'w') as fp:
+            fp.write('__version__ = %r\n' % version)
+
+        # Only the compiled catalog should be considered.
+        for filename, file_mtime in (('django.mo', mtime),
+                                     ('django.po', mtime + 1000)):
+            path = os.path.join(messages_dir, filename)
+
+            with open(path, 'w') as fp:
+                fp.write('test')
+
+            os.utime(path, (file_mtime, file_mtime))
@@ -0,0 +1,209 @@
+"""Unit tests for djblets.cache.stats."""
+
+from __future__ import unicode_literals
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+
+from djblets.cache.backend import (cache_memoize, cache_memoize_many,
+                                   disable_local_cache, enable_local_cache)
+from djblets.cache.signals import cache_hit
+from djblets.cache.stats import (CacheStats, MemoryCacheStatsSink,
+                                 begin_request_stats, end_request_stats,
+                                 get_cache_key_prefix, get_cache_stats_sink,
+                                 reset_cache_stats_sink)
+from djblets.cache.synchronizer import GenerationSynchronizer
+from djblets.testing.testcases import TestCase
+
+
+class CacheStatsTests(TestCase):
+    """Unit tests for djblets.cache.stats.CacheStats."""
+
+    def test_hit_ratio(self):
+        """Testing CacheStats.hit_ratio"""
+        stats = CacheStats()
+        self.assertIsNone(stats.hit_ratio)
+
+        stats.record('hit', {'source': 'cache'})
+        stats.record('hit', {'source': 'local'})
+        stats.record('hit', {'source': 'cache'})
+        stats.record('miss', {})
+
+        self.assertEqual(stats.hits, 3)
+        self.assertEqual(stats.local_hits, 1)
+        self.assertEqual(stats.misses, 1)
+        self.assertEqual(stats.hit_ratio, 0.75)
+
+    def test_merge(self):
+        """Testing CacheStats.merge"""
+        stats1 = CacheStats()
+        stats1.record('hit', {'chunk_count': 2, 'data_size': 100})
+
+        stats2 = CacheStats()
+        stats2.record('recomputed', {'recompute_time': 0.5,
+                                     'chunk_count': 1,
+                                     'data_size': 50})
+
+        stats1.merge(stats2)
+
+        self.assertEqual(stats1.hits, 1)
+        self.assertEqual(stats1.recomputes, 1)
+        self.assertEqual(stats1.chunk_count, 3)
+        self.assertEqual(stats1.data_size, 150)
+        self.assertEqual(stats1.recompute_time, 0.5)
+
+
+class GetCacheKeyPrefixTests(TestCase):
+    """Unit tests for djblets.cache.stats.get_cache_key_prefix."""
+
+    def test_get_cache_key_prefix(self):
+        """Testing get_cache_key_prefix"""
+        self.assertEqual(get_cache_key_prefix('diff-sidebyside-123'),
+                         'diff')
+        self.assertEqual(get_cache_key_prefix('user:123'), 'user')
+        self.assertEqual(get_cache_key_prefix('file/a/b'), 'file')
+        self.assertEqual(get_cache_key_prefix('simple'), 'simple')
+        self.assertEqual(get_cache_key_prefix(b'bytes-key'), 'bytes')
+
+
+class CacheEventTests(TestCase):
+    """Unit tests for recording events from cache operations."""
+
+    def setUp(self):
+        super(CacheEventTests, self).setUp()
+
+        cache.clear()
+        reset_cache_stats_sink()
+
+    def tearDown(self):
+        end_request_stats()
+        reset_cache_stats_sink()
+
+        super(CacheEventTests, self).tearDown()
+
+    def test_cache_memoize(self):
+        """Testing cache_memoize records misses, recomputes, and hits"""
+        begin_request_stats()
+
+        cache_memoize('stats-test-1', lambda: 'value')
+        cache_memoize('stats-test-1', lambda: 'value')
+        cache_memoize('stats-test-1', lambda: 'value')
+
+        stats = end_request_stats()
+
+        self.assertEqual(list(stats), ['stats'])
+        self.assertEqual(stats['stats'].misses, 1)
+        self.assertEqual(stats['stats'].recomputes, 1)
+        self.assertEqual(stats['stats'].hits, 2)
+
+    def test_cache_memoize_with_local_cache(self):
+        """Testing cache_memoize records local cache hits"""
+        enable_local_cache('stats-local-')
+
+        try:
+            begin_request_stats()
+
+            cache_memoize('stats-local-1', lambda: 'value')
+            cache_memoize('stats-local-1', lambda: 'value')
+
+            stats = end_request_stats()
+        finally:
+            disable_local_cache('stats-local-')
+
+        self.assertEqual(stats['stats'].misses, 1)
+        self.assertEqual(stats['stats'].hits, 1)
+        self.assertEqual(stats['stats'].local_hits, 1)
+
+    def test_cache_memoize_large_data(self):
+        """Testing cache_memoize with large_data=True records chunk
+        statistics
+        """
+        begin_request_stats()
+
+        cache_memoize('stats-large', lambda: 'value' * 100, large_data=True)
+        cache_memoize('stats-large', lambda: 'value' * 100, large_data=True)
+
+        stats = end_request_stats()['stats']
+
+        self.assertEqual(stats.misses, 1)
+        self.assertEqual(stats.recomputes, 1)
+        self.assertEqual(stats.hits, 1)
+        self.assertEqual(stats.chunk_count, 2)
+        self.assertGreater(stats.data_size, 0)
+
+    def test_cache_memoize_many(self):
+        """Testing cache_memoize_many records misses, recomputes, and hits"""
+        cache_memoize('many-1', lambda: 'value')
+
+        begin_request_stats()
+        cache_memoize_many(
+            ['many-1', 'many-2', 'many-3'],
+            lambda keys: dict((key, key) for key in keys))
+        stats = end_request_stats()['many']
+
+        self.assertEqual(stats.hits, 1)
+        self.assertEqual(stats.misses, 2)
+        self.assertEqual(stats.recomputes, 2)
+
+    def test_generation_checks(self):
+        """Testing GenerationSynchronizer.is_expired records generation
+        checks
+        """
+        synchronizer1 = GenerationSynchronizer('sync-stats')
+        synchronizer2 = GenerationSynchronizer('sync-stats')
+
+        begin_request_stats()
+        self.assertFalse(synchronizer1.is_expired())
+        synchronizer1.mark_updated()
+        self.assertTrue(synchronizer2.is_expired())
+        stats = end_request_stats()['sync']
+
+        self.assertEqual(stats.generation_checks, 2)
+        self.assertEqual(stats.generation_cache_checks, 2)
+        self.assertEqual(stats.generations_expired, 1)
+
+    def test_signals(self):
+        """Testing cache_memoize emits cache_hit"""
+        received = []
+
+        def _on_hit(**kwargs):
+            received.append((kwargs['key'], kwargs['key_prefix'],
+                             kwargs['source']))
+
+        cache_hit.connect(_on_hit)
+
+        try:
+            cache_memoize('signal-test', lambda: 'value')
+            cache_memoize('signal-test', lambda: 'value')
+        finally:
+            cache_hit.disconnect(_on_hit)
+
+        self.assertEqual(received, [('signal-test', 'signal', 'cache')])
+
+    def test_sink(self):
+        """Testing cache events are passed to settings.CACHE_STATS_SINK"""
+        with self.settings(
+            CACHE_STATS_SINK='djblets.cache.stats.MemoryCacheStatsSink'):
+            sink = get_cache_stats_sink()
+
+            cache_memoize('sink-test', lambda: 'value')
+            cache_memoize('sink-test', lambda: 'value')
+
+        self.assertIsInstance(sink, MemoryCacheStatsSink)
+
+        stats = sink.get_stats()
+        self.assertEqual(list(stats), ['sink'])
+        self.assertEqual(stats['sink']['hits'], 1)
+        self.assertEqual(stats['sink']['misses'], 1)
+        self.assertEqual(stats['sink']['hit_ratio'], 0.5)
+
+        sink.reset()
+        self.assertEqual(sink.get_stats(), {})
+
+    def test_sink_with_invalid_setting(self):
+        """Testing get_cache_stats_sink with an invalid
+        settings.CACHE_STATS_SINK
+        """
+        with self.settings(CACHE_STATS_SINK='djblets.cache.stats.Bad'):
+            with self.assertRaises(ImproperlyConfigured):
+                get_cache_stats_sink()
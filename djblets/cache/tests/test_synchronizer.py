@@ -1,8 +1,14 @@
 from __future__ import unicode_literals
 
 from django.core.cache import cache
+from django.http import HttpResponse
+from django.test.client import RequestFactory
+from kgb import SpyAgency
 
-from djblets.cache.synchronizer import GenerationSynchronizer
+from djblets.cache.middleware import GenerationSyncMiddleware
+from djblets.cache.notifiers import LocalSyncNotifier
+from djblets.cache.synchronizer import (GenerationSynchronizer,
+                                        get_generation_synchronizer_registry)
 from djblets.testing.testcases import TestCase
 
 
@@ -48,3 +54,175 @@ class GenerationSynchronizerTests(TestCase):
         self.assertEqual(self.gen_sync.sync_gen, sync_gen + 1)
         self.assertEqual(cache.get(self.gen_sync.cache_key),
                          self.gen_sync.sync_gen)
+
+
+class GenerationSynchronizerNotifierTests(SpyAgency, TestCase):
+    """Unit tests for djblets.cache.synchronizer.GenerationSynchronizer with
+    notifiers.
+    """
+
+    def setUp(self):
+        super(GenerationSynchronizerNotifierTests, self).setUp()
+
+        self.notifier = LocalSyncNotifier()
+        self.gen_sync1 = GenerationSynchronizer('test-synchronizer',
+                                                notifier=self.notifier)
+        self.gen_sync2 = GenerationSynchronizer('test-synchronizer',
+                                                notifier=self.notifier)
+
+    def tearDown(self):
+        super(GenerationSynchronizerNotifierTests, self).tearDown()
+
+        cache.clear()
+
+    def test_is_expired_after_first_check(self):
+        """Testing GenerationSynchronizer.is_expired with a notifier doesn't
+        check the cache after the first check
+        """
+        self.assertFalse(self.gen_sync2.is_expired())
+
+        self.spy_on(cache.get)
+        cache.set(self.gen_sync2.cache_key, self.gen_sync2.sync_gen + 1)
+
+        self.assertFalse(self.gen_sync2.is_expired())
+        self.assertFalse(cache.get.called)
+
+    def test_is_expired_after_mark_updated(self):
+        """Testing GenerationSynchronizer.is_expired with a notifier after
+        mark_updated in another synchronizer
+        """
+        self.assertFalse(self.gen_sync2.is_expired())
+
+        self.gen_sync1.mark_updated()
+        self.spy_on(cache.get)
+
+        self.assertTrue(self.gen_sync2.is_expired())
+        self.assertFalse(self.gen_sync1.is_expired())
+        self.assertFalse(cache.get.called)
+
+        self.gen_sync2.refresh()
+        self.assertFalse(self.gen_sync2.is_expired())
+
+    def test_is_expired_after_clear(self):
+        """Testing GenerationSynchronizer.is_expired with a notifier after
+        clear in another synchronizer
+        """
+        self.assertFalse(self.gen_sync2.is_expired())
+
+        self.gen_sync1.clear()
+
+        self.assertTrue(self.gen_sync2.is_expired())
+
+    def test_is_expired_after_reconnect(self):
+        """Testing GenerationSynchronizer.is_expired with a notifier checks
+        the cache after the notifier reconnects
+        """
+        self.assertFalse(self.gen_sync2.is_expired())
+
+        cache.set(self.gen_sync2.cache_key, self.gen_sync2.sync_gen + 1)
+        self.notifier.connection_id += 1
+
+        self.assertTrue(self.gen_sync2.is_expired())
+
+
+class GenerationSynchronizerRegistryTests(SpyAgency, TestCase):
+    """Unit tests for
+    djblets.cache.synchronizer.GenerationSynchronizerRegistry.
+    """
+
+    def setUp(self):
+        super(GenerationSynchronizerRegistryTests, self).setUp()
+
+        self.registry = get_generation_synchronizer_registry()
+        self.gen_sync1 = GenerationSynchronizer('test-synchronizer-1')
+        self.gen_sync2 = GenerationSynchronizer('test-synchronizer-2')
+
+    def tearDown(self):
+        super(GenerationSynchronizerRegistryTests, self).tearDown()
+
+        self.registry.end_batch()
+        cache.clear()
+
+    def test_begin_batch(self):
+        """Testing GenerationSynchronizerRegistry.begin_batch fetches all
+        generations at once
+        """
+        cache.set(self.gen_sync2.cache_key, self.gen_sync2.sync_gen + 1)
+
+        self.spy_on(cache.get_many)
+        self.registry.begin_batch()
+
+        self.spy_on(cache.get)
+
+        self.assertFalse(self.gen_sync1.is_expired())
+        self.assertTrue(self.gen_sync2.is_expired())
+        self.assertEqual(len(cache.get_many.calls), 1)
+        self.assertFalse(cache.get.called)
+
+        keys = set(cache.get_many.last_call.args[0])
+        self.assertIn(self.gen_sync1.cache_key, keys)
+        self.assertIn(self.gen_sync2.cache_key, keys)
+
+    def test_batch_with_mark_updated(self):
+        """Testing GenerationSynchronizerRegistry batch with
+        GenerationSynchronizer.mark_updated
+        """
+        other_gen_sync = GenerationSynchronizer('test-synchronizer-1')
+
+        self.registry.begin_batch()
+        self.gen_sync1.mark_updated()
+
+        self.assertFalse(self.gen_sync1.is_expired())
+        self.assertTrue(other_gen_sync.is_expired())
+
+    def test_batch_with_clear(self):
+        """Testing GenerationSynchronizerRegistry batch with
+        GenerationSynchronizer.clear
+        """
+        self.registry.begin_batch()
+        self.gen_sync1.clear()
+
+        self.assertTrue(self.gen_sync1.is_expired())
+
+    def test_end_batch(self):
+        """Testing GenerationSynchronizerRegistry.end_batch"""
+        self.registry.begin_batch()
+        self.registry.end_batch()
+
+        cache.set(self.gen_sync1.cache_key, self.gen_sync1.sync_gen + 1)
+
+        self.assertTrue(self.gen_sync1.is_expired())
+
+    def test_begin_batch_with_interval(self):
+        """Testing GenerationSynchronizerRegistry.begin_batch with
+        settings.CACHE_GENERATION_SYNC_INTERVAL
+        """
+        with self.settings(CACHE_GENERATION_SYNC_INTERVAL=60):
+            self.registry.begin_batch()
+            self.registry.end_batch()
+
+            cache.set(self.gen_sync1.cache_key, self.gen_sync1.sync_gen + 1)
+
+            self.spy_on(cache.get_many)
+            self.registry.begin_batch()
+
+            self.assertFalse(self.gen_sync1.is_expired())
+            self.assertFalse(cache.get_many.called)
+
+    def test_middleware(self):
+        """Testing GenerationSyncMiddleware"""
+        middleware = GenerationSyncMiddleware()
+        request = RequestFactory().get('/')
+        response = HttpResponse()
+
+        self.spy_on(cache.get_many)
+        middleware.process_request(request)
+
+        self.spy_on(cache.get)
+        self.assertFalse(self.gen_sync1.is_expired())
+        self.assertFalse(cache.get.called)
+
+        self.assertIs(middleware.process_response(request, response),
+                      response)
+        self.assertFalse(self.gen_sync1.is_expired())
+        self.assertTrue(cache.get.called)
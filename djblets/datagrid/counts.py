@@ -0,0 +1,499 @@
+"""Strategies for counting the results shown in a datagrid.
+
+Datagrids normally count every result matching their queryset in order to
+show page numbers, which requires a full ``COUNT(*)`` query on each render.
+For large datasets, this is often the slowest part of rendering the grid.
+
+A :py:class:`~djblets.datagrid.grids.DataGrid` can instead be given a count
+provider through its ``count_provider`` attribute. The following providers
+are available:
+
+:py:class:`ExactCountProvider`:
+    Counts all results on every render. This is the default.
+
+:py:class:`CachedCountProvider`:
+    Caches the count, keyed by the SQL for the query and, optionally, the
+    generation of a :py:class:`~djblets.cache.synchronizer.
+    GenerationSynchronizer`.
+
+:py:class:`EstimatedCountProvider`:
+    Uses the database's query planner statistics to estimate large counts.
+
+:py:class:`UncountedProvider`:
+    Never counts results. The paginator will only know whether there are
+    more pages after the current one.
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import logging
+
+from django.core.paginator import (EmptyPage, Page, PageNotAnInteger,
+                                   QuerySetPaginator)
+from django.db import DatabaseError, connections
+from django.utils import six
+from django.utils.functional import cached_property
+
+from djblets.cache.backend import cache_memoize
+
+
+logger = logging.getLogger(__name__)
+
+
+class BaseCountProvider(object):
+    """Base class for a provider of datagrid result counts.
+
+    Subclasses must implement :py:meth:`get_count`.
+    """
+
+    def get_count(self, queryset):
+        """Return the number of results for a queryset.
+
+        Args:
+            queryset (django.db.models.query.QuerySet):
+                The queryset to count.
+
+        Returns:
+            int:
+            The number of results, or ``None`` if the results aren't
+            counted.
+        """
+        raise NotImplementedError
+
+
+class ExactCountProvider(BaseCountProvider):
+    """Counts all results for the queryset each time.
+
+    This matches the behavior of a standard Django paginator.
+    """
+
+    def get_count(self, queryset):
+        """Return the number of results for a queryset.
+
+        Args:
+            queryset (django.db.models.query.QuerySet):
+                The queryset to count.
+
+        Returns:
+            int:
+            The number of results.
+        """
+        return _count_queryset(queryset)
+
+
+class CachedCountProvider(BaseCountProvider):
+    """Caches the number of results for a queryset.
+
+    Counts are cached using :py:func:`~djblets.cache.backend.cache_memoize`,
+    keyed by a hash of the SQL for the query. If a
+    :py:class:`~djblets.cache.synchronizer.GenerationSynchronizer` is
+    provided, its generation becomes part of the key, so that calling its
+    :py:meth:`~djblets.cache.synchronizer.GenerationSynchronizer.
+    mark_updated` when the data changes will cause counts to be recomputed.
+
+    Querysets that can't produce SQL are counted each time.
+
+    Attributes:
+        expiration (int):
+            The number of seconds to cache each count for.
+
+        synchronizer (djblets.cache.synchronizer.GenerationSynchronizer):
+            The synchronizer whose generation is used in the key, if any.
+    """
+
+    def __init__(self, expiration=5 * 60, synchronizer=None):
+        """Initialize the provider.
+
+        Args:
+            expiration (int, optional):
+                The number of seconds to cache each count for.
+
+            synchronizer (djblets.cache.synchronizer.GenerationSynchronizer,
+                          optional):
+                The synchronizer whose generation is used in the key.
+        """
+        self.expiration = expiration
+        self.synchronizer = synchronizer
+
+    def get_count(self, queryset):
+        """Return the number of results for a queryset.
+
+        Args:
+            queryset (django.db.models.query.QuerySet):
+                The queryset to count.
+
+        Returns:
+            int:
+            The number of results, which may be up to :py:attr:`expiration`
+            seconds old.
+        """
+        try:
+            sql, params = queryset.order_by().query.sql_with_params()
+        except Exception:
+            # This isn't a standard queryset, or the query can't produce
+            # SQL (for instance, if it will never match any rows).
+            return _count_queryset(queryset)
+
+        key = 'datagrid-count-%s' % hashlib.sha1(
+            ('%s:%r' % (sql, params)).encode('utf-8')).hexdigest()
+
+        synchronizer = self.synchronizer
+
+        if synchronizer is not None:
+            if synchronizer.is_expired():
+                synchronizer.refresh()
+
+            key = '%s-%s' % (key, synchronizer.sync_gen)
+
+        return cache_memoize(key, lambda: _count_queryset(queryset),
+                             expiration=self.expiration)
+
+
+class EstimatedCountProvider(BaseCountProvider):
+    """Estimates large counts using the database's statistics.
+
+    The database's query planner is asked how many rows it expects the
+    query to return, which doesn't require scanning the results. If this
+    estimate is at least :py:attr:`threshold`, it's used as the count.
+    Otherwise, or if the database can't provide an estimate, the results
+    are counted normally, through :py:attr:`fallback`.
+
+    Estimates are supported on PostgreSQL and MySQL. They're only as
+    accurate as the database's statistics, so the last page may contain
+    more or fewer results than expected, or be empty.
+
+    Attributes:
+        threshold (int):
+            The minimum estimate to use in place of an exact count.
+
+        fallback (BaseCountProvider):
+            The provider used for counts below the threshold.
+    """
+
+    def __init__(self, threshold=10000, fallback=None):
+        """Initialize the provider.
+
+        Args:
+            threshold (int, optional):
+                The minimum estimate to use in place of an exact count.
+
+            fallback (BaseCountProvider, optional):
+                The provider used for counts below the threshold. This
+                defaults to :py:class:`ExactCountProvider`.
+        """
+        self.threshold = threshold
+        self.fallback = fallback or ExactCountProvider()
+
+    def get_count(self, queryset):
+        """Return the number of results for a queryset.
+
+        Args:
+            queryset (django.db.models.query.QuerySet):
+                The queryset to count.
+
+        Returns:
+            int:
+            The estimated or exact number of results.
+        """
+        estimate = self.get_estimate(queryset)
+
+        if estimate is not None and estimate >= self.threshold:
+            return estimate
+
+        return self.fallback.get_count(queryset)
+
+    def get_estimate(self, queryset):
+        """Return the database's estimate of the number of results.
+
+        Args:
+            queryset (django.db.models.query.QuerySet):
+                The queryset to estimate.
+
+        Returns:
+            int:
+            The estimated number of results, or ``None`` if the database
+            can't provide one.
+        """
+        try:
+            db = queryset.db
+            sql, params = queryset.order_by().query.sql_with_params()
+        except Exception:
+            return None
+
+        connection = connections[db]
+        vendor = connection.vendor
+
+        if vendor == 'postgresql':
+            explain_sql = 'EXPLAIN (FORMAT JSON) %s' % sql
+        elif vendor == 'mysql':
+            explain_sql = 'EXPLAIN %s' % sql
+        else:
+            return None
+
+        try:
+            cursor = connection.cursor()
+
+            try:
+                cursor.execute(explain_sql, params)
+                columns = [column[0] for column in cursor.description]
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+        except DatabaseError as e:
+            logger.warning('Unable to estimate the number of results for '
+                           'a datagrid: %s',
+                           e)
+            return None
+
+        if not rows:
+            return None
+
+        try:
+            if vendor == 'postgresql':
+                plan = rows[0][0]
+
+                if isinstance(plan, six.string_types):
+                    plan = json.loads(plan)
+
+                return int(plan[0]['Plan']['Plan Rows'])
+            else:
+                # The first table in the plan drives the query, so its row
+                # estimate is the closest to the number of results.
+                return int(rows[0][columns.index('rows')])
+        except (IndexError, KeyError, TypeError, ValueError):
+            return None
+
+
+class UncountedProvider(BaseCountProvider):
+    """Never counts the results for a queryset.
+
+    The paginator will fetch one extra result for each page, in order to
+    know whether there's a next page. The total number of results and pages
+    won't be shown, and the last page can't be navigated to directly.
+    """
+
+    def get_count(self, queryset):
+        """Return the number of results for a queryset.
+
+        Args:
+            queryset (django.db.models.query.QuerySet):
+                The queryset, which will not be counted.
+
+        Returns:
+            None:
+            Always ``None``, since results aren't counted.
+        """
+        return None
+
+
+class CountProviderPage(Page):
+    """A page of results from a :py:class:`CountProviderPaginator`.
+
+    When results aren't counted, this determines whether there's a next page
+    from the extra result fetched by the paginator.
+    """
+
+    def __init__(self, object_list, number, paginator, has_more=False):
+        """Initialize the page.
+
+        Args:
+            object_list (list):
+                The objects on the page.
+
+            number (int):
+                The page number.
+
+            paginator (CountProviderPaginator):
+                The paginator that owns the page.
+
+            has_more (bool, optional):
+                Whether there are results after this page. This is only used
+                if the results aren't counted.
+        """
+        super(CountProviderPage, self).__init__(object_list, number,
+                                                paginator)
+        self.has_more = has_more
+
+    def has_next(self):
+        """Return whether there's a page after this one.
+
+        Returns:
+            bool:
+            Whether there's a next page.
+        """
+        if self.paginator.count is None:
+            return self.has_more
+
+        return super(CountProviderPage, self).has_next()
+
+    def end_index(self):
+        """Return the 1-based index of the last object on the page.
+
+        Returns:
+            int:
+            The index of the last object.
+        """
+        if self.paginator.count is None:
+            return ((self.number - 1) * self.paginator.per_page +
+                    len(self.object_list))
+
+        return super(CountProviderPage, self).end_index()
+
+
+class CountProviderPaginator(QuerySetPaginator):
+    """A paginator that counts results through a count provider.
+
+    If the provider doesn't count results, :py:attr:`count` and
+    :py:attr:`num_pages` will be ``None``. Each page will then fetch enough
+    extra results to know whether there's a next page, and whether any
+    orphans should be included on the page.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0,
+                 allow_empty_first_page=True, count_provider=None):
+        """Initialize the paginator.
+
+        Args:
+            object_list (django.db.models.query.QuerySet):
+                The queryset to paginate.
+
+            per_page (int):
+                The number of results on each page.
+
+            orphans (int, optional):
+                The number of results on a final page that will be rolled
+                into the previous page.
+
+            allow_empty_first_page (bool, optional):
+                Whether the first page can be empty.
+
+            count_provider (BaseCountProvider, optional):
+                The provider used to count results. This defaults to
+                :py:class:`ExactCountProvider`.
+        """
+        super(CountProviderPaginator, self).__init__(
+            object_list, per_page, orphans, allow_empty_first_page)
+
+        self.count_provider = count_provider or ExactCountProvider()
+
+    @cached_property
+    def count(self):
+        """The number of results, or ``None`` if not counted."""
+        return self.count_provider.get_count(self.object_list)
+
+    @cached_property
+    def num_pages(self):
+        """The number of pages, or ``None`` if results aren't counted."""
+        count = self.count
+
+        if count is None:
+            return None
+
+        if count == 0 and not self.allow_empty_first_page:
+            return 0
+
+        hits = max(1, count - self.orphans)
+
+        return (hits + self.per_page - 1) // self.per_page
+
+    @property
+    def page_range(self):
+        """The range of page numbers, if results are counted."""
+        if self.num_pages is None:
+            return None
+
+        return range(1, self.num_pages + 1)
+
+    def validate_number(self, number):
+        """Validate a page number.
+
+        Args:
+            number (object):
+                The page number to validate.
+
+        Returns:
+            int:
+            The page number.
+
+        Raises:
+            django.core.paginator.PageNotAnInteger:
+                The page number wasn't an integer.
+
+            django.core.paginator.EmptyPage:
+                The page number is out of range.
+        """
+        if self.num_pages is not None:
+            return super(CountProviderPaginator, self).validate_number(
+                number)
+
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+
+        return number
+
+    def page(self, number):
+        """Return a page of results.
+
+        Args:
+            number (int):
+                The page number.
+
+        Returns:
+            CountProviderPage:
+            The page of results.
+
+        Raises:
+            django.core.paginator.InvalidPage:
+                The page number was invalid, or the page is empty.
+        """
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+
+        if self.count is None:
+            object_list = list(
+                self.object_list[bottom:bottom + self.per_page +
+                                 self.orphans + 1])
+
+            if not object_list and number > 1:
+                raise EmptyPage('That page contains no results')
+
+            has_more = len(object_list) > self.per_page + self.orphans
+
+            if has_more:
+                object_list = object_list[:self.per_page]
+
+            return CountProviderPage(object_list, number, self,
+                                     has_more=has_more)
+
+        top = bottom + self.per_page
+
+        if top + self.orphans >= self.count:
+            top = self.count
+
+        return CountProviderPage(self.object_list[bottom:top], number, self)
+
+
+def _count_queryset(queryset):
+    """Return the exact number of results for a queryset.
+
+    Args:
+        queryset (object):
+            A queryset, or another sequence of results.
+
+    Returns:
+        int:
+        The number of results.
+    """
+    try:
+        return queryset.count()
+    except (AttributeError, TypeError):
+        # This is a list or some other sequence, where count() requires
+        # an argument.
+        return len(queryset)
@@ -44,29 +44,48 @@ There are two main types of datagrids:
   of the data in a given field. This is useful for lists of users, for
   example.
 
+A :py:class:`DataGrid` can also use keyset pagination (see
+:py:attr:`DataGrid.PAGINATION_KEYSET`), which navigates with next/previous
+cursors rather than page numbers. This keeps the cost of deep pages constant
+on very large datasets.
+
 All datagrids are meant to be subclassed.
 """
 
 from __future__ import unicode_literals
 
+import base64
+import csv
+import datetime
+import json
 import logging
 import re
 import string
+import threading
 import traceback
+from collections import OrderedDict
+from xml.sax.saxutils import unescape
 
 import pytz
 from django.conf import settings
-from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
-from django.core.paginator import InvalidPage, QuerySetPaginator
-from django.http import Http404, HttpResponse
+from django.core.exceptions import (ImproperlyConfigured, ObjectDoesNotExist,
+                                    ValidationError)
+from django.core.paginator import InvalidPage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.db.models.fields import FieldDoesNotExist
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render_to_response
 from django.template.context import RequestContext, Context
 from django.template.defaultfilters import date, timesince
 from django.template.loader import get_template
-from django.utils import six
+from django.utils import six, timezone, translation
 from django.utils.cache import patch_cache_control
-from django.utils.html import escape, format_html
+from django.utils.encoding import force_bytes, force_text
+from django.utils.html import escape, format_html, strip_tags
 from django.utils.safestring import mark_safe
+from django.utils.text import slugify
 from django.utils.translation import ugettext_lazy as _
 
 try:
@@ -76,6 +95,11 @@ except ImportError:
     class SiteProfileNotAvailable(Exception):
         pass
 
+from djblets.cache.backend import cache_memoize_many
+from djblets.datagrid.counts import (CachedCountProvider,
+                                     CountProviderPaginator)
+from djblets.datagrid.profiles import (get_pending_profile_updates,
+                                       queue_profile_update)
 from djblets.template.context import get_default_template_context_processors
 from djblets.db.query import chainable_select_related_queryset
 from djblets.util.compat.django.template.loader import (render_template,
@@ -91,6 +115,19 @@ logger = logging.getLogger(__name__)
 _column_registry = {}
 
 
+# Entities produced by django.utils.html.escape, for use when exporting
+# rendered data as text.
+_HTML_ENTITIES = {
+    '&quot;': '"',
+    '&#39;': "'",
+}
+
+
+# Leading characters that cause spreadsheets to treat a CSV cell as a
+# formula.
+_CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
 class Column(object):
     """A column in a datagrid.
 
@@ -108,6 +145,11 @@ class Column(object):
     the class represents an icon, perhaps as part of a spritesheet, and will
     display it in a ``<div>``. An :py:attr:`image_url` cannot also be defined.
 
+    Rendered cells can be stored in the cache by passing ``cache_cells=True``
+    and overriding :py:meth:`get_cell_cache_version` to return a version for
+    each object. Cells for a page are then fetched from the cache in a single
+    request, and only those missing are rendered.
+
     Attributes:
         cell_template (unicode):
             The path to a template. If this is not None, this will override
@@ -127,7 +169,9 @@ class Column(object):
                  sortable=False,
                  default_sort_dir=SORT_DESCENDING, link=False,
                  link_func=None, link_css_class=None, cell_clickable=False,
-                 css_class=""):
+                 css_class="", cache_cells=False, cell_cache_expiration=None,
+                 prefetch_related=None, only_fields=None,
+                 render_in_parallel=False):
         """Initialize the column.
 
         When initializing a column as part of a :py:class:`DataGrid` subclass,
@@ -212,6 +256,28 @@ class Column(object):
             css_class (unicode, optional):
                 The CSS class or classes to define on the cell. This can be
                 a function returning the classes.
+
+            cache_cells (bool, optional):
+                If ``True``, rendered cells will be stored in the cache.
+                This requires overriding :py:meth:`get_cell_cache_version`.
+
+            cell_cache_expiration (int, optional):
+                The number of seconds to cache rendered cells for. This
+                defaults to the standard cache expiration.
+
+            prefetch_related (list of unicode, optional):
+                Relations to prefetch on the related objects fetched by
+                :py:meth:`collect_objects`.
+
+            only_fields (list of unicode, optional):
+                The only fields to load on the related objects fetched by
+                :py:meth:`collect_objects`. By default, all fields are
+                loaded.
+
+            render_in_parallel (bool, optional):
+                If ``True``, the column's cells will be rendered in a
+                separate thread, alongside other columns, when the datagrid
+                has a ``render_executor``. See :py:meth:`render_cells`.
         """
         assert not (image_class and image_url)
 
@@ -237,6 +303,11 @@ class Column(object):
             (lambda state, x, y: state.datagrid.link_to_object(state, x, y)))
         self.link_css_class = link_css_class
         self.css_class = css_class
+        self.cache_cells = cache_cells
+        self.cell_cache_expiration = cell_cache_expiration
+        self.prefetch_related = prefetch_related or []
+        self.only_fields = only_fields
+        self.render_in_parallel = render_in_parallel
 
         self.cell_template = None
 
@@ -371,9 +442,11 @@ class Column(object):
             # this.
             del(sort_list[2:])
 
+            # Keyset cursors are specific to a sort order, so they're
+            # dropped when changing the sort.
             url_params = get_url_params_except(
                 datagrid.request.GET,
-                "sort", "datagrid-id", "gridonly", "columns")
+                "sort", "datagrid-id", "gridonly", "columns", "cursor")
             if url_params:
                 url_params = url_params + '&'
 
@@ -398,12 +471,54 @@ class Column(object):
         IDs of related objects that will be queried for rendering, loading
         them all at once, and populating the cache.
 
+        When rendering a datagrid, related objects are instead fetched for
+        all columns at once, merging the queries for columns that refer to
+        the same model (see :py:meth:`get_related_object_ids`). This is only
+        called directly for subclasses that override it.
+
+        Args:
+            state (StatefulColumn):
+                The state for the DataGrid instance.
+
+            object_list (list):
+                The list of objects being rendered on the datagrid.
+        """
+        model, ids = self.get_related_object_ids(state, object_list)
+
+        if model and ids:
+            queryset = model.objects.filter(pk__in=ids)
+
+            if self.prefetch_related:
+                queryset = queryset.prefetch_related(*self.prefetch_related)
+
+            if self.only_fields is not None:
+                queryset = queryset.only(*self.only_fields)
+
+            for obj in queryset:
+                state.data_cache[obj.pk] = obj
+
+    def get_related_object_ids(self, state, object_list):
+        """Return the IDs of related objects needed to render the objects.
+
+        These are the IDs stored in the foreign key named by ``field_name``.
+        The related objects will be fetched and stored in the column's
+        ``data_cache``, keyed by ID.
+
         Args:
             state (StatefulColumn):
                 The state for the DataGrid instance.
 
             object_list (list):
                 The list of objects being rendered on the datagrid.
+
+        Returns:
+            tuple:
+            A 2-tuple of:
+
+            1. The model for the related objects, or ``None`` if the column
+               doesn't refer to related objects
+               (:py:class:`django.db.models.Model`).
+            2. The set of IDs for the related objects (:py:class:`set`).
         """
         id_field = '%s_id' % self.field_name
         ids = set()
@@ -412,7 +527,7 @@ class Column(object):
         for obj in object_list:
             if not hasattr(obj, id_field):
                 # This isn't the field type you're looking for.
-                return
+                return None, ids
 
             id_value = getattr(obj, id_field)
 
@@ -428,11 +543,125 @@ class Column(object):
                     model = field.rel.to
                 except AttributeError:
                     # No idea what this is. Bail.
-                    return
+                    return None, set()
 
-        if model and ids:
-            for obj in model.objects.filter(pk__in=ids):
-                state.data_cache[obj.pk] = obj
+        return model, ids
+
+    def get_cell_cache_version(self, state, obj):
+        """Return the version of an object's cell for the cache.
+
+        This is used when ``cache_cells`` is enabled. The version must change
+        whenever the contents of the cell would change, for instance by
+        including a timestamp of the object's last update.
+
+        By default, this returns ``None``, and cells won't be cached.
+
+        Args:
+            state (StatefulColumn):
+                The state for the DataGrid instance.
+
+            obj (object):
+                The object being rendered for this row.
+
+        Returns:
+            unicode:
+            The version of the cell, or ``None`` if the cell shouldn't be
+            cached.
+        """
+        return None
+
+    def get_cell_cache_state_key(self, state):
+        """Return a key for the state used to render cells.
+
+        This is part of the cache key for each cell, and must include any
+        state outside of the object that affects the rendered cell.
+
+        By default, this is based on the ID of the user viewing the
+        datagrid. Columns rendering the same contents for all users can
+        override this to share cached cells between them.
+
+        Args:
+            state (StatefulColumn):
+                The state for the DataGrid instance.
+
+        Returns:
+            unicode:
+            The key for the rendering state.
+        """
+        user = state.datagrid.request.user
+
+        if user.is_authenticated():
+            return '%s' % user.pk
+        else:
+            return ''
+
+    def get_cell_cache_key(self, state, obj):
+        """Return the cache key for an object's rendered cell.
+
+        Args:
+            state (StatefulColumn):
+                The state for the DataGrid instance.
+
+            obj (object):
+                The object being rendered for this row.
+
+        Returns:
+            unicode:
+            The cache key, or ``None`` if the cell shouldn't be cached.
+        """
+        version = self.get_cell_cache_version(state, obj)
+
+        if version is None:
+            return None
+
+        datagrid_cls = type(state.datagrid)
+
+        return 'datagrid-cell:%s.%s:%s:%s:%d:%s:%s' % (
+            datagrid_cls.__module__,
+            datagrid_cls.__name__,
+            self.id,
+            self.get_cell_cache_state_key(state),
+            state.last,
+            obj.pk,
+            version)
+
+    def render_cells(self, state, object_list, object_urls, render_context):
+        """Render the table cells for a list of objects.
+
+        This is called once for each page of the datagrid, with all the
+        objects on the page. By default, this calls :py:meth:`render_cell`
+        for each object.
+
+        Subclasses with expensive rendering can override this to render all
+        cells in a batch. Columns created with ``render_in_parallel=True``
+        may have this called in a separate thread (see
+        :py:attr:`DataGrid.render_executor`), so it must be thread-safe in
+        that case.
+
+        Args:
+            state (StatefulColumn):
+                The state for the DataGrid instance.
+
+            object_list (list):
+                The objects being rendered.
+
+            object_urls (list of unicode):
+                The URL for each object, or ``None`` for objects without one.
+
+            render_context (dict):
+                The shared context used for cell renders.
+
+        Returns:
+            list of unicode:
+            The rendered cells as HTML, in the order of ``object_list``.
+        """
+        cells = []
+
+        for obj, obj_url in zip(object_list, object_urls):
+            render_context['_datagrid_object_url'] = obj_url
+            cells.append(self.render_cell(state, obj, render_context))
+
+        return cells
 
     def render_cell(self, state, obj, render_context):
         """Render the table cell containing column data.
@@ -552,6 +781,52 @@ class Column(object):
 
             return escape(value)
 
+    def get_export_value(self, state, obj):
+        """Return the value of the column for an exported object.
+
+        This is used when exporting the datagrid (see
+        :py:meth:`DataGrid.export_to_response`). By default, this returns the
+        raw value of ``field_name`` on the object. Columns without a
+        ``field_name`` will export the text of :py:meth:`render_data`, with
+        any HTML removed.
+
+        Subclasses can override this to export a more useful value.
+
+        Args:
+            state (StatefulColumn):
+                The state for the DataGrid instance.
+
+            obj (object):
+                The object being exported.
+
+        Returns:
+            object:
+            The value to export. This should be a string, number, boolean,
+            date/time, or ``None``.
+        """
+        if self.field_name:
+            id_field = '%s_id' % self.field_name
+
+            if id_field in obj.__dict__:
+                pk = obj.__dict__[id_field]
+
+                if pk in state.data_cache:
+                    return state.data_cache[pk]
+
+            value = obj
+
+            for field_name in self.field_name.split('.'):
+                if field_name:
+                    value = getattr(value, field_name)
+
+                    if six.callable(value):
+                        value = value()
+
+            return value
+        else:
+            return unescape(strip_tags(self.render_data(state, obj)),
+                            _HTML_ENTITIES)
+
     def augment_queryset(self, state, queryset):
         """Augment a queryset with new queries.
 
@@ -773,6 +1048,86 @@ class DateTimeSinceColumn(Column):
         return _("%s ago") % timesince(getattr(obj, self.field_name))
 
 
+class _KeysetCursorEncoder(DjangoJSONEncoder):
+    """Encodes the values of sort fields for keyset cursors.
+
+    Unlike :py:class:`~django.core.serializers.json.DjangoJSONEncoder`, this
+    keeps the full precision of times, so that rows with nearly identical
+    times aren't skipped or repeated.
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+
+        return super(_KeysetCursorEncoder, self).default(o)
+
+
+class KeysetPage(object):
+    """A page of results from keyset pagination.
+
+    This provides the parts of :py:class:`django.core.paginator.Page` used
+    for rendering a datagrid, along with the cursors used to navigate to the
+    neighboring pages.
+
+    Attributes:
+        object_list (list):
+            The objects on the page.
+
+        next_cursor (unicode):
+            The cursor for the next page, or ``None`` if this is the last
+            page.
+
+        previous_cursor (unicode):
+            The cursor for the previous page, or ``None`` if this is the
+            first page.
+    """
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        """Initialize the page.
+
+        Args:
+            object_list (list):
+                The objects on the page.
+
+            next_cursor (unicode):
+                The cursor for the next page, if any.
+
+            previous_cursor (unicode):
+                The cursor for the previous page, if any.
+        """
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        """Return whether there's a page after this one.
+
+        Returns:
+            bool:
+            Whether there's a next page.
+        """
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        """Return whether there's a page before this one.
+
+        Returns:
+            bool:
+            Whether there's a previous page.
+        """
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        """Return whether there are pages other than this one.
+
+        Returns:
+            bool:
+            Whether there's a next or previous page.
+        """
+        return self.has_next() or self.has_previous()
+
+
 class DataGrid(object):
     """A paginated table of data based on queries from a database.
 
@@ -826,8 +1181,105 @@ class DataGrid(object):
             can offer a speed improvement, but may need to be turned off for
             more advanced querysets (such as when using ``extra()``).
             The default is ``True``.
+
+        optimize_sorts_strategy (unicode):
+            How to fetch objects when ``optimize_sorts`` is enabled. This is
+            either :py:attr:`OPTIMIZE_SORTS_TWO_QUERIES` (the default) or
+            :py:attr:`OPTIMIZE_SORTS_SUBQUERY`.
+
+        pagination_mode (unicode):
+            The type of pagination to use. This is either
+            :py:attr:`PAGINATION_OFFSET` (the default) or
+            :py:attr:`PAGINATION_KEYSET`.
+
+        keyset_show_count (bool):
+            Whether to show the total number of results when using keyset
+            pagination. The count is cached for
+            ``keyset_count_expiration`` seconds, and so may be an estimate.
+            The default is ``False``.
+
+        keyset_count_expiration (int):
+            The number of seconds to cache the total number of results for
+            when using keyset pagination. The default is 300.
+
+        keyset_paginator_template (unicode):
+            The template used to render the paginator when using keyset
+            pagination. The default is
+            :file:`datagrid/keyset_paginator.html`.
+
+        count_provider (djblets.datagrid.counts.BaseCountProvider):
+            The provider used to count the results for pagination. This can
+            cache or estimate counts, or skip counting entirely. See
+            :py:mod:`djblets.datagrid.counts`. The default is ``None``,
+            which counts all results on each render.
+
+        export_formats (list of unicode):
+            The formats the datagrid can be exported to through the
+            ``?export=`` variable passed in the URL. This can contain
+            :py:attr:`EXPORT_CSV` and :py:attr:`EXPORT_JSON_LINES`. The
+            default is an empty list, disabling exports. Requests for any
+            other format render the datagrid normally.
+
+        export_batch_size (int):
+            The number of objects to fetch and export at a time. The
+            default is 1000.
+
+        profile_save_interval (int):
+            The minimum number of seconds between saves of the sort order
+            and columns to a user's profile. Changes made in between are
+            held in the cache until the next save. The default is 60.
+
+        render_executor (concurrent.futures.Executor):
+            An executor used to render the cells for columns created with
+            ``render_in_parallel=True``, such as a
+            :py:class:`~concurrent.futures.ThreadPoolExecutor`. Those columns
+            are rendered in parallel with each other and with the remaining
+            columns. The default is ``None``, rendering all columns in
+            turn.
     """
 
+    #: Offset-based pagination, using page numbers.
+    #:
+    #: This requires counting all results, and fetching deep pages becomes
+    #: slower as the database skips over earlier rows.
+    PAGINATION_OFFSET = 'offset'
+
+    #: Keyset-based pagination, using cursors.
+    #:
+    #: Pages are fetched by filtering on the values of the sort columns (and
+    #: the primary key) for the last row of the previous page, so every page
+    #: costs the same to fetch. Users can only navigate to the first, last,
+    #: next, and previous pages.
+    #:
+    #: This requires that the sort fields are non-null model fields, rather
+    #: than values added through ``extra()``. Grids sorting by a field
+    #: spanning relations with ``.``, or using a queryset that doesn't
+    #: support ``values_list()``, will fall back to offset-based pagination.
+    PAGINATION_KEYSET = 'keyset'
+
+    #: Fetch the objects for a page in a single query when optimizing sorts.
+    #:
+    #: The IDs for the page are selected in a subquery, and the full objects
+    #: are only fetched and sorted for those IDs. This must be enabled by
+    #: the datagrid, and is only used when sorting by fields on the model
+    #: itself. Other sorts (such as those spanning relations, or using
+    #: annotations or ``extra()``), and querysets that can't be used in a
+    #: subquery, fall back to :py:attr:`OPTIMIZE_SORTS_TWO_QUERIES`.
+    OPTIMIZE_SORTS_SUBQUERY = 'subquery'
+
+    #: Fetch the objects for a page in two queries when optimizing sorts.
+    #:
+    #: The IDs for the page are fetched first, and then the objects for
+    #: those IDs, which are placed back in the order of the IDs.
+    OPTIMIZE_SORTS_TWO_QUERIES = 'two-queries'
+
+    #: Export to CSV, with a header row containing the column labels.
+    EXPORT_CSV = 'csv'
+
+    #: Export to JSON Lines, with one object per line mapping column IDs to
+    #: values.
+    EXPORT_JSON_LINES = 'jsonl'
+
     _columns = None
 
     @classmethod
@@ -983,6 +1435,16 @@ class DataGrid(object):
         self.column_header_template = 'datagrid/column_header.html'
         self.cell_template = 'datagrid/cell.html'
         self.paginator_template = 'datagrid/paginator.html'
+        self.pagination_mode = self.PAGINATION_OFFSET
+        self.keyset_show_count = False
+        self.keyset_count_expiration = 5 * 60
+        self.keyset_paginator_template = 'datagrid/keyset_paginator.html'
+        self.count_provider = None
+        self.export_formats = []
+        self.export_batch_size = 1000
+        self.profile_save_interval = 60
+        self.optimize_sorts_strategy = self.OPTIMIZE_SORTS_TWO_QUERIES
+        self.render_executor = None
 
     @cached_property
     def cell_template_obj(self):
@@ -1065,35 +1527,57 @@ class DataGrid(object):
         if self.state_loaded:
             return
 
+        self._load_column_state()
+        self.state_loaded = True
+
+        # Fetch the list of objects and have it ready.
+        self.precompute_objects(render_context)
+
+    def _load_column_state(self):
+        """Load the columns and sort order for the datagrid.
+
+        This will retrieve the user-specified or previously stored sorting
+        order and columns list, along with any state a subclass may need.
+
+        If the sorting order or columns were changed through the URL, they'll
+        be queued for saving to the user's profile once the response has been
+        sent (see :py:mod:`djblets.datagrid.profiles`).
+        """
         profile_sort_list = None
         profile_columns_list = None
         profile = None
-        profile_dirty = False
+        pending_updates = {}
 
         # Get the saved settings for this grid in the profile. These will
         # work as defaults and allow us to determine if we need to save
-        # the profile.
+        # the profile. Updates that haven't been saved yet take precedence.
         if self.request.user.is_authenticated():
             profile = self.get_user_profile()
 
             if profile:
+                pending_updates = get_pending_profile_updates(profile)
+
                 if self.profile_sort_field:
-                    profile_sort_list = \
-                        getattr(profile, self.profile_sort_field, None)
+                    profile_sort_list = pending_updates.get(
+                        self.profile_sort_field,
+                        getattr(profile, self.profile_sort_field, None))
 
                 if self.profile_columns_field:
-                    profile_columns_list = \
-                        getattr(profile, self.profile_columns_field, None)
+                    profile_columns_list = pending_updates.get(
+                        self.profile_columns_field,
+                        getattr(profile, self.profile_columns_field, None))
 
         # Figure out the columns we're going to display
         # We're also going to calculate the column widths based on the
         # shrink and expand values.
         colnames = self.request.GET.get('columns', profile_columns_list) or ''
 
-        columns = filter(None, [
-            self.get_column(colname)
-            for colname in colnames.split(',')
-        ])
+        columns = [
+            column
+            for column in (self.get_column(colname)
+                           for colname in colnames.split(','))
+            if column is not None
+        ]
 
         if not columns:
             colnames = ','.join(self.default_columns)
@@ -1161,28 +1645,28 @@ class DataGrid(object):
 
         # A subclass might have some work to do for loading and saving
         # as well.
-        if self.load_extra_state(profile):
-            profile_dirty = True
+        extra_state_changed = self.load_extra_state(profile)
 
         # Now that we have all that, figure out if we need to save new
-        # settings back to the profile.
+        # settings back to the profile. Only settings chosen through the URL
+        # are saved. Defaults are left out of the profile.
         if profile:
+            profile_updates = {}
+
             if (self.profile_columns_field and
+                'columns' in self.request.GET and
                 colnames != profile_columns_list):
-                setattr(profile, self.profile_columns_field, colnames)
-                profile_dirty = True
+                profile_updates[self.profile_columns_field] = colnames
 
-            if self.profile_sort_field and sort_str != profile_sort_list:
-                setattr(profile, self.profile_sort_field, sort_str)
-                profile_dirty = True
+            if (self.profile_sort_field and
+                'sort' in self.request.GET and
+                sort_str != profile_sort_list):
+                profile_updates[self.profile_sort_field] = sort_str
 
-            if profile_dirty:
-                profile.save()
-
-        self.state_loaded = True
-
-        # Fetch the list of objects and have it ready.
-        self.precompute_objects(render_context)
+            if profile_updates or pending_updates or extra_state_changed:
+                queue_profile_update(profile, profile_updates,
+                                     save_interval=self.profile_save_interval,
+                                     save_all=extra_state_changed)
 
     def get_user_profile(self):
         """Return the object, if any, to use for the user profile state.
@@ -1230,72 +1714,45 @@ class DataGrid(object):
                 The common template variable context to render on the datagrid,
                 provided in the constructor.
         """
-        query = self.queryset
-        use_select_related = False
-
-        # Generate the actual list of fields we'll be sorting by
-        sort_list = []
-        for sort_item in self.sort_list:
-            if sort_item[0] == "-":
-                base_sort_item = sort_item[1:]
-                prefix = "-"
-            else:
-                base_sort_item = sort_item
-                prefix = ""
-
-            if sort_item:
-                column = self.get_column(base_sort_item)
-                if not column:
-                    logger.warning('Skipping non-existing sort column "%s" '
-                                   'for user "%s".',
-                                   base_sort_item, self.request.user.username)
-                    continue
-
-                stateful_column = self.get_stateful_column(column)
-
-                if stateful_column:
-                    try:
-                        sort_field = stateful_column.get_sort_field()
-                    except Exception as e:
-                        logger.exception('Error when calling get_sort_field '
-                                         'for DataGrid Column %r: %s',
-                                         column, e)
-                        continue
-
-                    sort_list.append(prefix + sort_field)
-
-                    # Lookups spanning tables require that we query from those
-                    # tables. In order to keep things simple, we'll just use
-                    # select_related so that we don't have to figure out the
-                    # table relationships. We only do this if we have a lookup
-                    # spanning tables.
-                    if '.' in sort_field:
-                        use_select_related = True
-
-        if sort_list:
-            query = query.order_by(*sort_list)
-
-        query = self.post_process_queryset(query)
+        query, sort_list, use_select_related = self._build_queryset()
 
-        if hasattr(query, 'distinct'):
-            query = query.distinct()
+        self.id_list = []
 
-        self.paginator = self.build_paginator(query)
+        if (self.pagination_mode == self.PAGINATION_KEYSET and
+            hasattr(query, 'values_list')):
+            keyset_fields = self._get_keyset_model_fields(sort_list)
+        else:
+            keyset_fields = None
 
-        page_num = self.request.GET.get('page', 1)
+        if keyset_fields is not None:
+            self._precompute_keyset_page(query, sort_list, keyset_fields)
+        else:
+            self.paginator = self.build_paginator(query)
 
-        # Accept either "last" or a valid page number.
-        if page_num == "last":
-            page_num = self.paginator.num_pages
+            page_num = self.request.GET.get('page', 1)
 
-        try:
-            self.page = self.paginator.page(page_num)
-        except InvalidPage:
-            raise Http404
+            # Accept either "last" or a valid page number. The last page
+            # can't be determined if the results aren't counted.
+            if page_num == "last":
+                page_num = self.paginator.num_pages
 
-        self.id_list = []
+                if page_num is None:
+                    raise Http404
 
-        if self.optimize_sorts and len(sort_list) > 0:
+            try:
+                self.page = self.paginator.page(page_num)
+            except InvalidPage:
+                raise Http404
+
+        if isinstance(self.page, KeysetPage):
+            # The IDs and objects for the page have already been determined.
+            pass
+        elif (self.optimize_sorts and len(sort_list) > 0 and
+              self.optimize_sorts_strategy == self.OPTIMIZE_SORTS_SUBQUERY and
+              self._apply_page_subquery(sort_list)):
+            # The objects for the page will be fetched in a single query.
+            pass
+        elif self.optimize_sorts and len(sort_list) > 0:
             # This can be slow when sorting by multiple columns. If we
             # have multiple items in the sort list, we'll request just the
             # IDs and then fetch the actual details from that.
@@ -1316,7 +1773,10 @@ class DataGrid(object):
             self.page.object_list = self.post_process_queryset(
                 self.model.objects.filter(pk__in=self.id_list).order_by())
 
-        if use_select_related:
+        # Pages of uncounted results have already been fetched, in order to
+        # check for a next page.
+        if (use_select_related and
+            hasattr(self.page.object_list, 'select_related')):
             self.page.object_list = \
                 self.page.object_list.select_related(depth=1)
 
@@ -1335,55 +1795,789 @@ class DataGrid(object):
             # and it will prevent one query per row.
             object_list = list(self.page.object_list)
 
-        for column in self.columns:
-            column.collect_objects(object_list)
+        object_list = [obj for obj in object_list if obj is not None]
+
+        # Columns caching their cells only collect objects for the cells
+        # they need to render.
+        self.collect_objects(
+            [
+                column
+                for column in self.columns
+                if not column.cache_cells
+            ],
+            object_list)
 
         if render_context is None:
             render_context = self._build_render_context()
 
-        try:
-            self.rows = []
-
-            for obj in object_list:
-                if obj is None:
-                    continue
-
-                if hasattr(obj, 'get_absolute_url'):
-                    obj_url = obj.get_absolute_url()
-                else:
-                    obj_url = None
+        object_urls = [
+            obj.get_absolute_url()
+            if hasattr(obj, 'get_absolute_url') else None
+            for obj in object_list
+        ]
 
-                render_context['_datagrid_object_url'] = obj_url
+        # Cells are rendered a column at a time. Columns that can be rendered
+        # in parallel are handed off to the executor first, so they can
+        # render while the remaining columns render here.
+        executor = self.render_executor
+        futures = OrderedDict()
+        column_cells = {}
+        self.rows = []
 
-                self.rows.append({
+        try:
+            if executor is not None:
+                for column in self.columns:
+                    if column.render_in_parallel:
+                        futures[column] = executor.submit(
+                            self._render_column_cells_in_thread,
+                            column, object_list, object_urls,
+                            dict(render_context),
+                            translation.get_language(),
+                            timezone.get_current_timezone(),
+                            threading.current_thread())
+
+            for column in self.columns:
+                if column not in futures:
+                    column_cells[column] = self._render_column_cells(
+                        column, object_list, object_urls, render_context)
+
+            for column, future in six.iteritems(futures):
+                column_cells[column] = future.result()
+
+            self.rows = [
+                {
                     'object': obj,
-                    'cells': [column.render_cell(obj, render_context)
-                              for column in self.columns]
-                })
+                    'cells': [
+                        column_cells[column][i]
+                        for column in self.columns
+                    ],
+                }
+                for i, obj in enumerate(object_list)
+            ]
         except Exception as e:
-            logger.exception('Error when calling render_cell for DataGrid '
+            logger.exception('Error when calling render_cells for DataGrid '
                              'Column %r: %s',
                              column, e)
 
-    def post_process_queryset(self, queryset):
-        """Add column-specific data to the queryset.
-
-        Individual columns can define additional joins and extra info to add on
-        to the queryset. This handles adding all of those.
+    def _render_column_cells(self, column, object_list, object_urls,
+                             render_context):
+        """Render a column's cells for a page.
 
         Args:
-            queryset (django.db.models.query.QuerySet):
-                The queryset to augment.
+            column (StatefulColumn):
+                The column to render.
+
+            object_list (list):
+                The objects on the page.
+
+            object_urls (list of unicode):
+                The URLs for each object on the page.
+
+            render_context (dict):
+                The shared context used for cell renders.
 
         Returns:
-            django.db.models.query.QuerySet:
-            The resulting augmented QuerySet.
+            list of unicode:
+            The rendered cells for each object.
         """
-        queryset = chainable_select_related_queryset(queryset)
+        if column.cache_cells:
+            return self._render_cached_cells(column, object_list,
+                                             object_urls, render_context)
 
-        for column in self.columns:
-            try:
-                queryset = column.augment_queryset(queryset)
+        return column.render_cells(object_list, object_urls, render_context)
+
+    def _render_column_cells_in_thread(self, column, object_list,
+                                       object_urls, render_context,
+                                       language, tz, request_thread):
+        """Render a column's cells for a page in a worker thread.
+
+        The language and timezone of the request's thread will be used for
+        rendering. Any database connections opened by the column will be
+        closed afterward. If the executor runs the work in the request's
+        thread, the cells will simply be rendered.
+
+        Args:
+            column (StatefulColumn):
+                The column to render.
+
+            object_list (list):
+                The objects on the page.
+
+            object_urls (list of unicode):
+                The URLs for each object on the page.
+
+            render_context (dict):
+                The context used for cell renders in this thread.
+
+            language (unicode):
+                The active language for the request.
+
+            tz (datetime.tzinfo):
+                The active timezone for the request.
+
+            request_thread (threading.Thread):
+                The thread handling the request.
+
+        Returns:
+            list of unicode:
+            The rendered cells for each object.
+        """
+        if threading.current_thread() is request_thread:
+            return self._render_column_cells(column, object_list,
+                                             object_urls, render_context)
+
+        timezone.activate(tz)
+
+        try:
+            with translation.override(language):
+                return self._render_column_cells(column, object_list,
+                                                 object_urls, render_context)
+        finally:
+            timezone.deactivate()
+
+            for conn in connections.all():
+                conn.close()
+
+    def _apply_page_subquery(self, sort_list):
+        """Limit the objects on the page using a subquery.
+
+        This replaces the page's object list with a query that selects the
+        IDs for the page in a subquery, and fetches the full objects for
+        those IDs in the same query. The database only needs to sort the
+        full rows for the page, rather than every row.
+
+        The subquery is wrapped in a derived table, which allows it to be
+        limited to the page (which MySQL otherwise doesn't allow), and to
+        contain the columns needed for a distinct sort.
+
+        Args:
+            sort_list (list of unicode):
+                The list of fields to sort by, each optionally prefixed with
+                ``-`` for a descending sort.
+
+        Returns:
+            bool:
+            ``True`` if the page's object list was replaced. ``False`` if
+            the page's objects can't be selected through a subquery, in
+            which case the two-query approach must be used.
+        """
+        object_list = self.page.object_list
+
+        if (not hasattr(object_list, 'values_list') or
+            not self._can_sort_page_subquery(object_list, sort_list)):
+            return False
+
+        try:
+            sql, params = \
+                object_list.values_list('pk').query.sql_with_params()
+        except Exception:
+            # The query can't produce SQL (for instance, if it will never
+            # match any rows).
+            return False
+
+        qn = connections[object_list.db].ops.quote_name
+        opts = self.model._meta
+        pk_column = qn(opts.pk.column)
+
+        # Sort by the primary key last, so that rows with the same values
+        # for the sort fields are always in the same order.
+        if ('pk' in sort_list or '-pk' in sort_list or
+            opts.pk.name in sort_list or '-%s' % opts.pk.name in sort_list):
+            outer_sort_list = sort_list
+        else:
+            outer_sort_list = sort_list + ['pk']
+
+        self.page.object_list = self.post_process_queryset(
+            self.model.objects
+            .using(object_list.db)
+            .extra(
+                where=[
+                    '%s.%s IN (SELECT datagrid_page.%s FROM (%s) AS '
+                    'datagrid_page)'
+                    % (qn(opts.db_table), pk_column, pk_column, sql),
+                ],
+                params=params)
+            .order_by(*outer_sort_list)
+            .distinct())
+
+        return True
+
+    def _can_sort_page_subquery(self, object_list, sort_list):
+        """Return whether a page can be sorted using a subquery.
+
+        The derived table used for the subquery contains the primary key,
+        along with any columns the database needs to sort the distinct
+        results. These must all be columns on the model's own table, or
+        they may conflict with the primary key column (which some
+        databases, such as MySQL, won't allow). Annotations and fields
+        added through ``extra()`` also aren't available when fetching the
+        objects for the page.
+
+        Args:
+            object_list (django.db.models.query.QuerySet):
+                The queryset for the objects on the page.
+
+            sort_list (list of unicode):
+                The list of fields to sort by, each optionally prefixed with
+                ``-`` for a descending sort.
+
+        Returns:
+            bool:
+            ``True`` if the page can be sorted using a subquery. ``False``
+            if the two-query approach must be used.
+        """
+        query = object_list.query
+
+        if (query.extra_select or
+            getattr(query, 'annotation_select',
+                    getattr(query, 'aggregate_select', None))):
+            return False
+
+        opts = self.model._meta
+
+        for sort_item in sort_list:
+            name = sort_item.lstrip('-')
+
+            if name == 'pk':
+                continue
+
+            try:
+                field = opts.get_field(name)
+            except FieldDoesNotExist:
+                # This may be an annotation, a field added through extra(),
+                # or a lookup spanning relations.
+                return False
+
+            if getattr(field, 'rel', None) or not getattr(field, 'column',
+                                                          None):
+                # Sorting by a relation will sort by the related model's
+                # fields.
+                return False
+
+        return True
+
+    def collect_objects(self, columns, object_list):
+        """Fetch the related objects needed to render columns.
+
+        Rather than each column querying for its own related objects, the
+        IDs needed by all the columns are gathered first (see
+        :py:meth:`Column.get_related_object_ids`), and a single query is
+        made for each related model. The results are shared between all
+        columns referring to that model.
+
+        Columns that override :py:meth:`Column.collect_objects` will have
+        it called instead.
+
+        Args:
+            columns (list of StatefulColumn):
+                The columns being rendered.
+
+            object_list (list):
+                The objects being rendered on the datagrid.
+        """
+        base_collect_objects = six.get_unbound_function(
+            Column.collect_objects)
+        plans = OrderedDict()
+
+        for column in columns:
+            try:
+                collect_objects = six.get_unbound_function(
+                    type(column.column).collect_objects)
+
+                if collect_objects is not base_collect_objects:
+                    column.collect_objects(object_list)
+                    continue
+
+                model, ids = column.get_related_object_ids(object_list)
+            except Exception as e:
+                logger.exception('Error when calling collect_objects for '
+                                 'DataGrid Column %r: %s',
+                                 column, e)
+                continue
+
+            if not model or not ids:
+                continue
+
+            plan = plans.setdefault(model, {
+                'columns': [],
+                'ids': set(),
+                'prefetch_related': set(),
+                'only_fields': set(),
+            })
+            plan['columns'].append(column)
+            plan['ids'].update(ids)
+            plan['prefetch_related'].update(column.prefetch_related)
+
+            # Only limit the fields if every column for the model does.
+            if column.only_fields is None or plan['only_fields'] is None:
+                plan['only_fields'] = None
+            else:
+                plan['only_fields'].update(column.only_fields)
+
+        for model, plan in six.iteritems(plans):
+            queryset = model.objects.filter(pk__in=plan['ids'])
+
+            if plan['prefetch_related']:
+                queryset = queryset.prefetch_related(
+                    *sorted(plan['prefetch_related']))
+
+            if plan['only_fields'] is not None:
+                queryset = queryset.only(*sorted(plan['only_fields']))
+
+            try:
+                objects = {
+                    obj.pk: obj
+                    for obj in queryset
+                }
+            except Exception as e:
+                logger.exception('Error when fetching related %r objects '
+                                 'for DataGrid Columns %r: %s',
+                                 model, plan['columns'], e)
+                continue
+
+            for column in plan['columns']:
+                column.data_cache.update(objects)
+
+    def _render_cached_cells(self, column, object_list, object_urls,
+                             render_context):
+        """Render a column's cells for a page, using the cache.
+
+        The cells for all objects are fetched from the cache in a single
+        request. Any that are missing are rendered and then stored in a
+        single request. Objects are only collected (see
+        :py:meth:`Column.collect_objects`) for the cells being rendered.
+
+        Args:
+            column (StatefulColumn):
+                The column to render.
+
+            object_list (list):
+                The objects on the page.
+
+            object_urls (list of unicode):
+                The URLs for each object on the page.
+
+            render_context (dict):
+                The shared context used for cell renders.
+
+        Returns:
+            list of unicode:
+            The rendered cells for each object.
+        """
+        cells = [None] * len(object_list)
+        key_indexes = {}
+        uncached_indexes = []
+
+        for i, obj in enumerate(object_list):
+            key = column.get_cell_cache_key(obj)
+
+            if key is None:
+                uncached_indexes.append(i)
+            else:
+                key_indexes[key] = i
+
+        def _render_cells(indexes):
+            objects = [object_list[i] for i in indexes]
+            self.collect_objects([column], objects)
+
+            rendered_cells = column.render_cells(
+                objects,
+                [object_urls[i] for i in indexes],
+                render_context)
+
+            for i, cell in zip(indexes, rendered_cells):
+                cells[i] = cell
+
+        def _render_missing_cells(keys):
+            indexes = [key_indexes[key] for key in keys]
+            _render_cells(indexes)
+
+            return {
+                key: cells[i]
+                for key, i in zip(keys, indexes)
+            }
+
+        if key_indexes:
+            kwargs = {}
+
+            if column.cell_cache_expiration is not None:
+                kwargs['expiration'] = column.cell_cache_expiration
+
+            results = cache_memoize_many(list(six.iterkeys(key_indexes)),
+                                         _render_missing_cells,
+                                         **kwargs)
+
+            for key, cell in six.iteritems(results):
+                cells[key_indexes[key]] = mark_safe(cell)
+
+        if uncached_indexes:
+            _render_cells(uncached_indexes)
+
+        return cells
+
+    def _build_queryset(self):
+        """Build the queryset for all objects on the datagrid.
+
+        The queryset will be sorted according to :py:attr:`sort_list` and
+        augmented by the columns.
+
+        Returns:
+            tuple:
+            A 3-tuple of:
+
+            1. The queryset (:py:class:`django.db.models.query.QuerySet`).
+            2. The list of fields being sorted by, each optionally prefixed
+               with ``-`` for a descending sort (:py:class:`list` of
+               :py:class:`unicode`).
+            3. Whether related objects must be selected in order to sort
+               (:py:class:`bool`).
+        """
+        query = self.queryset
+        use_select_related = False
+
+        # Generate the actual list of fields we'll be sorting by
+        sort_list = []
+        for sort_item in self.sort_list:
+            if sort_item[0] == "-":
+                base_sort_item = sort_item[1:]
+                prefix = "-"
+            else:
+                base_sort_item = sort_item
+                prefix = ""
+
+            if sort_item:
+                column = self.get_column(base_sort_item)
+                if not column:
+                    logger.warning('Skipping non-existing sort column "%s" '
+                                   'for user "%s".',
+                                   base_sort_item, self.request.user.username)
+                    continue
+
+                stateful_column = self.get_stateful_column(column)
+
+                if stateful_column:
+                    try:
+                        sort_field = stateful_column.get_sort_field()
+                    except Exception as e:
+                        logger.exception('Error when calling get_sort_field '
+                                         'for DataGrid Column %r: %s',
+                                         column, e)
+                        continue
+
+                    sort_list.append(prefix + sort_field)
+
+                    # Lookups spanning tables require that we query from those
+                    # tables. In order to keep things simple, we'll just use
+                    # select_related so that we don't have to figure out the
+                    # table relationships. We only do this if we have a lookup
+                    # spanning tables.
+                    if '.' in sort_field:
+                        use_select_related = True
+
+        if sort_list:
+            query = query.order_by(*sort_list)
+
+        query = self.post_process_queryset(query)
+
+        if hasattr(query, 'distinct'):
+            query = query.distinct()
+
+        return query, sort_list, use_select_related
+
+    def _get_keyset_model_fields(self, sort_list):
+        """Return the model fields used for keyset pagination.
+
+        Keyset pagination compares the values of each sort field against
+        those stored in the cursor. This only works for fields on the model
+        (or on related models) that can't be ``NULL``, since comparisons
+        with ``NULL`` never match, and those rows would be skipped. Any
+        other sort order uses standard pagination instead.
+
+        Args:
+            sort_list (list of unicode):
+                The list of fields to sort by, each optionally prefixed with
+                ``-`` for a descending sort.
+
+        Returns:
+            list of django.db.models.Field:
+            The model fields for each item in the sort list, followed by the
+            primary key, or ``None`` if keyset pagination can't be used for
+            this sort order.
+        """
+        model_fields = []
+
+        for sort_item in sort_list:
+            if '.' in sort_item:
+                # This refers to a table added through extra().
+                return None
+
+            model = self.model
+            field = None
+
+            for name in sort_item.lstrip('-').split('__'):
+                if field is not None:
+                    try:
+                        model = field.rel.to
+                    except AttributeError:
+                        return None
+
+                try:
+                    field = model._meta.get_field(name)
+                except FieldDoesNotExist:
+                    # This may be an annotation or a reverse relation, which
+                    # can't be compared safely.
+                    return None
+
+                if field.null:
+                    return None
+
+            model_fields.append(field)
+
+        model_fields.append(self.model._meta.pk)
+
+        return model_fields
+
+    def _precompute_keyset_page(self, query, sort_list, model_fields):
+        """Compute the page of results for keyset pagination.
+
+        This will fetch the IDs of the objects on the page, along with the
+        values of the sort fields needed to build the cursors for the
+        neighboring pages, in a single query. The results will be stored in
+        :py:attr:`id_list` and :py:attr:`page`.
+
+        The page is determined by the ``?cursor=`` variable passed in the
+        URL. If not provided, the first page will be used. If set to
+        ``last``, the last page will be used.
+
+        Args:
+            query (django.db.models.query.QuerySet):
+                The queryset for all objects on the datagrid.
+
+            sort_list (list of unicode):
+                The list of fields to sort by, each optionally prefixed with
+                ``-`` for a descending sort.
+
+            model_fields (list of django.db.models.Field):
+                The model fields for each sort field and the primary key, as
+                returned by :py:meth:`_get_keyset_model_fields`.
+
+        Raises:
+            django.http.Http404:
+                The cursor was invalid.
+        """
+        # The primary key is always used as the final sort field, so that
+        # every row has a unique position.
+        fields = []
+        descending = []
+
+        for sort_item in sort_list:
+            if sort_item.startswith('-'):
+                fields.append(sort_item[1:])
+                descending.append(True)
+            else:
+                fields.append(sort_item)
+                descending.append(False)
+
+        fields.append('pk')
+        descending.append(False)
+
+        cursor = self.request.GET.get('cursor')
+        forward = True
+        values = None
+
+        if cursor == 'last':
+            forward = False
+        elif cursor:
+            try:
+                payload = json.loads(force_text(base64.urlsafe_b64decode(
+                    str(cursor + '=' * (-len(cursor) % 4)))))
+                cursor_sort_list = payload['s']
+                forward = (payload['d'] == 'n')
+                values = payload['v']
+            except (KeyError, TypeError, ValueError):
+                raise Http404
+
+            if (cursor_sort_list != sort_list or
+                not isinstance(values, list) or
+                len(values) != len(fields)):
+                # This cursor was built for a different sort order, so
+                # start from the beginning.
+                forward = True
+                values = None
+            else:
+                # The values come from the client, so make sure they're
+                # valid for each field before querying with them.
+                try:
+                    values = [
+                        model_field.to_python(value)
+                        for model_field, value in zip(model_fields, values)
+                    ]
+                except (TypeError, ValueError, ValidationError):
+                    raise Http404
+
+                if any(value is None for value in values):
+                    raise Http404
+
+        order_by = [
+            '%s%s' % ('-' if is_desc == forward else '', field)
+            for field, is_desc in zip(fields, descending)
+        ]
+
+        query = query.order_by(*order_by)
+
+        if values is not None:
+            query = query.filter(
+                self._build_keyset_q(fields, descending, values, forward))
+
+        rows = list(query.values_list(*fields)[:self.paginate_by + 1])
+        has_more = len(rows) > self.paginate_by
+        rows = rows[:self.paginate_by]
+
+        if not forward:
+            rows.reverse()
+
+        if forward:
+            has_next = has_more
+            has_previous = values is not None
+        else:
+            has_next = values is not None
+            has_previous = has_more
+
+        if rows and has_next:
+            next_cursor = self._make_keyset_cursor(sort_list, rows[-1], True)
+        else:
+            next_cursor = None
+
+        if rows and has_previous:
+            previous_cursor = self._make_keyset_cursor(sort_list, rows[0],
+                                                       False)
+        else:
+            previous_cursor = None
+
+        self.paginator = None
+        self.id_list = [row[-1] for row in rows]
+
+        # The objects are fetched without any ordering, and placed in the
+        # order of the ID list once fetched.
+        self.page = KeysetPage(
+            object_list=self.post_process_queryset(
+                self.model.objects.filter(pk__in=self.id_list).order_by()),
+            next_cursor=next_cursor,
+            previous_cursor=previous_cursor)
+
+    def _build_keyset_q(self, fields, descending, values, forward):
+        """Return a Q object matching rows after or before a cursor.
+
+        Args:
+            fields (list of unicode):
+                The fields being sorted by.
+
+            descending (list of bool):
+                Whether each field is sorted in descending order.
+
+            values (list):
+                The values of each field for the row at the cursor.
+
+            forward (bool):
+                Whether to match rows after the cursor, rather than before.
+
+        Returns:
+            django.db.models.Q:
+            The Q object for filtering the queryset.
+        """
+        q = Q()
+
+        for i, (field, is_desc) in enumerate(zip(fields, descending)):
+            if is_desc == forward:
+                lookup = '%s__lt' % field
+            else:
+                lookup = '%s__gt' % field
+
+            field_q = Q(**{lookup: values[i]})
+
+            for j in range(i):
+                field_q &= Q(**{fields[j]: values[j]})
+
+            q |= field_q
+
+        return q
+
+    def _make_keyset_cursor(self, sort_list, row, forward):
+        """Return a cursor for navigating from a row.
+
+        Args:
+            sort_list (list of unicode):
+                The list of fields being sorted by.
+
+            row (tuple):
+                The values of the sort fields and primary key for the row.
+
+            forward (bool):
+                Whether the cursor navigates to the rows after this row,
+                rather than before.
+
+        Returns:
+            unicode:
+            The cursor.
+        """
+        payload = json.dumps(
+            {
+                's': sort_list,
+                'd': 'n' if forward else 'p',
+                'v': list(row),
+            },
+            cls=_KeysetCursorEncoder)
+
+        return force_text(
+            base64.urlsafe_b64encode(payload.encode('utf-8')).rstrip(b'='))
+
+    def get_keyset_count(self):
+        """Return the total number of results when using keyset pagination.
+
+        This is only computed if :py:attr:`keyset_show_count` is set. The
+        count comes from :py:attr:`count_provider`, if set. Otherwise, the
+        result is cached for :py:attr:`keyset_count_expiration` seconds,
+        based on the SQL for the query.
+
+        Returns:
+            int:
+            The number of results, or ``None`` if not shown.
+        """
+        if not self.keyset_show_count:
+            return None
+
+        query = self.post_process_queryset(self.queryset)
+
+        if hasattr(query, 'distinct'):
+            query = query.distinct()
+
+        count_provider = self.count_provider
+
+        if count_provider is None:
+            count_provider = CachedCountProvider(
+                expiration=self.keyset_count_expiration)
+
+        return count_provider.get_count(query)
+
+    def post_process_queryset(self, queryset):
+        """Add column-specific data to the queryset.
+
+        Individual columns can define additional joins and extra info to add on
+        to the queryset. This handles adding all of those.
+
+        Args:
+            queryset (django.db.models.query.QuerySet):
+                The queryset to augment.
+
+        Returns:
+            django.db.models.query.QuerySet:
+            The resulting augmented QuerySet.
+        """
+        queryset = chainable_select_related_queryset(queryset)
+
+        for column in self.columns:
+            try:
+                queryset = column.augment_queryset(queryset)
             except Exception as e:
                 logger.exception('Error when calling augment_queryset for '
                                  'DataGrid Column %r: %s',
@@ -1464,6 +2658,13 @@ class DataGrid(object):
         Returns:
             HttpResponse: The HTTP response to send to the client.
         """
+        # If the caller is requesting an export of the grid, stream it.
+        # Other uses of the variable are left alone.
+        export_format = self.request.GET.get('export')
+
+        if export_format and export_format in self.export_formats:
+            return self.export_to_response(export_format)
+
         render_context = self._build_render_context()
         self.load_state(render_context)
 
@@ -1481,6 +2682,195 @@ class DataGrid(object):
 
         return render_to_response(template_name, Context(context))
 
+    def export_to_response(self, export_format):
+        """Export all objects on the datagrid to a streaming response.
+
+        All objects matching the datagrid's queryset are exported, in the
+        current sort order, for the active columns. Objects are fetched
+        :py:attr:`export_batch_size` at a time and written out as they're
+        fetched, so memory use doesn't grow with the number of objects.
+
+        Each column's value comes from :py:meth:`Column.get_export_value`.
+
+        Args:
+            export_format (unicode):
+                The format to export to. This must be in
+                :py:attr:`export_formats`.
+
+        Returns:
+            django.http.StreamingHttpResponse:
+            The response streaming the exported data.
+
+        Raises:
+            django.http.Http404:
+                The export format isn't supported by this datagrid.
+        """
+        if export_format not in self.export_formats:
+            raise Http404
+
+        if not self.state_loaded:
+            self._load_column_state()
+
+        if export_format == self.EXPORT_CSV:
+            content = self._iter_export_csv()
+            content_type = 'text/csv; charset=utf-8'
+        elif export_format == self.EXPORT_JSON_LINES:
+            content = self._iter_export_json_lines()
+            content_type = 'application/x-ndjson; charset=utf-8'
+        else:
+            raise Http404
+
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = \
+            'attachment; filename="%s.%s"' % (
+                slugify(force_text(self.title)) or 'datagrid',
+                export_format)
+        patch_cache_control(response, no_cache=True, no_store=True, max_age=0,
+                            must_revalidate=True)
+
+        return response
+
+    def _iter_export_batches(self):
+        """Yield batches of exported values for all objects.
+
+        Related objects are collected for each batch (see
+        :py:meth:`collect_objects`), and discarded once the batch has been
+        exported.
+
+        Yields:
+            list of list:
+            Each batch of objects, as lists of values for the active columns.
+        """
+        query = self._build_queryset()[0]
+
+        if hasattr(query, 'iterator'):
+            # On databases that support them, this will use server-side
+            # cursors, rather than loading all results into memory.
+            objects = query.iterator()
+        else:
+            objects = iter(query)
+
+        while True:
+            batch = []
+
+            for obj in objects:
+                batch.append(obj)
+
+                if len(batch) >= self.export_batch_size:
+                    break
+
+            if not batch:
+                break
+
+            self.collect_objects(self.columns, batch)
+
+            yield [
+                [
+                    self._get_export_value(column, obj)
+                    for column in self.columns
+                ]
+                for obj in batch
+            ]
+
+            for column in self.columns:
+                column.data_cache.clear()
+
+    def _get_export_value(self, column, obj):
+        """Return a column's exported value for an object.
+
+        Args:
+            column (StatefulColumn):
+                The column being exported.
+
+            obj (object):
+                The object being exported.
+
+        Returns:
+            object:
+            The value to export. Values other than strings, numbers,
+            booleans, date/times, and ``None`` are converted to strings.
+        """
+        try:
+            value = column.get_export_value(obj)
+        except Exception as e:
+            logger.exception('Error when calling get_export_value for '
+                             'DataGrid Column %r: %s',
+                             column, e)
+            return None
+
+        if (value is None or
+            isinstance(value, (six.string_types, six.integer_types, float,
+                               datetime.date, datetime.time))):
+            return value
+
+        return force_text(value)
+
+    def _iter_export_csv(self):
+        """Yield the exported datagrid as CSV.
+
+        Text beginning with a character that a spreadsheet would treat as the
+        start of a formula is prefixed with ``'``, so that exported data
+        can't run formulas when opened.
+
+        Yields:
+            bytes:
+            Lines of CSV.
+        """
+        class _Buffer(object):
+            def write(self, value):
+                return value
+
+        writer = csv.writer(_Buffer())
+
+        def _escape_value(value):
+            if (isinstance(value, six.string_types) and
+                value.startswith(_CSV_FORMULA_PREFIXES)):
+                value = "'%s" % value
+
+            return value
+
+        def _encode_row(row):
+            # The Python 2 csv module only handles byte strings.
+            if six.PY2:
+                return [
+                    force_bytes(_escape_value(value))
+                    if value is not None else b''
+                    for value in row
+                ]
+            else:
+                return [
+                    _escape_value(value) if value is not None else ''
+                    for value in row
+                ]
+
+        yield force_bytes(writer.writerow(_encode_row(
+            force_text(column.label or column.id)
+            for column in self.columns
+        )))
+
+        for batch in self._iter_export_batches():
+            yield b''.join(
+                force_bytes(writer.writerow(_encode_row(row)))
+                for row in batch
+            )
+
+    def _iter_export_json_lines(self):
+        """Yield the exported datagrid as JSON Lines.
+
+        Yields:
+            bytes:
+            Lines of JSON.
+        """
+        column_ids = [column.id for column in self.columns]
+
+        for batch in self._iter_export_batches():
+            yield b''.join(
+                json.dumps(dict(zip(column_ids, row)),
+                           cls=DjangoJSONEncoder,
+                           sort_keys=True).encode('utf-8') + b'\n'
+                for row in batch
+            )
+
     def render_paginator(self, adjacent_pages=3):
         """Render the paginator for the datagrid.
 
@@ -1494,12 +2884,27 @@ class DataGrid(object):
         Returns:
             unicode: The paginator as HTML.
         """
+        if isinstance(self.page, KeysetPage):
+            return self._render_keyset_paginator()
+
         extra_query = get_url_params_except(self.request.GET,
                                             'page', 'gridonly',
                                             *self.special_query_args)
 
+        num_pages = self.paginator.num_pages
+
+        if num_pages is None:
+            # The results aren't counted, so only the pages up to the next
+            # one are known to exist.
+            last_known_page = self.page.number
+
+            if self.page.has_next():
+                last_known_page += 1
+        else:
+            last_known_page = num_pages
+
         page_nums = range(max(1, self.page.number - adjacent_pages),
-                          min(self.paginator.num_pages,
+                          min(last_known_page,
                               self.page.number + adjacent_pages)
                           + 1)
 
@@ -1511,12 +2916,13 @@ class DataGrid(object):
             'hits': self.paginator.count,
             'results_per_page': self.paginate_by,
             'page': self.page.number,
-            'pages': self.paginator.num_pages,
+            'pages': num_pages,
             'page_numbers': page_nums,
             'has_next': self.page.has_next(),
             'has_previous': self.page.has_previous(),
             'show_first': 1 not in page_nums,
-            'show_last': self.paginator.num_pages not in page_nums,
+            'show_last': (num_pages is not None and
+                          num_pages not in page_nums),
             'extra_query': extra_query,
         }
 
@@ -1534,12 +2940,43 @@ class DataGrid(object):
 
         return render_to_string(self.paginator_template, context)
 
+    def _render_keyset_paginator(self):
+        """Render the paginator for keyset pagination.
+
+        Returns:
+            unicode: The paginator as HTML.
+        """
+        extra_query = get_url_params_except(self.request.GET,
+                                            'cursor', 'page', 'gridonly',
+                                            *self.special_query_args)
+
+        if extra_query:
+            extra_query += '&'
+
+        context = {
+            'is_paginated': self.page.has_other_pages(),
+            'hits': self.get_keyset_count(),
+            'results_per_page': self.paginate_by,
+            'has_next': self.page.has_next(),
+            'has_previous': self.page.has_previous(),
+            'next_cursor': self.page.next_cursor,
+            'previous_cursor': self.page.previous_cursor,
+            'extra_query': extra_query,
+        }
+        context.update(self.extra_context)
+
+        return render_to_string(self.keyset_paginator_template, context)
+
     def build_paginator(self, queryset):
         """Build the paginator for the datagrid.
 
         This can be overridden to use a special paginator or to perform
         any kind of processing before passing on the query.
 
+        By default, this returns a
+        :py:class:`~djblets.datagrid.counts.CountProviderPaginator`, which
+        counts results using :py:attr:`count_provider`.
+
         Args:
             queryset (object):
                 A queryset-compatible object.
@@ -1547,8 +2984,9 @@ class DataGrid(object):
         Returns:
             A populated paginator object.
         """
-        return QuerySetPaginator(queryset, self.paginate_by,
-                                 self.paginate_orphans)
+        return CountProviderPaginator(queryset, self.paginate_by,
+                                      self.paginate_orphans,
+                                      count_provider=self.count_provider)
 
     def _build_render_context(self):
         """Build a dictionary containing RequestContext contents.
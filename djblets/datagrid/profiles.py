@@ -0,0 +1,308 @@
+"""Deferred saving of datagrid state to user profiles.
+
+Datagrids remember each user's sort order and columns in their profile.
+Rather than saving the profile while rendering the datagrid, updates are
+queued and saved once the response has been sent (when Django's
+:py:data:`~django.core.signals.request_finished` signal is emitted).
+
+Updates for a profile are coalesced, so that all datagrids rendered in a
+request result in at most one save. Profiles can also be limited to one save
+per interval. Updates made before the interval has passed are held in the
+cache, and are saved along with the next update after it has passed. They're
+also applied when loading datagrid state in the meantime, so users always see
+their latest state.
+
+Updates held in the cache are merged and saved under a short-lived lock in
+the cache, so that concurrent requests for the same user don't lose each
+other's changes.
+
+Updates queued outside of a request (such as from a management command or a
+background thread) are saved immediately, since there's no request to wait
+for.
+"""
+
+from __future__ import unicode_literals
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.core.signals import request_finished, request_started
+from django.utils import six
+
+from djblets.cache.backend import make_cache_key
+
+
+logger = logging.getLogger(__name__)
+
+
+#: The number of seconds to hold pending profile updates in the cache.
+PENDING_UPDATES_EXPIRATION = 24 * 60 * 60
+
+#: The number of seconds before a lock on pending profile updates expires.
+PENDING_UPDATES_LOCK_EXPIRATION = 10
+
+#: The number of attempts made to lock pending profile updates.
+PENDING_UPDATES_LOCK_ATTEMPTS = 20
+
+#: The number of seconds to wait between attempts to lock pending updates.
+PENDING_UPDATES_LOCK_RETRY_DELAY = 0.05
+
+
+_queue = threading.local()
+
+
+def get_pending_profile_updates(profile):
+    """Return the updates waiting to be saved to a profile.
+
+    This includes updates queued in this thread, and updates held in the
+    cache until the profile can next be saved.
+
+    Args:
+        profile (django.db.models.Model):
+            The profile to return updates for.
+
+    Returns:
+        dict:
+        A dictionary mapping field names to their new values.
+    """
+    updates = cache.get(_make_profile_cache_key('pending', profile)) or {}
+
+    queued = _get_queued_updates().get(_get_profile_id(profile))
+
+    if queued:
+        updates.update(queued['fields'])
+
+    return updates
+
+
+def queue_profile_update(profile, fields, save_interval=0, save_all=False):
+    """Queue updates to save to a profile.
+
+    The updates will be saved when the current request finishes, or when
+    :py:func:`flush_profile_updates` is called. If this is called outside of
+    a request, they're saved immediately.
+
+    Args:
+        profile (django.db.models.Model):
+            The profile to update.
+
+        fields (dict):
+            A dictionary mapping field names to their new values. This may
+            be empty, in order to save any pending updates held in the cache.
+
+        save_interval (int, optional):
+            The minimum number of seconds between saves of the profile. If
+            the profile was saved more recently, the updates will be held in
+            the cache until a later save.
+
+        save_all (bool, optional):
+            Whether the whole profile must be saved, rather than just the
+            updated fields. This is used when other state was changed on the
+            profile, and bypasses ``save_interval``.
+    """
+    queued = _get_queued_updates()
+    profile_id = _get_profile_id(profile)
+
+    if profile_id in queued:
+        entry = queued[profile_id]
+        entry['profile'] = profile
+        entry['fields'].update(fields)
+        entry['save_interval'] = min(entry['save_interval'], save_interval)
+        entry['save_all'] = entry['save_all'] or save_all
+    else:
+        queued[profile_id] = {
+            'profile': profile,
+            'fields': dict(fields),
+            'save_interval': save_interval,
+            'save_all': save_all,
+        }
+
+    if not getattr(_queue, 'in_request', False):
+        # Nothing will flush the queue for us, so save now.
+        flush_profile_updates()
+
+
+def flush_profile_updates():
+    """Save all profile updates queued in this thread.
+
+    This is called automatically when a request finishes.
+    """
+    queued = _get_queued_updates()
+    _queue.updates = {}
+
+    for entry in six.itervalues(queued):
+        with _lock_pending_updates(entry['profile']):
+            _save_profile_updates(**entry)
+
+
+def _save_profile_updates(profile, fields, save_interval, save_all):
+    """Save updates to a profile, or hold them in the cache.
+
+    This must be called while holding the lock from
+    :py:func:`_lock_pending_updates`.
+
+    Args:
+        profile (django.db.models.Model):
+            The profile to update.
+
+        fields (dict):
+            A dictionary mapping field names to their new values.
+
+        save_interval (int):
+            The minimum number of seconds between saves of the profile.
+
+        save_all (bool):
+            Whether the whole profile must be saved.
+    """
+    pending_key = _make_profile_cache_key('pending', profile)
+    throttle_key = _make_profile_cache_key('saved', profile)
+
+    pending_fields = cache.get(pending_key) or {}
+    pending_fields.update(fields)
+    fields = pending_fields
+
+    if not fields and not save_all:
+        return
+
+    if (not save_all and save_interval > 0 and
+        not cache.add(throttle_key, True, save_interval)):
+        # The profile was saved too recently. Hold onto the updates until
+        # the next save.
+        cache.set(pending_key, fields, PENDING_UPDATES_EXPIRATION)
+        return
+
+    for field, value in six.iteritems(fields):
+        setattr(profile, field, value)
+
+    try:
+        if save_all:
+            profile.save()
+        else:
+            profile.save(update_fields=sorted(six.iterkeys(fields)))
+    except Exception as e:
+        logger.exception('Unable to save datagrid state to profile %r: %s',
+                         profile, e)
+        return
+
+    if fields:
+        cache.delete(pending_key)
+
+    if save_all and save_interval > 0:
+        cache.set(throttle_key, True, save_interval)
+
+
+@contextmanager
+def _lock_pending_updates(profile):
+    """Lock the pending updates for a profile while they're merged.
+
+    This retries for a short time if another process holds the lock. If the
+    lock still can't be acquired (for instance, if its holder has stalled),
+    the updates are merged without it.
+
+    Args:
+        profile (django.db.models.Model):
+            The profile whose pending updates are being merged.
+
+    Yields:
+        bool:
+        Whether the lock was acquired.
+    """
+    lock_key = _make_profile_cache_key('lock', profile)
+    locked = False
+
+    for i in range(PENDING_UPDATES_LOCK_ATTEMPTS):
+        if cache.add(lock_key, True, PENDING_UPDATES_LOCK_EXPIRATION):
+            locked = True
+            break
+
+        time.sleep(PENDING_UPDATES_LOCK_RETRY_DELAY)
+
+    if not locked:
+        logger.warning('Timed out waiting to lock pending datagrid state '
+                       'for profile %r. Saving it anyway.',
+                       profile)
+
+    try:
+        yield locked
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+def _get_queued_updates():
+    """Return the profile updates queued in this thread.
+
+    Returns:
+        dict:
+        A dictionary mapping profile IDs to queued updates.
+    """
+    try:
+        return _queue.updates
+    except AttributeError:
+        _queue.updates = {}
+
+        return _queue.updates
+
+
+def _get_profile_id(profile):
+    """Return a string identifying a profile.
+
+    Args:
+        profile (django.db.models.Model):
+            The profile.
+
+    Returns:
+        unicode:
+        The ID of the profile.
+    """
+    profile_cls = type(profile)
+
+    return '%s.%s:%s' % (profile_cls.__module__, profile_cls.__name__,
+                         profile.pk)
+
+
+def _make_profile_cache_key(name, profile):
+    """Return a cache key for the saving state of a profile.
+
+    Args:
+        name (unicode):
+            The name of the state.
+
+        profile (django.db.models.Model):
+            The profile.
+
+    Returns:
+        unicode:
+        The cache key.
+    """
+    return make_cache_key('datagrid-profile-%s:%s'
+                          % (name, _get_profile_id(profile)))
+
+
+def _on_request_started(**kwargs):
+    """Begin queuing profile updates for a request.
+
+    Args:
+        **kwargs (dict):
+            Keyword arguments passed by the signal.
+    """
+    _queue.updates = {}
+    _queue.in_request = True
+
+
+def _on_request_finished(**kwargs):
+    """Save the profile updates queued during the request.
+
+    Args:
+        **kwargs (dict):
+            Keyword arguments passed by the signal.
+    """
+    _queue.in_request = False
+    flush_profile_updates()
+
+
+request_started.connect(_on_request_started)
+request_finished.connect(_on_request_finished)
@@ -25,20 +25,40 @@
 
 from __future__ import unicode_literals
 
+import base64
+import json
+import threading
 from datetime import datetime, timedelta
 
+import django
+import nose
 from django.conf import settings
-from django.contrib.auth.models import Group, User
-from django.http import HttpRequest
+from django.contrib.auth.models import Group, Permission, User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models import Count
+from django.http import Http404, HttpRequest
 from django.test.client import RequestFactory
+from django.utils import six
 from django.utils.encoding import force_text
 from django.utils.safestring import SafeText
 from django.utils.six.moves import range
 from kgb import SpyAgency
 
+from djblets.cache.synchronizer import GenerationSynchronizer
+from djblets.datagrid import profiles
+from djblets.datagrid.counts import (CachedCountProvider,
+                                     EstimatedCountProvider,
+                                     UncountedProvider)
 from djblets.datagrid.grids import (CheckboxColumn, Column, DataGrid,
                                     DateTimeSinceColumn, StatefulColumn,
                                     logger)
+from djblets.datagrid.profiles import flush_profile_updates
+from djblets.testing.benchmarks import (DATAGRID_BENCHMARK_FETCHES,
+                                        DATAGRID_BENCHMARK_MODES,
+                                        DATAGRID_BENCHMARK_SORTS,
+                                        format_datagrid_benchmarks,
+                                        run_datagrid_benchmarks)
 from djblets.testing.testcases import TestCase
 from djblets.util.dates import get_tz_aware_utcnow
 
@@ -126,6 +146,53 @@ class DateTimeSinceColumnTests(TestCase):
         self.assertEqual(column.render_data(state, obj), '1\xa0week ago')
 
 
+class StubProfile(object):
+    """A stand-in for a user profile storing datagrid state."""
+
+    pk = 1
+    sort = None
+    columns = None
+
+    def __init__(self):
+        self.saved_fields = []
+
+    def save(self, update_fields=None):
+        self.saved_fields.append(update_fields)
+
+
+class ProfileGroupDataGrid(GroupDataGrid):
+    def __init__(self, request, profile):
+        super(ProfileGroupDataGrid, self).__init__(request)
+        self.profile = profile
+        self.profile_sort_field = 'sort'
+        self.profile_columns_field = 'columns'
+
+    def get_user_profile(self):
+        return self.profile
+
+
+class ThreadExecutor(object):
+    """An executor running each function in a new thread."""
+
+    class Future(object):
+        def __init__(self, fn, args, kwargs):
+            self._result = None
+            self._thread = threading.Thread(target=self._run,
+                                            args=(fn, args, kwargs))
+            self._thread.start()
+
+        def _run(self, fn, args, kwargs):
+            self._result = fn(*args, **kwargs)
+
+        def result(self):
+            self._thread.join()
+
+            return self._result
+
+    def submit(self, fn, *args, **kwargs):
+        return self.Future(fn, args, kwargs)
+
+
 class DataGridTests(SpyAgency, TestCase):
     """Unit tests for djblets.datagrid.grids.DataGrid."""
 
@@ -215,6 +282,744 @@ class DataGridTests(SpyAgency, TestCase):
         self.assertIsInstance(result, SafeText)
         self.assertIn('<div class="datagrid-wrapper" id="datagrid-0">', result)
 
+    def test_load_state_with_keyset_pagination(self):
+        """Testing DataGrid.load_state with keyset pagination"""
+        self.request.GET['sort'] = '-name'
+        self.datagrid.pagination_mode = DataGrid.PAGINATION_KEYSET
+        self.datagrid.load_state()
+
+        self.assertIsNone(self.datagrid.paginator)
+        self.assertEqual(len(self.datagrid.rows), 50)
+        self.assertEqual(self.datagrid.rows[0]['object'].name, 'Group 99')
+        self.assertEqual(self.datagrid.rows[49]['object'].name, 'Group 50')
+
+        page = self.datagrid.page
+        self.assertTrue(page.has_next())
+        self.assertFalse(page.has_previous())
+
+        # Fetch the next page.
+        request = HttpRequest()
+        request.user = self.user
+        request.GET['sort'] = '-name'
+        request.GET['cursor'] = page.next_cursor
+
+        datagrid = GroupDataGrid(request)
+        datagrid.pagination_mode = DataGrid.PAGINATION_KEYSET
+        datagrid.load_state()
+
+        self.assertEqual(len(datagrid.rows), 49)
+        self.assertEqual(datagrid.rows[0]['object'].name, 'Group 49')
+        self.assertEqual(datagrid.rows[48]['object'].name, 'Group 01')
+        self.assertFalse(datagrid.page.has_next())
+        self.assertTrue(datagrid.page.has_previous())
+
+        # Go back to the previous page.
+        request.GET['cursor'] = datagrid.page.previous_cursor
+
+        datagrid = GroupDataGrid(request)
+        datagrid.pagination_mode = DataGrid.PAGINATION_KEYSET
+        datagrid.load_state()
+
+        self.assertEqual(len(datagrid.rows), 50)
+        self.assertEqual(datagrid.rows[0]['object'].name, 'Group 99')
+        self.assertEqual(datagrid.rows[49]['object'].name, 'Group 50')
+        self.assertTrue(datagrid.page.has_next())
+        self.assertFalse(datagrid.page.has_previous())
+
+    def test_load_state_with_keyset_pagination_last(self):
+        """Testing DataGrid.load_state with keyset pagination and
+        cursor=last
+        """
+        self.request.GET['sort'] = 'name'
+        self.request.GET['cursor'] = 'last'
+        self.datagrid.pagination_mode = DataGrid.PAGINATION_KEYSET
+        self.datagrid.load_state()
+
+        self.assertEqual(len(self.datagrid.rows), 50)
+        self.assertEqual(self.datagrid.rows[0]['object'].name, 'Group 50')
+        self.assertEqual(self.datagrid.rows[49]['object'].name, 'Group 99')
+        self.assertFalse(self.datagrid.page.has_next())
+        self.assertTrue(self.datagrid.page.has_previous())
+
+    def test_load_state_with_keyset_pagination_other_sort(self):
+        """Testing DataGrid.load_state with keyset pagination and a cursor
+        for a different sort order
+        """
+        self.request.GET['sort'] = 'name'
+        self.datagrid.pagination_mode = DataGrid.PAGINATION_KEYSET
+        self.datagrid.load_state()
+
+        request = HttpRequest()
+        request.user = self.user
+        request.GET['sort'] = '-name'
+        request.GET['cursor'] = self.datagrid.page.next_cursor
+
+        datagrid = GroupDataGrid(request)
+        datagrid.pagination_mode = DataGrid.PAGINATION_KEYSET
+        datagrid.load_state()
+
+        self.assertEqual(datagrid.rows[0]['object'].name, 'Group 99')
+        self.assertFalse(datagrid.page.has_previous())
+
+    def test_load_state_with_keyset_pagination_invalid_cursor(self):
+        """Testing DataGrid.load_state with keyset pagination and an invalid
+        cursor
+        """
+        self.request.GET['cursor'] = 'abc$'
+        self.datagrid.pagination_mode = DataGrid.PAGINATION_KEYSET
+
+        with self.assertRaises(Http404):
+            self.datagrid.load_state()
+
+    def test_load_state_with_keyset_pagination_invalid_cursor_values(self):
+        """Testing DataGrid.load_state with keyset pagination and a cursor
+        containing invalid values
+        """
+        self.request.GET['sort'] = 'name'
+        self.request.GET['cursor'] = force_text(base64.urlsafe_b64encode(
+            json.dumps({
+                's': ['name'],
+                'd': 'n',
+                'v': ['Group 01', {}],
+            }).encode('utf-8')))
+        self.datagrid.pagination_mode = DataGrid.PAGINATION_KEYSET
+
+        with self.assertRaises(Http404):
+            self.datagrid.load_state()
+
+    def test_load_state_with_keyset_pagination_nullable_sort(self):
+        """Testing DataGrid.load_state with keyset pagination and a sort
+        field that can be NULL
+        """
+        if not User._meta.get_field('last_login').null:
+            raise nose.SkipTest('User.last_login is not nullable on this '
+                                'version of Django')
+
+        class UserDataGrid(DataGrid):
+            username = Column('Username', sortable=True)
+            last_login = Column('Last Login', sortable=True)
+
+            def __init__(self, request):
+                super(UserDataGrid, self).__init__(request,
+                                                   User.objects.all(),
+                                                   'All Users')
+                self.default_sort = []
+                self.default_columns = ['username', 'last_login']
+
+        User.objects.create(username='user1', last_login=None)
+        User.objects.create(username='user2',
+                            last_login=get_tz_aware_utcnow())
+
+        self.request.GET['sort'] = 'last_login'
+        datagrid = UserDataGrid(self.request)
+        datagrid.pagination_mode = DataGrid.PAGINATION_KEYSET
+        datagrid.load_state()
+
+        # Standard pagination is used, so that users without a last login
+        # time aren't skipped.
+        self.assertIsNotNone(datagrid.paginator)
+        self.assertEqual(
+            set(row['object'].username for row in datagrid.rows),
+            set(['user1', 'user2']))
+
+    def test_render_paginator_with_keyset_pagination(self):
+        """Testing DataGrid.render_paginator with keyset pagination"""
+        self.datagrid.pagination_mode = DataGrid.PAGINATION_KEYSET
+        self.datagrid.keyset_show_count = True
+        self.datagrid.load_state()
+
+        content = self.datagrid.render_paginator()
+        next_cursor = self.datagrid.page.next_cursor
+
+        self.assertHTMLEqual(
+            content,
+            '<div class="paginator">'
+            ' <a href="?cursor=%s" title="Next Page">&gt;</a>'
+            ' <a href="?cursor=last" title="Last Page">&raquo;</a>'
+            ' <span class="page-count">99 results&nbsp;</span>'
+            '</div>'
+            % next_cursor)
+
+    def test_load_state_with_uncounted_provider(self):
+        """Testing DataGrid.load_state with UncountedProvider"""
+        self.datagrid.count_provider = UncountedProvider()
+        self.datagrid.load_state()
+
+        self.assertIsNone(self.datagrid.paginator.count)
+        self.assertIsNone(self.datagrid.paginator.num_pages)
+        self.assertEqual(len(self.datagrid.rows), 50)
+        self.assertTrue(self.datagrid.page.has_next())
+        self.assertFalse(self.datagrid.page.has_previous())
+
+        self.assertHTMLEqual(
+            self.datagrid.render_paginator(),
+            '<div class="paginator">'
+            ' <span class="current-page">1</span>'
+            ' <a href="?page=2" title="Page 2">2</a>'
+            ' <a href="?page=2" title="Next Page">&gt;</a>'
+            '</div>')
+
+        # The last 49 groups fit on the second page, with the orphans.
+        request = HttpRequest()
+        request.user = self.user
+        request.GET['page'] = '2'
+
+        datagrid = GroupDataGrid(request)
+        datagrid.count_provider = UncountedProvider()
+        datagrid.load_state()
+
+        self.assertEqual(len(datagrid.rows), 49)
+        self.assertFalse(datagrid.page.has_next())
+        self.assertTrue(datagrid.page.has_previous())
+        self.assertEqual(datagrid.page.end_index(), 99)
+
+    def test_load_state_with_uncounted_provider_last(self):
+        """Testing DataGrid.load_state with UncountedProvider and page=last
+        """
+        self.request.GET['page'] = 'last'
+        self.datagrid.count_provider = UncountedProvider()
+
+        with self.assertRaises(Http404):
+            self.datagrid.load_state()
+
+    def test_load_state_with_cached_count_provider(self):
+        """Testing DataGrid.load_state with CachedCountProvider"""
+        cache.clear()
+
+        synchronizer = GenerationSynchronizer('test-datagrid-count')
+        self.datagrid.count_provider = CachedCountProvider(
+            synchronizer=synchronizer)
+        self.datagrid.load_state()
+        self.assertEqual(self.datagrid.paginator.count, 99)
+
+        # The cached count is used until the generation changes.
+        Group.objects.create(name='Group 100')
+
+        datagrid = GroupDataGrid(self.request)
+        datagrid.count_provider = self.datagrid.count_provider
+        datagrid.load_state()
+        self.assertEqual(datagrid.paginator.count, 99)
+
+        synchronizer.mark_updated()
+
+        datagrid = GroupDataGrid(self.request)
+        datagrid.count_provider = self.datagrid.count_provider
+        datagrid.load_state()
+        self.assertEqual(datagrid.paginator.count, 100)
+
+    def test_load_state_with_estimated_count_provider(self):
+        """Testing DataGrid.load_state with EstimatedCountProvider on a
+        database without estimates
+        """
+        provider = EstimatedCountProvider(threshold=10)
+        self.spy_on(provider.get_estimate, call_fake=lambda *args: None)
+
+        self.datagrid.count_provider = provider
+        self.datagrid.load_state()
+
+        self.assertTrue(provider.get_estimate.called)
+        self.assertEqual(self.datagrid.paginator.count, 99)
+
+    def test_load_state_with_estimated_count_provider_above_threshold(self):
+        """Testing DataGrid.load_state with EstimatedCountProvider and an
+        estimate above the threshold
+        """
+        provider = EstimatedCountProvider(threshold=10)
+        self.spy_on(provider.get_estimate, call_fake=lambda *args: 150)
+
+        self.datagrid.count_provider = provider
+        self.datagrid.load_state()
+
+        self.assertEqual(self.datagrid.paginator.count, 150)
+        self.assertEqual(self.datagrid.paginator.num_pages, 3)
+
+    def test_load_state_with_cached_cells(self):
+        """Testing DataGrid.load_state with a column caching its cells"""
+        class CachedColumn(Column):
+            def get_cell_cache_version(self, state, obj):
+                return obj.name
+
+        cache.clear()
+
+        column = CachedColumn('Cached', id='cached', field_name='name',
+                              cache_cells=True)
+        self.spy_on(column.render_data)
+
+        GroupDataGrid.add_column(column)
+
+        try:
+            self.request.GET['columns'] = 'objid,cached'
+            self.datagrid.load_state()
+
+            self.assertEqual(len(column.render_data.calls), 50)
+            self.assertInHTML('<td colspan="2">Group 01</td>',
+                              self.datagrid.rows[0]['cells'][1])
+
+            # A second load will use the cached cells.
+            datagrid = GroupDataGrid(self.request)
+            datagrid.load_state()
+
+            self.assertEqual(len(column.render_data.calls), 50)
+            self.assertEqual(
+                [row['cells'][1] for row in datagrid.rows],
+                [row['cells'][1] for row in self.datagrid.rows])
+
+            # Changing an object's version will re-render its cell.
+            group = Group.objects.get(name='Group 01')
+            group.name = 'Group 00'
+            group.save()
+
+            datagrid = GroupDataGrid(self.request)
+            datagrid.load_state()
+
+            self.assertEqual(len(column.render_data.calls), 51)
+            self.assertInHTML('<td colspan="2">Group 00</td>',
+                              datagrid.rows[0]['cells'][1])
+        finally:
+            GroupDataGrid.remove_column(column)
+
+    def test_collect_objects_merges_queries(self):
+        """Testing DataGrid.collect_objects merges queries for columns with
+        the same related model
+        """
+        permissions = list(Permission.objects.all()[:10])
+        content_type_ids = set(
+            permission.content_type_id
+            for permission in permissions
+        )
+
+        column1 = StatefulColumn(
+            self.datagrid,
+            Column('Type', id='type1', field_name='content_type',
+                   only_fields=['model']))
+        column2 = StatefulColumn(
+            self.datagrid,
+            Column('Type', id='type2', field_name='content_type',
+                   only_fields=['app_label']))
+
+        with self.assertNumQueries(1):
+            self.datagrid.collect_objects([column1, column2], permissions)
+
+        self.assertEqual(set(column1.data_cache), content_type_ids)
+        self.assertEqual(column1.data_cache, column2.data_cache)
+
+        with self.assertNumQueries(0):
+            for content_type in six.itervalues(column1.data_cache):
+                content_type.model
+                content_type.app_label
+
+    def test_collect_objects_with_custom_collect_objects(self):
+        """Testing DataGrid.collect_objects with a column overriding
+        Column.collect_objects
+        """
+        class CustomColumn(Column):
+            def collect_objects(self, state, object_list):
+                state.data_cache['custom'] = len(object_list)
+
+        permissions = list(Permission.objects.all()[:10])
+        column = StatefulColumn(
+            self.datagrid,
+            CustomColumn('Type', id='type', field_name='content_type'))
+
+        with self.assertNumQueries(0):
+            self.datagrid.collect_objects([column], permissions)
+
+        self.assertEqual(column.data_cache, {'custom': 10})
+
+    def test_export_to_response_csv(self):
+        """Testing DataGrid.export_to_response with CSV"""
+        self.request.GET['sort'] = '-name'
+        self.datagrid.export_formats = [DataGrid.EXPORT_CSV]
+        self.datagrid.export_batch_size = 10
+
+        response = self.datagrid.export_to_response(DataGrid.EXPORT_CSV)
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename="all-groups.csv"')
+
+        lines = force_text(b''.join(response.streaming_content)).splitlines()
+        self.assertEqual(len(lines), 100)
+        self.assertEqual(lines[0], 'ID,Group Name')
+
+        group = Group.objects.get(name='Group 99')
+        self.assertEqual(lines[1], '%s,Group 99' % group.pk)
+        self.assertTrue(lines[99].endswith(',Group 01'))
+
+    def test_export_to_response_json_lines(self):
+        """Testing DataGrid.export_to_response with JSON Lines"""
+        self.datagrid.export_formats = [DataGrid.EXPORT_JSON_LINES]
+        self.datagrid.export_batch_size = 10
+
+        response = self.datagrid.export_to_response(
+            DataGrid.EXPORT_JSON_LINES)
+
+        lines = force_text(b''.join(response.streaming_content)).splitlines()
+        self.assertEqual(len(lines), 99)
+
+        group = Group.objects.get(name='Group 01')
+        self.assertEqual(
+            json.loads(lines[0]),
+            {
+                'objid': group.pk,
+                'name': 'Group 01',
+            })
+
+    def test_export_to_response_unsupported_format(self):
+        """Testing DataGrid.export_to_response with an unsupported format"""
+        with self.assertRaises(Http404):
+            self.datagrid.export_to_response(DataGrid.EXPORT_CSV)
+
+    def test_render_to_response_with_export(self):
+        """Testing DataGrid.render_to_response with ?export="""
+        self.request.GET['export'] = 'csv'
+        self.datagrid.export_formats = [DataGrid.EXPORT_CSV]
+
+        response = self.datagrid.render_to_response('datagrid/datagrid.html')
+
+        self.assertTrue(response.streaming)
+        self.assertIsNone(self.datagrid.page)
+
+    def test_render_to_response_with_export_not_enabled(self):
+        """Testing DataGrid.render_to_response with ?export= for a format
+        that isn't enabled
+        """
+        self.request.GET.update({
+            'export': 'csv',
+            'gridonly': '1',
+            'datagrid-id': self.datagrid.id,
+        })
+
+        self.spy_on(self.datagrid.export_to_response)
+        self.spy_on(self.datagrid.load_state)
+
+        # This only renders the grid, so that no page template is needed.
+        response = self.datagrid.render_to_response('datagrid/datagrid.html')
+
+        self.assertFalse(self.datagrid.export_to_response.called)
+        self.assertTrue(self.datagrid.load_state.called)
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'<div class="datagrid-main">', response.content)
+        self.assertIsNotNone(self.datagrid.page)
+
+    def test_export_to_response_csv_with_formulas(self):
+        """Testing DataGrid.export_to_response with CSV escapes values that
+        would be treated as formulas
+        """
+        Group.objects.all().delete()
+        Group.objects.create(name='=1+2')
+        Group.objects.create(name='@SUM(A1)')
+
+        self.request.GET['sort'] = 'name'
+        self.datagrid.export_formats = [DataGrid.EXPORT_CSV]
+
+        response = self.datagrid.export_to_response(DataGrid.EXPORT_CSV)
+        lines = force_text(b''.join(response.streaming_content)).splitlines()
+
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].endswith(",'=1+2"))
+        self.assertTrue(lines[2].endswith(",'@SUM(A1)"))
+
+    def test_load_state_saves_profile_after_request(self):
+        """Testing DataGrid.load_state saves profile state once the request
+        has finished
+        """
+        cache.clear()
+
+        profile = StubProfile()
+        self.request.GET['sort'] = '-name'
+
+        profiles._on_request_started()
+
+        try:
+            datagrid = ProfileGroupDataGrid(self.request, profile)
+            datagrid.load_state()
+
+            self.assertEqual(profile.saved_fields, [])
+        finally:
+            profiles._on_request_finished()
+
+        self.assertEqual(profile.saved_fields, [['sort']])
+        self.assertEqual(profile.sort, '-name')
+        self.assertIsNone(profile.columns)
+
+    def test_load_state_without_url_state(self):
+        """Testing DataGrid.load_state doesn't save default state to the
+        profile
+        """
+        cache.clear()
+
+        profile = StubProfile()
+
+        datagrid = ProfileGroupDataGrid(self.request, profile)
+        datagrid.load_state()
+        flush_profile_updates()
+
+        self.assertEqual(profile.saved_fields, [])
+
+    def test_load_state_with_profile_save_interval(self):
+        """Testing DataGrid.load_state with changes inside the profile save
+        interval
+        """
+        cache.clear()
+
+        profile = StubProfile()
+        self.request.GET['sort'] = '-name'
+
+        profiles._on_request_started()
+
+        try:
+            datagrid = ProfileGroupDataGrid(self.request, profile)
+            datagrid.load_state()
+            flush_profile_updates()
+
+            self.assertEqual(profile.saved_fields, [['sort']])
+
+            # The next change is held until the interval has passed, but is
+            # still used when loading the datagrid.
+            request = HttpRequest()
+            request.user = self.user
+            request.GET['columns'] = 'name'
+
+            datagrid = ProfileGroupDataGrid(request, profile)
+            datagrid.load_state()
+            flush_profile_updates()
+
+            self.assertEqual(profile.saved_fields, [['sort']])
+            self.assertIsNone(profile.columns)
+
+            request = HttpRequest()
+            request.user = self.user
+
+            datagrid = ProfileGroupDataGrid(request, profile)
+            datagrid.load_state()
+
+            self.assertEqual([column.id for column in datagrid.columns],
+                             ['name'])
+            self.assertEqual(datagrid.sort_list, ['-name'])
+
+            # Once the interval has passed, the held change is saved.
+            cache.delete(profiles._make_profile_cache_key('saved', profile))
+        finally:
+            profiles._on_request_finished()
+
+        self.assertEqual(profile.saved_fields, [['sort'], ['columns']])
+        self.assertEqual(profile.columns, 'name')
+
+    def test_load_state_saves_profile_outside_request(self):
+        """Testing DataGrid.load_state saves profile state immediately
+        outside of a request
+        """
+        cache.clear()
+
+        profile = StubProfile()
+        self.request.GET['sort'] = '-name'
+
+        datagrid = ProfileGroupDataGrid(self.request, profile)
+        datagrid.load_state()
+
+        self.assertEqual(profile.saved_fields, [['sort']])
+        self.assertEqual(profile.sort, '-name')
+
+    def test_queue_profile_update_merges_held_updates(self):
+        """Testing queue_profile_update merges updates held in the cache
+        while holding the lock
+        """
+        cache.clear()
+
+        profile = StubProfile()
+        lock_key = profiles._make_profile_cache_key('lock', profile)
+        pending_key = profiles._make_profile_cache_key('pending', profile)
+        locked_during_save = []
+
+        def _save(update_fields=None):
+            locked_during_save.append(lock_key in cache)
+            profile.saved_fields.append(update_fields)
+
+        profile.save = _save
+        cache.set(pending_key, {'sort': '-name'})
+
+        profiles.queue_profile_update(profile, {'columns': 'name'},
+                                      save_interval=60)
+
+        self.assertEqual(profile.saved_fields, [['columns', 'sort']])
+        self.assertEqual(locked_during_save, [True])
+        self.assertNotIn(lock_key, cache)
+        self.assertNotIn(pending_key, cache)
+
+    def test_load_state_with_optimize_sorts_strategies(self):
+        """Testing DataGrid.load_state with optimize_sorts strategies"""
+        def _load_names(strategy, num_queries):
+            request = HttpRequest()
+            request.user = self.user
+            request.GET['sort'] = '-name,objid'
+            request.GET['page'] = '2'
+
+            datagrid = GroupDataGrid(request)
+            datagrid.optimize_sorts_strategy = strategy
+
+            # This includes the count query for the paginator.
+            with self.assertNumQueries(num_queries):
+                datagrid.load_state()
+
+            return [row['object'].name for row in datagrid.rows]
+
+        names = _load_names(DataGrid.OPTIMIZE_SORTS_SUBQUERY, 2)
+        self.assertEqual(len(names), 49)
+        self.assertEqual(names[0], 'Group 49')
+        self.assertEqual(names[-1], 'Group 01')
+
+        self.assertEqual(_load_names(DataGrid.OPTIMIZE_SORTS_TWO_QUERIES, 3),
+                         names)
+
+    def test_load_state_with_subquery_and_related_sort(self):
+        """Testing DataGrid.load_state with OPTIMIZE_SORTS_SUBQUERY and
+        sorting by a related field
+        """
+        class PermissionDataGrid(DataGrid):
+            objid = Column('ID', sortable=True, field_name='id')
+            codename = Column('Code Name', sortable=True,
+                              db_field='content_type__model')
+
+            def __init__(self, request):
+                super(PermissionDataGrid, self).__init__(
+                    request,
+                    Permission.objects.all(),
+                    'All Permissions')
+                self.default_sort = []
+                self.default_columns = ['objid', 'codename']
+
+        for model in (Group, User):
+            content_type = ContentType.objects.get_for_model(model)
+
+            for i in range(3):
+                Permission.objects.create(
+                    codename='test_%s_%d' % (content_type.model, i),
+                    name='Test %d' % i,
+                    content_type=content_type)
+
+        def _load_ids(strategy):
+            request = HttpRequest()
+            request.user = self.user
+            request.GET['sort'] = '-codename,objid'
+
+            datagrid = PermissionDataGrid(request)
+            datagrid.optimize_sorts_strategy = strategy
+
+            # The sort spans a relation, so the two-query approach is used.
+            with self.assertNumQueries(3):
+                datagrid.load_state()
+
+            return [row['object'].pk for row in datagrid.rows]
+
+        ids = _load_ids(DataGrid.OPTIMIZE_SORTS_SUBQUERY)
+        self.assertEqual(
+            ids,
+            list(Permission.objects
+                 .order_by('-content_type__model', 'pk')
+                 .values_list('pk', flat=True)[:len(ids)]))
+        self.assertEqual(_load_ids(DataGrid.OPTIMIZE_SORTS_TWO_QUERIES), ids)
+
+    def test_load_state_with_subquery_and_annotated_sort(self):
+        """Testing DataGrid.load_state with OPTIMIZE_SORTS_SUBQUERY and
+        sorting by an annotated field
+        """
+        if django.VERSION < (1, 8):
+            # Older versions of Django can't sort by an annotation once
+            # values_list() is used to fetch the IDs for the page, which
+            # the two-query approach depends on.
+            raise nose.SkipTest('Sorting by an annotation with '
+                                'values_list() requires Django 1.8+')
+
+        class AnnotatedGroupDataGrid(GroupDataGrid):
+            name = Column('Group Name', sortable=True, field_name='name',
+                          db_field='num_users')
+
+            def __init__(self, request):
+                super(AnnotatedGroupDataGrid, self).__init__(request)
+                self.queryset = Group.objects.annotate(num_users=Count('user'))
+
+        groups = list(Group.objects.order_by('pk')[:4])
+
+        for i, group in enumerate(groups[:3]):
+            for j in range(i + 1):
+                user = User.objects.create(username='user_%d_%d' % (i, j))
+                user.groups.add(group)
+
+        self.request.GET['sort'] = '-name,objid'
+        datagrid = AnnotatedGroupDataGrid(self.request)
+        datagrid.optimize_sorts_strategy = DataGrid.OPTIMIZE_SORTS_SUBQUERY
+
+        # The annotation can't be used in the subquery, so the two-query
+        # approach is used.
+        with self.assertNumQueries(3):
+            datagrid.load_state()
+
+        self.assertEqual(
+            [row['object'].pk for row in datagrid.rows[:4]],
+            [groups[2].pk, groups[1].pk, groups[0].pk, groups[3].pk])
+
+    def test_load_state_with_batched_render_cells(self):
+        """Testing DataGrid.load_state renders each column's cells in a
+        batch
+        """
+        class BatchColumn(Column):
+            def render_cells(self, state, object_list, object_urls,
+                             render_context):
+                return [
+                    '<td>%s</td>' % obj.name.upper()
+                    for obj in object_list
+                ]
+
+        column = BatchColumn('Batch', id='batch')
+        self.spy_on(column.render_cells)
+        self.spy_on(column.render_cell)
+
+        GroupDataGrid.add_column(column)
+
+        try:
+            self.request.GET['columns'] = 'batch,objid'
+            self.datagrid.load_state()
+        finally:
+            GroupDataGrid.remove_column(column)
+
+        self.assertEqual(len(column.render_cells.calls), 1)
+        self.assertFalse(column.render_cell.called)
+        self.assertEqual(self.datagrid.rows[0]['cells'][0],
+                         '<td>GROUP 01</td>')
+
+    def test_load_state_with_render_executor(self):
+        """Testing DataGrid.load_state with render_executor and a column
+        rendering in parallel
+        """
+        render_threads = []
+
+        class ParallelColumn(Column):
+            def render_cells(self, *args, **kwargs):
+                render_threads.append(threading.current_thread())
+
+                return super(ParallelColumn, self).render_cells(*args,
+                                                                **kwargs)
+
+        column = ParallelColumn('Parallel', id='parallel', field_name='name',
+                                render_in_parallel=True)
+
+        GroupDataGrid.add_column(column)
+
+        try:
+            self.request.GET['columns'] = 'parallel,objid'
+            self.datagrid.render_executor = ThreadExecutor()
+            self.datagrid.load_state()
+        finally:
+            GroupDataGrid.remove_column(column)
+
+        self.assertEqual(len(render_threads), 1)
+        self.assertIsNot(render_threads[0], threading.current_thread())
+        self.assertEqual(len(self.datagrid.rows), 50)
+        self.assertInHTML('<td>Group 01</td>',
+                          self.datagrid.rows[0]['cells'][0])
+
     def test_load_state_with_custom_column_orders(self):
         """Testing DataGrid.load_state with custom column orders"""
         self.request.GET['columns'] = 'objid'
@@ -381,3 +1186,42 @@ class ColumnTests(SpyAgency, TestCase):
         self.assertTrue(column.render_data.called)
         self.assertIn('Error when calling render_data for DataGrid Column',
                       logger.exception.last_call.args[0])
+
+
+class DataGridBenchmarkTests(TestCase):
+    """Unit tests for djblets.testing.benchmarks."""
+
+    def test_run_datagrid_benchmarks(self):
+        """Testing run_datagrid_benchmarks"""
+        results = run_datagrid_benchmarks(num_rows=20, num_columns=2,
+                                          repeat=1)
+
+        self.assertEqual(
+            set((result.mode, result.sort, result.fetch)
+                for result in results),
+            set((mode, sort, fetch)
+                for mode in DATAGRID_BENCHMARK_MODES
+                for sort in DATAGRID_BENCHMARK_SORTS
+                for fetch in DATAGRID_BENCHMARK_FETCHES))
+        self.assertEqual(
+            len(results),
+            (len(DATAGRID_BENCHMARK_MODES) * len(DATAGRID_BENCHMARK_SORTS) *
+             len(DATAGRID_BENCHMARK_FETCHES)))
+
+        for result in results:
+            self.assertGreater(result.num_rows, 0)
+            self.assertGreater(result.query_count, 0)
+
+        self.assertIn('Rows/sec', format_datagrid_benchmarks(results))
+
+    def test_run_datagrid_benchmarks_twice(self):
+        """Testing run_datagrid_benchmarks run twice with the same number of
+        columns
+        """
+        for i in range(2):
+            results = run_datagrid_benchmarks(num_rows=5, num_columns=1,
+                                              modes=['offset-first'],
+                                              sorts=['single'],
+                                              repeat=1)
+
+            self.assertEqual(len(results), len(DATAGRID_BENCHMARK_FETCHES))
@@ -26,6 +26,8 @@ except ImportError:
     from django.db.backends import (util as db_backend_utils,
                                     BaseDatabaseWrapper)
 
+from djblets.cache.stats import (CacheStats, begin_request_stats,
+                                 end_request_stats)
 from djblets.log import init_logging, init_profile_logger, log_timed
 
 
@@ -130,9 +132,10 @@ def reformat_sql(sql):
 class LoggingMiddleware(object):
     """A piece of middleware that sets up page timing and profile logging.
 
-    This is needed if using ``settings.LOGGING_PAGE_TIMES`` or
-    ``settings.LOGGING_ALLOW_PROFILING``, in order to handle additional
-    logging for page times and detailed profiling for debugging.
+    This is needed if using ``settings.LOGGING_PAGE_TIMES``,
+    ``settings.LOGGING_ALLOW_PROFILING``, or ``settings.LOGGING_CACHE_STATS``,
+    in order to handle additional logging for page times, detailed profiling
+    for debugging, and cache statistics for each request.
     """
 
     #: Exceptions that should be ignored by this logger.
@@ -150,6 +153,9 @@ class LoggingMiddleware(object):
                 log_timed('Page request: HTTP %s %s (by %s)' %
                           (request.method, request.path, request.user))
 
+        if getattr(settings, 'LOGGING_CACHE_STATS', False):
+            begin_request_stats()
+
         if ('profiling' in request.GET and
             getattr(settings, "LOGGING_ALLOW_PROFILING", False)):
             settings.DEBUG = True
@@ -180,6 +186,11 @@ class LoggingMiddleware(object):
         if timedloginfo:
             timedloginfo.done()
 
+        cache_stats = end_request_stats()
+
+        if cache_stats:
+            self._log_cache_stats(request, cache_stats)
+
         if ('profiling' in request.GET and
             getattr(settings, "LOGGING_ALLOW_PROFILING", False)):
 
@@ -227,6 +238,38 @@ class LoggingMiddleware(object):
 
         return response
 
+    def _log_cache_stats(self, request, cache_stats):
+        """Log the cache statistics collected for a request.
+
+        This will log a summary of all cache operations, followed by the
+        statistics for each key prefix.
+
+        Args:
+            request (django.http.HttpRequest):
+                The HTTP request for the page.
+
+            cache_stats (dict):
+                A dictionary mapping key prefixes to
+                :py:class:`~djblets.cache.stats.CacheStats`.
+        """
+        totals = CacheStats()
+
+        for stats in six.itervalues(cache_stats):
+            totals.merge(stats)
+
+        hit_ratio = totals.hit_ratio
+
+        if hit_ratio is None:
+            hit_ratio_str = 'n/a'
+        else:
+            hit_ratio_str = '%.1f%%' % (hit_ratio * 100)
+
+        logger.info('Cache stats for HTTP %s %s: %s hit ratio; %s',
+                    request.method, request.path, hit_ratio_str, totals)
+
+        for key_prefix, stats in sorted(six.iteritems(cache_stats)):
+            logger.info('Cache stats for "%s": %s', key_prefix, stats)
+
     def process_exception(self, request, exception):
         """Handle exceptions raised on a page.
 
@@ -0,0 +1,543 @@
+"""Benchmarks for measuring the cost of rendering datagrids.
+
+This builds synthetic models and datagrids of a given size, and measures
+loading and rendering them under each pagination and sorting mode. For each
+benchmark, the wall time, number of queries, rows rendered per second, and
+peak memory use (on Python 3.4+) are reported.
+
+Benchmarks are normally run through
+:file:`contrib/internal/benchmark-datagrid.py`, but can be run from any
+environment with a configured database:
+
+.. code-block:: python
+
+    from djblets.testing.benchmarks import (format_datagrid_benchmarks,
+                                            run_datagrid_benchmarks)
+
+    results = run_datagrid_benchmarks(num_rows=100000, num_columns=12)
+    print(format_datagrid_benchmarks(results))
+"""
+
+from __future__ import unicode_literals
+
+import itertools
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.color import no_style
+from django.db import connection, models
+from django.http import HttpRequest
+from django.test.utils import CaptureQueriesContext
+from django.utils.six.moves import range
+
+try:
+    # Python >= 3.4
+    import tracemalloc
+except ImportError:
+    # Python < 3.4
+    tracemalloc = None
+
+from djblets.datagrid.counts import UncountedProvider
+from djblets.datagrid.grids import Column, DataGrid
+
+
+#: The app label used for the synthetic benchmark models.
+BENCHMARK_APP_LABEL = 'djblets_datagrid'
+
+
+#: The pagination modes that can be benchmarked.
+#:
+#: Each maps a name to a dictionary of attributes to set on the datagrid and
+#: variables to pass in the URL.
+DATAGRID_BENCHMARK_MODES = {
+    'offset-first': {
+        'attrs': {},
+        'query': {},
+    },
+    'offset-last': {
+        'attrs': {},
+        'query': {
+            'page': 'last',
+        },
+    },
+    'offset-uncounted': {
+        'attrs': {
+            'count_provider': UncountedProvider(),
+        },
+        'query': {},
+    },
+    'keyset-first': {
+        'attrs': {
+            'pagination_mode': DataGrid.PAGINATION_KEYSET,
+        },
+        'query': {},
+    },
+    'keyset-last': {
+        'attrs': {
+            'pagination_mode': DataGrid.PAGINATION_KEYSET,
+        },
+        'query': {
+            'cursor': 'last',
+        },
+    },
+}
+
+
+#: The ways of fetching objects that can be benchmarked.
+#:
+#: Each maps a name to the ``optimize_sorts`` and ``optimize_sorts_strategy``
+#: values for the datagrid.
+DATAGRID_BENCHMARK_FETCHES = {
+    'plain': (False, DataGrid.OPTIMIZE_SORTS_TWO_QUERIES),
+    'subquery': (True, DataGrid.OPTIMIZE_SORTS_SUBQUERY),
+    'two-queries': (True, DataGrid.OPTIMIZE_SORTS_TWO_QUERIES),
+}
+
+
+#: The sort orders that can be benchmarked.
+#:
+#: Each maps a name to the ``?sort=`` variable passed in the URL.
+DATAGRID_BENCHMARK_SORTS = {
+    'unsorted': '',
+    'single': '-col0',
+    'multiple': '-col0,related',
+}
+
+
+_model_ids = itertools.count(1)
+
+
+class DataGridBenchmarkResult(object):
+    """The results of a datagrid benchmark.
+
+    Attributes:
+        mode (unicode):
+            The name of the pagination mode (from
+            :py:data:`DATAGRID_BENCHMARK_MODES`).
+
+        sort (unicode):
+            The name of the sort order (from
+            :py:data:`DATAGRID_BENCHMARK_SORTS`).
+
+        fetch (unicode):
+            The name of the way objects were fetched (from
+            :py:data:`DATAGRID_BENCHMARK_FETCHES`).
+
+        wall_time (float):
+            The fastest time taken to load and render the datagrid, in
+            seconds.
+
+        query_count (int):
+            The number of queries made to load and render the datagrid.
+
+        num_rows (int):
+            The number of rows rendered.
+
+        peak_memory (int):
+            The peak memory allocated while loading and rendering the
+            datagrid, in bytes, or ``None`` if this can't be measured.
+    """
+
+    def __init__(self, mode, sort, fetch, wall_time, query_count, num_rows,
+                 peak_memory):
+        """Initialize the result.
+
+        Args:
+            mode (unicode):
+                The name of the pagination mode.
+
+            sort (unicode):
+                The name of the sort order.
+
+            fetch (unicode):
+                The name of the way objects were fetched.
+
+            wall_time (float):
+                The fastest time taken, in seconds.
+
+            query_count (int):
+                The number of queries made.
+
+            num_rows (int):
+                The number of rows rendered.
+
+            peak_memory (int):
+                The peak memory allocated, in bytes, if known.
+        """
+        self.mode = mode
+        self.sort = sort
+        self.fetch = fetch
+        self.wall_time = wall_time
+        self.query_count = query_count
+        self.num_rows = num_rows
+        self.peak_memory = peak_memory
+
+    @property
+    def rows_per_sec(self):
+        """The number of rows rendered per second."""
+        if self.wall_time > 0:
+            return self.num_rows / self.wall_time
+
+        return 0.0
+
+
+def build_datagrid_benchmark_models(num_columns):
+    """Build synthetic models for benchmarking datagrids.
+
+    This builds a model with ``num_columns`` indexed integer fields (named
+    ``col0``, ``col1``, etc.) and a foreign key (named ``related``) to a
+    second model.
+
+    The models are registered under :py:data:`BENCHMARK_APP_LABEL`. Their
+    tables can be created with :py:func:`create_datagrid_benchmark_tables`.
+    Each call builds models with new names, so that they don't conflict with
+    models built by earlier calls in the same process.
+
+    Args:
+        num_columns (int):
+            The number of integer fields on the model.
+
+    Returns:
+        tuple:
+        A 2-tuple of the model and the related model.
+    """
+    suffix = '%d_%d' % (num_columns, next(_model_ids))
+
+    related_model = type(
+        str('BenchmarkRelated%s' % suffix),
+        (models.Model,),
+        {
+            '__module__': __name__,
+            'Meta': type(str('Meta'), (object,), {
+                'app_label': BENCHMARK_APP_LABEL,
+            }),
+            'name': models.CharField(max_length=64),
+        })
+
+    attrs = {
+        '__module__': __name__,
+        'Meta': type(str('Meta'), (object,), {
+            'app_label': BENCHMARK_APP_LABEL,
+        }),
+        'related': models.ForeignKey(related_model),
+    }
+
+    for i in range(num_columns):
+        attrs['col%d' % i] = models.IntegerField(db_index=True)
+
+    model = type(str('BenchmarkRow%s' % suffix), (models.Model,), attrs)
+
+    return model, related_model
+
+
+def create_datagrid_benchmark_tables(model_classes):
+    """Create the tables for synthetic benchmark models.
+
+    Args:
+        model_classes (list of type):
+            The models to create tables for, in dependency order.
+    """
+    if hasattr(connection, 'schema_editor'):
+        # Django >= 1.7
+        with connection.schema_editor() as schema_editor:
+            for model in model_classes:
+                schema_editor.create_model(model)
+    else:
+        # Django < 1.7
+        style = no_style()
+        cursor = connection.cursor()
+        known_models = set()
+
+        for model in model_classes:
+            sql, references = connection.creation.sql_create_model(
+                model, style, known_models)
+            known_models.add(model)
+
+            for statement in sql:
+                cursor.execute(statement)
+
+            for statement in connection.creation.sql_indexes_for_model(
+                    model, style):
+                cursor.execute(statement)
+
+
+def drop_datagrid_benchmark_tables(model_classes):
+    """Drop the tables for synthetic benchmark models.
+
+    Args:
+        model_classes (list of type):
+            The models to drop tables for, in dependency order.
+    """
+    cursor = connection.cursor()
+
+    for model in reversed(model_classes):
+        cursor.execute('DROP TABLE %s'
+                       % connection.ops.quote_name(model._meta.db_table))
+
+
+def populate_datagrid_benchmark_models(model, related_model, num_rows,
+                                       num_related=100, batch_size=1000):
+    """Populate synthetic benchmark models with rows.
+
+    Values in each column are spread out, and repeat often enough that
+    multi-column sorts need to compare later columns.
+
+    Args:
+        model (type):
+            The model to populate.
+
+        related_model (type):
+            The related model to populate.
+
+        num_rows (int):
+            The number of rows to create.
+
+        num_related (int, optional):
+            The number of related objects to create.
+
+        batch_size (int, optional):
+            The number of rows to create in each query.
+    """
+    related_model.objects.bulk_create(
+        related_model(name='Related %05d' % i)
+        for i in range(num_related)
+    )
+    related_ids = list(related_model.objects.values_list('pk', flat=True))
+
+    num_columns = len([
+        field
+        for field in model._meta.fields
+        if field.name.startswith('col')
+    ])
+
+    for start in range(0, num_rows, batch_size):
+        model.objects.bulk_create([
+            model(related_id=related_ids[i % len(related_ids)],
+                  **dict(
+                      ('col%d' % col, (i * (col + 7)) % (num_rows // 10 + 1))
+                      for col in range(num_columns)
+                  ))
+            for i in range(start, min(start + batch_size, num_rows))
+        ])
+
+
+def build_datagrid_benchmark_class(model, num_columns):
+    """Build a datagrid class for a synthetic benchmark model.
+
+    The datagrid will have a sortable column for each integer field, and a
+    sortable column (named ``related``) showing the related object.
+
+    Args:
+        model (type):
+            The model to display.
+
+        num_columns (int):
+            The number of integer fields on the model.
+
+    Returns:
+        type:
+        The datagrid class.
+    """
+    attrs = {
+        'related': Column('Related', field_name='related', sortable=True),
+    }
+
+    for i in range(num_columns):
+        attrs['col%d' % i] = Column('Column %d' % i, field_name='col%d' % i,
+                                    sortable=True)
+
+    column_ids = ['col%d' % i for i in range(num_columns)] + ['related']
+
+    def __init__(self, request):
+        DataGrid.__init__(self, request, queryset=model.objects.all(),
+                          title='Benchmark')
+        self.default_sort = []
+        self.default_columns = column_ids
+
+    attrs['__init__'] = __init__
+
+    return type(str('%sDataGrid' % model.__name__), (DataGrid,), attrs)
+
+
+def run_datagrid_benchmark(datagrid_cls, mode='offset-first',
+                           sort='unsorted', fetch='subquery', repeat=3):
+    """Benchmark loading and rendering a datagrid.
+
+    This will load the datagrid's state (which precomputes the objects on the
+    page) and render the list view, using the given pagination mode and
+    sort order.
+
+    Args:
+        datagrid_cls (type):
+            The datagrid class to benchmark.
+
+        mode (unicode, optional):
+            The name of the pagination mode, from
+            :py:data:`DATAGRID_BENCHMARK_MODES`.
+
+        sort (unicode, optional):
+            The name of the sort order, from
+            :py:data:`DATAGRID_BENCHMARK_SORTS`.
+
+        fetch (unicode, optional):
+            The name of the way to fetch objects, from
+            :py:data:`DATAGRID_BENCHMARK_FETCHES`.
+
+        repeat (int, optional):
+            The number of times to run the benchmark. The fastest time is
+            reported.
+
+    Returns:
+        DataGridBenchmarkResult:
+        The results of the benchmark.
+    """
+    mode_info = DATAGRID_BENCHMARK_MODES[mode]
+    sort_str = DATAGRID_BENCHMARK_SORTS[sort]
+    optimize_sorts, optimize_sorts_strategy = DATAGRID_BENCHMARK_FETCHES[fetch]
+
+    def _build_datagrid():
+        request = HttpRequest()
+        request.user = AnonymousUser()
+        request.GET.update(mode_info['query'])
+
+        if sort_str:
+            request.GET['sort'] = sort_str
+
+        datagrid = datagrid_cls(request)
+        datagrid.optimize_sorts = optimize_sorts
+        datagrid.optimize_sorts_strategy = optimize_sorts_strategy
+
+        for attr, value in mode_info['attrs'].items():
+            setattr(datagrid, attr, value)
+
+        return datagrid
+
+    def _run(datagrid):
+        datagrid.load_state()
+        datagrid.render_listview()
+
+    wall_time = None
+    query_count = None
+    num_rows = 0
+
+    for i in range(repeat):
+        datagrid = _build_datagrid()
+
+        with CaptureQueriesContext(connection) as queries:
+            start_time = time.time()
+            _run(datagrid)
+            elapsed = time.time() - start_time
+
+        if wall_time is None or elapsed < wall_time:
+            wall_time = elapsed
+
+        query_count = len(queries)
+        num_rows = len(datagrid.rows)
+
+    if tracemalloc is not None:
+        # Memory is measured in a separate run, since tracing slows down
+        # allocations.
+        datagrid = _build_datagrid()
+        tracemalloc.start()
+
+        try:
+            _run(datagrid)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    else:
+        peak_memory = None
+
+    return DataGridBenchmarkResult(mode=mode,
+                                   sort=sort,
+                                   fetch=fetch,
+                                   wall_time=wall_time,
+                                   query_count=query_count,
+                                   num_rows=num_rows,
+                                   peak_memory=peak_memory)
+
+
+def run_datagrid_benchmarks(num_rows=10000, num_columns=10, modes=None,
+                            sorts=None, repeat=3):
+    """Run datagrid benchmarks across pagination modes and sort orders.
+
+    Synthetic models are built and populated for the benchmarks, and their
+    tables are dropped afterward. Each combination of mode and sort order is
+    benchmarked with each way of fetching objects.
+
+    Args:
+        num_rows (int, optional):
+            The number of rows in the datagrid's queryset.
+
+        num_columns (int, optional):
+            The number of integer columns on the datagrid. A column showing
+            a related object is also included.
+
+        modes (list of unicode, optional):
+            The names of the pagination modes to benchmark. This defaults
+            to all modes in :py:data:`DATAGRID_BENCHMARK_MODES`.
+
+        sorts (list of unicode, optional):
+            The names of the sort orders to benchmark. This defaults to all
+            sort orders in :py:data:`DATAGRID_BENCHMARK_SORTS`.
+
+        repeat (int, optional):
+            The number of times to run each benchmark.
+
+    Returns:
+        list of DataGridBenchmarkResult:
+        The results of each benchmark.
+    """
+    model, related_model = build_datagrid_benchmark_models(num_columns)
+    model_classes = [related_model, model]
+
+    create_datagrid_benchmark_tables(model_classes)
+
+    try:
+        populate_datagrid_benchmark_models(model, related_model, num_rows)
+        datagrid_cls = build_datagrid_benchmark_class(model, num_columns)
+
+        return [
+            run_datagrid_benchmark(datagrid_cls,
+                                   mode=mode,
+                                   sort=sort,
+                                   fetch=fetch,
+                                   repeat=repeat)
+            for mode in (modes or sorted(DATAGRID_BENCHMARK_MODES))
+            for sort in (sorts or sorted(DATAGRID_BENCHMARK_SORTS))
+            for fetch in sorted(DATAGRID_BENCHMARK_FETCHES)
+        ]
+    finally:
+        drop_datagrid_benchmark_tables(model_classes)
+
+
+def format_datagrid_benchmarks(results):
+    """Format the results of datagrid benchmarks as a table.
+
+    Args:
+        results (list of DataGridBenchmarkResult):
+            The results to format.
+
+    Returns:
+        unicode:
+        The formatted table.
+    """
+    lines = [
+        '%-18s %-10s %-12s %10s %8s %11s %11s'
+        % ('Mode', 'Sort', 'Fetch', 'Time (ms)', 'Queries', 'Rows/sec',
+           'Peak (KiB)'),
+    ]
+
+    for result in results:
+        if result.peak_memory is None:
+            peak_memory = '-'
+        else:
+            peak_memory = '%d' % (result.peak_memory // 1024)
+
+        lines.append(
+            '%-18s %-10s %-12s %10.2f %8d %11.0f %11s'
+            % (result.mode, result.sort, result.fetch,
+               result.wall_time * 1000, result.query_count,
+               result.rows_per_sec, peak_memory))
+
+    return '\n'.join(lines)
@@ -10,6 +10,7 @@ from django.conf.urls import include, url
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import reverse
 from django.db import models
+from django.db.models.fields import FieldDoesNotExist
 from django.db.models.query import QuerySet
 from django.http import (HttpResponseNotAllowed, HttpResponse,
                          HttpResponseNotModified)
@@ -30,6 +31,7 @@ from djblets.urls.patterns import never_cache_patterns
 from djblets.webapi.auth.backends import check_login
 from djblets.webapi.resources.registry import (get_resource_for_object,
                                                _class_to_resources,
+                                               _model_to_resources,
                                                _name_to_resources)
 from djblets.webapi.responses import (WebAPIResponse,
                                       WebAPIResponseError,
@@ -111,6 +113,16 @@ class WebAPIResource(object):
     #: The class to use for paginated results in get_list.
     paginated_cls = WebAPIResponsePaginated
 
+    #: Whether to defer loading model fields excluded by ``?only-fields=``.
+    #:
+    #: This applies when fetching lists of objects, and is off by default.
+    #: Resources should only enable this if nothing used to serialize their
+    #: objects (such as ``serialize_*_field`` methods, :py:meth:`get_href`,
+    #: or :py:meth:`get_object_title`) depends on other fields in
+    #: :py:attr:`fields`, since each deferred field that's accessed will
+    #: cost a query per object.
+    defer_unrequested_fields = False
+
     # State
     method_mapping = {
         'GET': 'get',
@@ -813,12 +825,7 @@ class WebAPIResource(object):
             links = self.get_links(self.item_child_resources, obj,
                                    *args, **kwargs)
 
-        if hasattr(request, '_djblets_webapi_expanded_resources'):
-            expanded_resources = request._djblets_webapi_expanded_resources
-        else:
-            expand = request.GET.get('expand', request.POST.get('expand', ''))
-            expanded_resources = expand.split(',')
-            request._djblets_webapi_expanded_resources = expanded_resources
+        expanded_resources = self._get_expanded_resources(request)
 
         # Make a copy of the list of expanded resources. We'll be temporarily
         # removing items as we recurse down into any nested objects, to
@@ -827,8 +834,7 @@ class WebAPIResource(object):
         # be affected.
         orig_expanded_resources = list(expanded_resources)
 
-        for field in six.iterkeys(self.fields):
-            can_include_field = only_fields is None or field in only_fields
+        for field, can_include_field in self._get_serialized_fields(request):
             expand_field = field in expanded_resources
 
             # If we're limiting fields and this one isn't explicitly included,
@@ -1326,6 +1332,121 @@ class WebAPIResource(object):
         """
         queryset = self.get_queryset(request, is_list=is_list, *args, **kwargs)
 
+        if is_list:
+            select_related_fields, prefetch_related_fields, deferred_fields = \
+                self._get_list_queryset_lookups(request)
+        else:
+            # Items may be fetched for reasons other than serializing them
+            # (such as permission checks for child resources), so they're
+            # always loaded in full.
+            select_related_fields = self._get_select_related_fields()
+            prefetch_related_fields = []
+            deferred_fields = []
+
+        if select_related_fields:
+            queryset = queryset.select_related(*select_related_fields)
+
+        if prefetch_related_fields:
+            queryset = queryset.prefetch_related(*prefetch_related_fields)
+
+        if deferred_fields:
+            queryset = queryset.defer(*deferred_fields)
+
+        return queryset
+
+    def _get_list_queryset_lookups(self, request, expand=True):
+        """Return the lookups used to optimize a list of objects.
+
+        The lookups only cover fields that may be serialized for the request,
+        taking ``?only-fields=`` and ``?only-links=`` into account. If
+        :py:attr:`defer_unrequested_fields` is enabled, any fields excluded
+        by ``?only-fields=`` that are plain columns on the model are
+        deferred.
+
+        If ``expand`` is set, fields in ``?expand=`` that refer to other
+        resources will also have the related objects needed to serialize
+        those resources fetched in batches.
+
+        Args:
+            request (django.http.HttpRequest):
+                The HTTP request from the client.
+
+            expand (bool, optional):
+                Whether to include lookups for expanded fields.
+
+        Returns:
+            tuple:
+            A 3-tuple containing the lists of fields to pass to
+            ``select_related()``, ``prefetch_related()``, and ``defer()``.
+        """
+        serialized_fields = dict(self._get_serialized_fields(request))
+
+        select_related_fields = [
+            field
+            for field in self._get_select_related_fields()
+            if field in serialized_fields
+        ]
+
+        # Many-to-many relations can't be linked to, so they're only
+        # needed if they'll be included in the payload.
+        prefetch_related_fields = [
+            field
+            for field in self._get_prefetch_related_fields()
+            if serialized_fields.get(field)
+        ]
+
+        if self.defer_unrequested_fields:
+            deferred_fields = [
+                field
+                for field in self._get_deferrable_fields()
+                if not serialized_fields.get(field)
+            ]
+        else:
+            deferred_fields = []
+
+        if expand:
+            expanded_resources = self._get_expanded_resources(request)
+
+            for field in select_related_fields + prefetch_related_fields:
+                if (field not in expanded_resources or
+                    not serialized_fields[field]):
+                    continue
+
+                resource = _model_to_resources.get(
+                    self._get_related_model(field))
+
+                if (not isinstance(resource, WebAPIResource) or
+                    not resource.model):
+                    continue
+
+                nested_select_related, nested_prefetch_related = \
+                    resource._get_list_queryset_lookups(request,
+                                                        expand=False)[:2]
+
+                if field in select_related_fields:
+                    select_related_fields += [
+                        '%s__%s' % (field, nested_field)
+                        for nested_field in nested_select_related
+                    ]
+                else:
+                    nested_prefetch_related = \
+                        nested_select_related + nested_prefetch_related
+
+                prefetch_related_fields += [
+                    '%s__%s' % (field, nested_field)
+                    for nested_field in nested_prefetch_related
+                ]
+
+        return select_related_fields, prefetch_related_fields, deferred_fields
+
+    def _get_select_related_fields(self):
+        """Return the fields on the model that can use select_related().
+
+        Returns:
+            list of unicode:
+            The names of the forward foreign key fields in :py:attr:`fields`
+            that don't have custom serialization.
+        """
         if not hasattr(self, '_select_related_fields'):
             self._select_related_fields = []
 
@@ -1338,28 +1459,165 @@ class WebAPIResource(object):
                 if field_type and isinstance(field_type, fkey_descriptors):
                     self._select_related_fields.append(field)
 
-        if self._select_related_fields:
-            queryset = \
-                queryset.select_related(*self._select_related_fields)
+        return self._select_related_fields
 
-        if is_list:
-            if not hasattr(self, '_prefetch_related_fields'):
-                self._prefetch_related_fields = []
+    def _get_prefetch_related_fields(self):
+        """Return the fields on the model that can use prefetch_related().
 
-                for field in six.iterkeys(self.fields):
-                    if hasattr(self, 'serialize_%s_field' % field):
-                        continue
+        Returns:
+            list of unicode:
+            The names of the many-to-many fields in :py:attr:`fields` that
+            don't have custom serialization.
+        """
+        if not hasattr(self, '_prefetch_related_fields'):
+            self._prefetch_related_fields = []
 
-                    field_type = getattr(self.model, field, None)
+            for field in six.iterkeys(self.fields):
+                if hasattr(self, 'serialize_%s_field' % field):
+                    continue
 
-                    if field_type and isinstance(field_type, m2m_descriptors):
-                        self._prefetch_related_fields.append(field)
+                field_type = getattr(self.model, field, None)
 
-            if self._prefetch_related_fields:
-                queryset = \
-                    queryset.prefetch_related(*self._prefetch_related_fields)
+                if field_type and isinstance(field_type, m2m_descriptors):
+                    self._prefetch_related_fields.append(field)
 
-        return queryset
+        return self._prefetch_related_fields
+
+    def _get_deferrable_fields(self):
+        """Return the fields on the model that can be deferred.
+
+        Only plain columns are deferred. Relations are left alone, since
+        deferring a relation that :py:meth:`get_queryset` passes to
+        ``select_related()`` is an error. Fields used to look up objects,
+        build URLs, or compute cache headers are never deferred.
+
+        Returns:
+            list of unicode:
+            The names of the deferrable model fields in :py:attr:`fields`
+            that don't have custom serialization.
+        """
+        if not hasattr(self, '_deferrable_fields'):
+            self._deferrable_fields = []
+
+            required_fields = set(
+                key.split('__')[0]
+                for key in (self.model_object_key, self.model_parent_key,
+                            self.last_modified_field, self.etag_field)
+                if key
+            )
+
+            for field in six.iterkeys(self.fields):
+                if (field in required_fields or
+                    hasattr(self, 'serialize_%s_field' % field)):
+                    continue
+
+                try:
+                    model_field = self.model._meta.get_field(field)
+                except FieldDoesNotExist:
+                    continue
+
+                if hasattr(model_field, 'is_relation'):
+                    # Django >= 1.8
+                    is_column = (model_field.concrete and
+                                 not model_field.is_relation)
+                else:
+                    # Django < 1.8
+                    is_column = model_field.rel is None
+
+                if is_column and not model_field.primary_key:
+                    self._deferrable_fields.append(field)
+
+        return self._deferrable_fields
+
+    def _get_related_model(self, field):
+        """Return the model on the other side of a relation field.
+
+        Args:
+            field (unicode):
+                The name of the relation field on :py:attr:`model`.
+
+        Returns:
+            type:
+            The related model, or ``None`` if it couldn't be determined.
+        """
+        try:
+            model_field = self.model._meta.get_field(field)
+        except FieldDoesNotExist:
+            return None
+
+        if hasattr(model_field, 'related_model'):
+            # Django >= 1.8
+            return model_field.related_model
+        else:
+            # Django < 1.8
+            return model_field.rel.to
+
+    def _get_expanded_resources(self, request):
+        """Return the names of the resources to expand for a request.
+
+        The list is stored on the request, and entries are temporarily
+        removed from it while serializing nested objects.
+
+        Args:
+            request (django.http.HttpRequest):
+                The HTTP request from the client.
+
+        Returns:
+            list of unicode:
+            The names of the fields and resources to expand.
+        """
+        if request is None:
+            return []
+
+        if not hasattr(request, '_djblets_webapi_expanded_resources'):
+            expand = request.GET.get('expand', request.POST.get('expand', ''))
+            request._djblets_webapi_expanded_resources = expand.split(',')
+
+        return request._djblets_webapi_expanded_resources
+
+    def _get_serialized_fields(self, request):
+        """Return the fields that may be serialized for a request.
+
+        This skips any fields that are excluded by ``?only-fields=`` and
+        can't appear in the links allowed by ``?only-links=``, so that they
+        aren't computed for every object. The result is cached on the
+        request.
+
+        Args:
+            request (django.http.HttpRequest):
+                The HTTP request from the client.
+
+        Returns:
+            list of tuple:
+            A list of ``(field, can_include_field)`` tuples, where
+            ``can_include_field`` indicates whether the field can be included
+            in the payload, rather than only as a link.
+        """
+        if request is not None:
+            try:
+                return request._djblets_webapi_serialized_fields[id(self)]
+            except AttributeError:
+                request._djblets_webapi_serialized_fields = {}
+            except KeyError:
+                pass
+
+        only_fields = self.get_only_fields(request)
+        only_links = self.get_only_links(request)
+        serialized_fields = []
+
+        for field in six.iterkeys(self.fields):
+            can_include_field = only_fields is None or field in only_fields
+
+            if (can_include_field or
+                only_links is None or
+                field in only_links):
+                serialized_fields.append((field, can_include_field))
+
+        if request is not None:
+            request._djblets_webapi_serialized_fields[id(self)] = \
+                serialized_fields
+
+        return serialized_fields
 
     def _clone_serialized_object(self, obj):
         """Clone a serialized object, for storing in the cache.
@@ -3,7 +3,8 @@ from __future__ import print_function, unicode_literals
 import json
 import warnings
 
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, Permission, User
+from django.contrib.contenttypes.models import ContentType
 from django.db.models import Model
 from django.http import HttpResponseNotModified
 from django.test.client import RequestFactory
@@ -628,6 +629,270 @@ class WebAPIResourceTests(TestCase):
         data = resource.serialize_object(obj, request=request)
         self.assertIn('my_field', data)
 
+    def test_serialize_object_with_only_fields_skips_unused(self):
+        """Testing WebAPIResource.serialize_object with ?only-fields= and
+        ?only-links= doesn't compute excluded fields
+        """
+        class TestObject(object):
+            field1 = 'abc'
+
+        class TestResource(WebAPIResource):
+            fields = {
+                'field1': {
+                    'type': StringFieldType,
+                },
+                'field2': {
+                    'type': StringFieldType,
+                },
+            }
+
+            def serialize_field2_field(self, obj, **kwargs):
+                raise AssertionError('field2 should not be serialized')
+
+        request = RequestFactory().get(
+            '/api/test/?only-fields=field1&only-links=self')
+        resource = TestResource()
+        data = resource.serialize_object(TestObject(), request=request)
+
+        self.assertEqual(data, {
+            'field1': 'abc',
+            'links': {
+                'self': {
+                    'href': 'http://testserver/api/test/'
+                            '?only-fields=field1&only-links=self',
+                    'method': 'GET',
+                },
+            },
+        })
+
+    def test_get_queryset_for_list(self):
+        """Testing WebAPIResource._get_queryset for lists"""
+        class TestResource(WebAPIResource):
+            model = User
+            fields = {
+                'username': {
+                    'type': StringFieldType,
+                },
+                'email': {
+                    'type': StringFieldType,
+                },
+                'groups': {
+                    'type': [Group],
+                },
+            }
+
+        self.test_resource = TestResource()
+
+        request = RequestFactory().get('/api/users/')
+        queryset = self.test_resource._get_queryset(request, is_list=True)
+
+        self.assertEqual(list(queryset._prefetch_related_lookups),
+                         ['groups'])
+        self.assertEqual(queryset.query.deferred_loading[0], set())
+
+    def test_get_queryset_for_list_with_only_fields(self):
+        """Testing WebAPIResource._get_queryset for lists with
+        ?only-fields=
+        """
+        class TestResource(WebAPIResource):
+            model = User
+            defer_unrequested_fields = True
+            fields = {
+                'username': {
+                    'type': StringFieldType,
+                },
+                'first_name': {
+                    'type': StringFieldType,
+                },
+                'email': {
+                    'type': StringFieldType,
+                },
+                'groups': {
+                    'type': [Group],
+                },
+            }
+
+        self.test_resource = TestResource()
+
+        request = RequestFactory().get('/api/users/?only-fields=username')
+        queryset = self.test_resource._get_queryset(request, is_list=True)
+
+        self.assertEqual(list(queryset._prefetch_related_lookups), [])
+        self.assertEqual(queryset.query.deferred_loading,
+                         ({'first_name', 'email'}, True))
+
+    def test_get_queryset_for_list_with_defer_disabled(self):
+        """Testing WebAPIResource._get_queryset for lists with
+        ?only-fields= and defer_unrequested_fields disabled by default
+        """
+        class TestResource(WebAPIResource):
+            model = User
+            fields = {
+                'username': {
+                    'type': StringFieldType,
+                },
+                'email': {
+                    'type': StringFieldType,
+                },
+            }
+
+        self.test_resource = TestResource()
+
+        request = RequestFactory().get('/api/users/?only-fields=username')
+        queryset = self.test_resource._get_queryset(request, is_list=True)
+
+        self.assertEqual(queryset.query.deferred_loading[0], set())
+
+    def test_get_queryset_for_item_with_only_fields(self):
+        """Testing WebAPIResource._get_queryset for items with ?only-fields=
+        loads all fields
+        """
+        class TestResource(WebAPIResource):
+            model = User
+            fields = {
+                'username': {
+                    'type': StringFieldType,
+                },
+                'email': {
+                    'type': StringFieldType,
+                },
+            }
+
+        self.test_resource = TestResource()
+
+        request = RequestFactory().get('/api/users/1/?only-fields=username')
+        queryset = self.test_resource._get_queryset(request)
+
+        self.assertEqual(queryset.query.deferred_loading[0], set())
+
+    def test_get_queryset_for_list_with_expand(self):
+        """Testing WebAPIResource._get_queryset for lists with ?expand=
+        prefetches related objects for the expanded resources
+        """
+        class PermissionResource(WebAPIResource):
+            model = Permission
+            fields = {
+                'name': {
+                    'type': StringFieldType,
+                },
+                'content_type': {
+                    'type': ContentType,
+                },
+            }
+
+        class TestResource(WebAPIResource):
+            model = User
+            fields = {
+                'username': {
+                    'type': StringFieldType,
+                },
+                'user_permissions': {
+                    'type': [Permission],
+                },
+            }
+
+        self.test_resource = TestResource()
+        permission_resource = PermissionResource()
+        register_resource_for_model(Permission, permission_resource)
+
+        try:
+            request = RequestFactory().get(
+                '/api/users/?expand=user_permissions')
+            queryset = self.test_resource._get_queryset(request,
+                                                        is_list=True)
+
+            self.assertEqual(list(queryset._prefetch_related_lookups),
+                             ['user_permissions',
+                              'user_permissions__content_type'])
+        finally:
+            unregister_resource_for_model(Permission)
+            unregister_resource(permission_resource)
+
+    def test_get_list_with_only_fields_and_expand(self):
+        """Testing WebAPIResource.get_list with ?only-fields= and ?expand=
+        and defer_unrequested_fields = True
+        """
+        class PermissionResource(WebAPIResource):
+            model = Permission
+            fields = {
+                'name': {
+                    'type': StringFieldType,
+                },
+                'codename': {
+                    'type': StringFieldType,
+                },
+            }
+
+        class TestResource(WebAPIResource):
+            model = User
+            defer_unrequested_fields = True
+            fields = {
+                'username': {
+                    'type': StringFieldType,
+                },
+                'first_name': {
+                    'type': StringFieldType,
+                },
+                'email': {
+                    'type': StringFieldType,
+                },
+                'user_permissions': {
+                    'type': [Permission],
+                },
+            }
+
+            def get_queryset(self, request, *args, **kwargs):
+                return User.objects.order_by('pk')
+
+        content_type = ContentType.objects.get_for_model(Group)
+        permission1 = Permission.objects.create(codename='test_perm1',
+                                                name='Test 1',
+                                                content_type=content_type)
+        permission2 = Permission.objects.create(codename='test_perm2',
+                                                name='Test 2',
+                                                content_type=content_type)
+
+        user1 = User.objects.create(username='user1', first_name='User',
+                                    email='user1@example.com')
+        user1.user_permissions.add(permission1, permission2)
+        User.objects.create(username='user2', first_name='User',
+                            email='user2@example.com')
+
+        self.test_resource = TestResource()
+        permission_resource = PermissionResource()
+        register_resource_for_model(Permission, permission_resource)
+
+        try:
+            request = RequestFactory().get(
+                '/api/users/?only-fields=username,user_permissions,codename'
+                '&only-links=&expand=user_permissions')
+
+            # This includes the count query, the query for the users, and
+            # the query for their permissions. No deferred fields are
+            # loaded.
+            with self.assertNumQueries(3):
+                response = self.test_resource(request)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.api_data[self.test_resource.list_result_key],
+                [
+                    {
+                        'username': 'user1',
+                        'user_permissions': [
+                            {'codename': 'test_perm1'},
+                            {'codename': 'test_perm2'},
+                        ],
+                    },
+                    {
+                        'username': 'user2',
+                        'user_permissions': [],
+                    },
+                ])
+        finally:
+            unregister_resource_for_model(Permission)
+            unregister_resource(permission_resource)
+
     def _test_mimetype_responses(self, resource, url, json_mimetype,
                                  xml_mimetype, **kwargs):
         self._test_mimetype_response(resource, url, '*/*', json_mimetype,